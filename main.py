@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 import warnings
 import sys
@@ -12,6 +13,9 @@ warnings.filterwarnings("ignore")
 QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling, True)
 
 if __name__ == "__main__":
+    # DVH worker processes are started by re-running the executable in
+    # frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
 
     # On some configurations error traceback is not being displayed
     #     when the program crashes. This is a workaround.
@@ -449,6 +449,9 @@ class AddOnOptions(QtWidgets.QMainWindow, UIAddOnOptions):
                     clinical_data_csv_dir_input_box.text()
             configuration.update_clinical_data_csv_dir(
                 new_clinical_data_csv_dir)
+            use_dicomdir = self.change_default_directory. \
+                use_dicomdir_checkbox.isChecked()
+            configuration.update_use_dicomdir(use_dicomdir)
         except SqlError:
             configuration.set_up_config_db()
             QMessageBox.critical(
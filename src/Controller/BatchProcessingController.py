@@ -2,6 +2,7 @@ import datetime
 import threading
 from PySide6.QtCore import QThreadPool
 from src.Model.DICOM import DICOMDirectorySearch
+from src.Model.DICOM.DICOMHeaderIndex import DICOMHeaderIndex
 from src.Model.batchprocessing.BatchProcessClinicalDataSR2CSV import \
     BatchProcessClinicalDataSR2CSV
 from src.Model.batchprocessing.BatchProcessCSV2ClinicalDataSR import \
@@ -86,6 +87,9 @@ class BatchProcessingController:
         # Threadpool for file loading
         self.threadpool = QThreadPool()
         self.interrupt_flag = threading.Event()
+        # Index of previously searched files, so rescans only read new or
+        # changed files
+        self.header_index = DICOMHeaderIndex()
 
     def set_file_paths(self, file_paths):
         """
@@ -147,10 +151,13 @@ class BatchProcessingController:
         self.interrupt_flag.clear()
 
         # Create new worker
+        use_dicomdir = DICOMDirectorySearch.get_use_dicomdir()
         worker = Worker(DICOMDirectorySearch.get_dicom_structure,
                         path,
                         self.interrupt_flag,
-                        progress_callback=True)
+                        progress_callback=True,
+                        header_index=self.header_index,
+                        use_dicomdir=use_dicomdir)
 
         # Connect callbacks
         worker.signals.result.connect(search_complete_callback)
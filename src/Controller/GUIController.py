@@ -4,7 +4,7 @@ from PySide6 import QtCore, QtWidgets, QtGui
 from PySide6.QtWidgets import QMessageBox
 
 from src.Controller.PathHandler import resource_path
-from src.Model.InitialModel import create_initial_model
+from src.Model.InitialModel import create_initial_model, set_pixel_values
 from src.Model.MovingDictContainer import MovingDictContainer
 from src.Model.MovingModel import read_images_for_fusion
 from src.Model.PatientDictContainer import PatientDictContainer
@@ -172,6 +172,7 @@ class MainWindow(QtWidgets.QMainWindow, UIMainWindow):
         create_initial_model()
         self.setup_central_widget()
         self.setup_actions()
+        self.loading_toggle_roi_tools()
         self.add_on_options_controller.update_ui()
 
         self.action_handler.action_open.triggered.connect(
@@ -182,6 +183,22 @@ class MainWindow(QtWidgets.QMainWindow, UIMainWindow):
 
         self.pet_ct_tab.load_pt_ct_signal.connect(self.initialise_pt_ct)
 
+    def update_loaded_stage(self, values):
+        """
+        Updates the main window with the results of a stage of loading
+        the patient that finished after the window was created.
+        :param values: Dictionary of the results of the stage, which are
+            already in the PatientDictContainer.
+        """
+        patient_dict_container = PatientDictContainer()
+        if "pixel_values" in values:
+            set_pixel_values(values["pixel_values"])
+        if "raw_contour" in values or "pixluts" in values:
+            for roi_id in patient_dict_container.get("selected_rois"):
+                self.structures_tab.update_dict_polygons(True, roi_id)
+        self.update_views(update_3d_window="pixel_values" in values)
+        self.loading_toggle_roi_tools()
+
     def initialise_pt_ct(self):
         self.pt_ct_signal.emit()
 
@@ -102,6 +102,10 @@ class Controller:
         else:
             self.main_window.update_ui()
 
+        # The image volume, pixel LUTs and contours may still be loading
+        progress_window.signal_stage_loaded.connect(
+            self.main_window.update_loaded_stage)
+
         if isinstance(self.image_fusion_window, ImageFusionWindow):
             progress_window.update_progress(
                 ("Registering Images...\nThis may take a few minutes.", 
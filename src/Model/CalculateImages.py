@@ -1,3 +1,10 @@
+import threading
+from abc import abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from collections.abc import Mapping
+from numbers import Integral
+
 import cv2
 import numpy as np
 import pydicom
@@ -8,33 +15,121 @@ import src.constants as constant
 
 def convert_raw_data(ds, rescaled=True, is_ct=False):
     """
-    Convert the raw pixel data to readable pixel data in every image dataset
+    Convert the raw pixel data of every image dataset into a single
+    preallocated volume (slices x rows x columns). Each dataset's pixel
+    array is replaced with a view of its slice of the volume, so the pixel
+    data is shared rather than copied.
     :param ds: A dictionary of datasets of all the DICOM files of the patient
     :param rescaled: A boolean to determine if the data has already
     been rescaled
     :param is_ct: Boolean to determine if data is CT for rescaling
-    :return: np_pixels, a list of pixel arrays of all slices of the patient
+    :return: np_pixels, a 3D numpy array of the pixel values of all slices
+    of the patient
     """
-    non_img_list = ['rtss', 'rtdose', 'rtplan', 'rtimage']
-    np_pixels = []
+    image_keys = get_image_keys(ds)
+    if not image_keys:
+        return np.empty((0, 0, 0))
+
+    # Do the conversion to every slice (except RTSS, RTDOSE, RTPLAN).
+    # The decoded slice is dropped as soon as it is copied into the
+    # volume, so at most one extra slice is held in memory.
+    np_pixels = None
+    for i, key in enumerate(image_keys):
+        # dataset of current slice
+        np_tmp = ds[key]
+        np_tmp.convert_pixel_data()
+        if np_pixels is None:
+            np_pixels = np.empty(
+                (len(image_keys),) + np_tmp._pixel_array.shape,
+                dtype=np_tmp._pixel_array.dtype)
+        np_pixels[i] = np_tmp._pixel_array
+        np_tmp._pixel_array = np_pixels[i]
+
+    if not rescaled:
+        # Perform the rescale
+        rescales = [get_rescale(ds[key], is_ct) for key in image_keys]
+        np_pixels = rescale_volume(np_pixels, rescales)
+        # Store the rescaled data
+        for i, key in enumerate(image_keys):
+            ds[key]._pixel_array = np_pixels[i]
+
+    return np_pixels
+
+
+def convert_first_slice(ds, is_ct=False):
+    """
+    Convert the raw pixel data of the first image dataset only, into a
+    volume of the same size as the one convert_raw_data returns. The other
+    slices are blank, and their memory is not used until they are written
+    to, so the volume can be displayed while the slices are decoded.
+    :param ds: A dictionary of datasets of all the DICOM files of the patient
+    :param is_ct: Boolean to determine if data is CT for rescaling
+    :return: np_pixels, a 3D numpy array of the rescaled pixel values of the
+    first slice, followed by blank slices
+    """
+    image_keys = get_image_keys(ds)
+    if not image_keys:
+        return np.empty((0, 0, 0))
+
+    first_slice = ds[image_keys[0]]
+    first_slice.convert_pixel_data()
+    np_first = rescale_volume(first_slice._pixel_array[np.newaxis].copy(),
+                              [get_rescale(first_slice, is_ct)])
+    np_pixels = np.zeros((len(image_keys),) + np_first.shape[1:],
+                         dtype=np_first.dtype)
+    np_pixels[0] = np_first[0]
+    return np_pixels
+
 
-    # Do the conversion to every slice (except RTSS, RTDOSE, RTPLAN)
+def get_image_keys(ds):
+    """
+    :param ds: A dictionary of datasets of all the DICOM files of the patient
+    :return: the keys of the image datasets (not RTSS, RTDOSE, RTPLAN, RT
+    Image or SR), in order
+    """
+    non_img_list = ['rtss', 'rtdose', 'rtplan', 'rtimage']
+    image_keys = []
     for key in ds:
         if key not in non_img_list:
             if isinstance(key, str) and key[0:3] == 'sr-':
                 continue
-            else:
-                # dataset of current slice
-                np_tmp = ds[key]
-                np_tmp.convert_pixel_data()
-                if not rescaled:
-                    # Perform the rescale
-                    data_arr = np_tmp._pixel_array
-                    slope, intercept = get_rescale(np_tmp, is_ct)
-                    data_arr = (data_arr * slope + intercept)
-                    # Store the rescaled data
-                    ds[key]._pixel_array = data_arr
-                np_pixels.append(np_tmp._pixel_array)
+            image_keys.append(key)
+    return image_keys
+
+
+def rescale_volume(np_pixels, rescales):
+    """
+    Applies each slice's rescale slope and intercept to a volume in one
+    vectorised pass. The result is int16 when the slopes are whole numbers
+    and the rescaled values fit, and float32 otherwise.
+    :param np_pixels: 3D numpy array of raw pixel values
+    :param rescales: List of (slope, intercept) tuples, one per slice
+    :return: the rescaled volume. This is np_pixels itself when its dtype
+    did not need to change.
+    """
+    slopes = np.array([float(slope) for slope, _ in rescales])
+    intercepts = np.array([float(intercept) for _, intercept in rescales])
+    slopes = slopes.reshape(-1, 1, 1)
+    intercepts = intercepts.reshape(-1, 1, 1)
+
+    if np.all(slopes == np.round(slopes)):
+        raw_range = np.array([np.amin(np_pixels), np.amax(np_pixels)],
+                             dtype=np.float64)
+        scaled_range = raw_range * slopes
+        rescaled_range = scaled_range + intercepts
+        low = min(np.amin(scaled_range), np.amin(rescaled_range))
+        high = max(np.amax(scaled_range), np.amax(rescaled_range))
+        int16_info = np.iinfo(np.int16)
+        if int16_info.min <= low and high <= int16_info.max:
+            dtype = np.int16
+        else:
+            dtype = np.int32
+    else:
+        dtype = np.float32
+
+    np_pixels = np_pixels.astype(dtype, copy=False)
+    np_pixels *= slopes.astype(dtype)
+    np_pixels += intercepts.astype(dtype)
     return np_pixels
 
 
@@ -89,12 +184,80 @@ def get_img(pixel_array):
     return dict_img
 
 
+def window_level_lut(dtype, window, level):
+    """
+    Get the lookup table that maps every value of a 8 or 16 bit integer
+    type to its windowed display value.
+
+    :param dtype: The numpy integer type of the pixel values
+    :param window: Window width of windowing function
+    :param level: Level value of windowing function
+    :return: lut, a uint8 array indexed by the pixel values viewed as the
+    unsigned type of the same size
+    """
+    return _window_level_lut(np.dtype(dtype).str, float(window), float(level))
+
+
+@lru_cache(maxsize=32)
+def _window_level_lut(dtype, window, level):
+    dtype = np.dtype(dtype)
+    unsigned = np.dtype(dtype.str.replace('i', 'u'))
+    values = np.arange(np.iinfo(unsigned).max + 1, dtype=unsigned)
+    lut = window_level(values.view(dtype), window, level)
+    lut.flags.writeable = False
+    return lut
+
+
+def window_level(np_pixels, window, level):
+    """
+    Applies the windowing function to pixel values.
+
+    :param np_pixels: An array of converted pixel values
+    :param window: Window width of windowing function
+    :param level: Level value of windowing function
+    :return: an array of uint8 display values of the same shape
+    """
+    np_pixels = (np_pixels.astype(np.float32) - level) / window * 255
+    np.clip(np_pixels, 0, 255, out=np_pixels)
+    return np_pixels.astype(np.uint8)
+
+
+def apply_window_level(np_pixels, window, level):
+    """
+    Converts pixel values to 8 bit display values. 8 and 16 bit integer
+    pixels are converted with a single lookup in a precomputed table, other
+    types are converted arithmetically. When the window or level is 0, the
+    full range of the pixel values is displayed.
+
+    :param np_pixels: An array of converted pixel values, of a slice or a
+    volume
+    :param window: Window width of windowing function
+    :param level: Level value of windowing function
+    :return: an array of uint8 display values of the same shape
+    """
+    np_pixels = np.asarray(np_pixels)
+    if window == 0 or level == 0:
+        if np_pixels.size == 0:
+            return np.zeros(np_pixels.shape, dtype=np.uint8)
+        min_val = float(np.amin(np_pixels))
+        max_val = float(np.amax(np_pixels))
+        window = (max_val - min_val) or 1
+        level = min_val
+
+    if np_pixels.dtype.kind in 'iu' and np_pixels.dtype.itemsize <= 2:
+        lut = window_level_lut(np_pixels.dtype, window, level)
+        unsigned = np.dtype(np_pixels.dtype.str.replace('i', 'u'))
+        return np.take(lut, np_pixels.view(unsigned))
+
+    return window_level(np_pixels, window, level)
+
+
 def scaled_pixmap(np_pixels, window, level, width, height,
                   fusion=False, color=None):
     """
     Rescale the numpy pixels of image and convert to QPixmap for display.
 
-    :param np_pixels: A list of converted pixel arrays
+    :param np_pixels: A 2D array of converted pixel values
     :param window: Window width of windowing function
     :param level: Level value of windowing function
     :param width: Pixel width of the window
@@ -104,20 +267,9 @@ def scaled_pixmap(np_pixels, window, level, width, height,
     :return: pixmap, a QPixmap of the slice
     """
 
-    # Rescale pixel arrays
-    np_pixels = np_pixels.astype(np.int16)
-    if window != 0 and level != 0:
-        # Transformation applied to each individual pixel to unique
-        # contrast level
-        np_pixels = (np_pixels - level) / window * 255
-    else:
-        max_val = np.amax(np_pixels)
-        min_val = np.amin(np_pixels)
-        np_pixels = (np_pixels - min_val) / (max_val - min_val) * 255
-
-    np_pixels[np_pixels < 0] = 0
-    np_pixels[np_pixels > 255] = 255
-    np_pixels = np_pixels.astype(np.int8)
+    # Transformation applied to each individual pixel to unique
+    # contrast level
+    np_pixels = apply_window_level(np_pixels, window, level)
 
     # Process heatmap for conversion of the np_pixels to rgb for the purpose
     # of displaying the PT/CT view in RGB colorspace.
@@ -159,7 +311,7 @@ def convert_pt_to_heatmap(np_pixels):
         qimage [Qimage]: The converted heatmap
     """
     # Conversion of the array to UINT8, color spaces do not like int8.
-    arr8 = np_pixels.astype(np.uint8)
+    arr8 = np_pixels.astype(np.uint8, copy=False)
 
     # Apply a colormap to the imageset (np array)
     heatmap = cv2.applyColorMap(arr8, cv2.COLORMAP_HOT)
@@ -184,23 +336,21 @@ def convert_pt_to_heatmap(np_pixels):
 def get_pixmaps(pixel_array, window, level, pixmap_aspect,
                 fusion=False, color=None):
     """
-    Get a dictionary of pixmaps.
+    Get a dictionary of pixmaps for each view. The pixmaps are not rendered
+    here, each slice is rendered the first time it is looked up.
 
-    :param pixel_array: A list of converted pixel arrays
+    :param pixel_array: A 3D array of converted pixel values
     :param window: Window width of windowing function
     :param level: Level value of windowing function
     :param pixmap_aspect: Scaling ratio for axial, coronal, and sagittal pixmaps
     :param fusion: Boolean to determine if pixmaps will be fused
     :param color: String for conversion of pixels to specified color map
-    :return: dict_pixmaps, a dictionary of all pixmaps within the patient.
+    :return: dict_pixmaps, a SlicePixmaps for each of the axial, coronal and
+    sagittal views of the patient.
     """
-    # Convert pixel array to numpy 3d array
-    pixel_array_3d = np.array(pixel_array)
-
-    # Pixmaps dictionaries of 3 views
-    dict_pixmaps_axial = {}
-    dict_pixmaps_coronal = {}
-    dict_pixmaps_sagittal = {}
+    # View the pixel array as a numpy 3d array, without copying the volume
+    # returned by convert_raw_data
+    pixel_array_3d = np.asarray(pixel_array)
 
     axial_width, axial_height = scaled_size(
         pixel_array_3d.shape[1] * pixmap_aspect["axial"],
@@ -213,38 +363,160 @@ def get_pixmaps(pixel_array, window, level, pixmap_aspect,
         pixel_array_3d.shape[2] * pixmap_aspect["sagittal"],
         pixel_array_3d.shape[0])
 
-    for i in range(pixel_array_3d.shape[0]):
-        dict_pixmaps_axial[i] = scaled_pixmap(
-            pixel_array_3d[i, :, :],
-            window,
-            level,
-            axial_width,
-            axial_height,
-            fusion,
-            color)
-
-    for i in range(pixel_array_3d.shape[1]):
-        dict_pixmaps_coronal[i] = scaled_pixmap(
-            pixel_array_3d[:, i, :],
-            window,
-            level,
-            coronal_width,
-            coronal_height,
-            fusion,
-            color)
-
-        dict_pixmaps_sagittal[i] = scaled_pixmap(
-            pixel_array_3d[:, :, i],
-            window,
-            level,
-            sagittal_width,
-            sagittal_height,
-            fusion,
-            color)
+    # Coronal and sagittal slices are indexed by the number of rows, as
+    # the eagerly generated dictionaries were
+    dict_pixmaps_axial = SlicePixmaps(
+        pixel_array_3d, 0, pixel_array_3d.shape[0], window, level,
+        axial_width, axial_height, fusion, color)
+    dict_pixmaps_coronal = SlicePixmaps(
+        pixel_array_3d, 1, pixel_array_3d.shape[1], window, level,
+        coronal_width, coronal_height, fusion, color)
+    dict_pixmaps_sagittal = SlicePixmaps(
+        pixel_array_3d, 2, pixel_array_3d.shape[1], window, level,
+        sagittal_width, sagittal_height, fusion, color)
 
     return dict_pixmaps_axial, dict_pixmaps_coronal, dict_pixmaps_sagittal
 
 
+class LazyPixmaps(Mapping):
+    """
+    A read-only dictionary of slice number to QPixmap. A slice is rendered
+    when it is first looked up, and the most recently used pixmaps are kept
+    in a bounded cache, so memory use does not grow with the number of
+    slices. Subclasses implement the abstract render().
+    """
+
+    def __init__(self, num_slices, cache_size=constant.PIXMAP_CACHE_SIZE):
+        """
+        :param num_slices: The number of slices
+        :param cache_size: The maximum number of pixmaps to keep
+        """
+        self.num_slices = num_slices
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Compare by identity, as comparing contents would render every slice
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __contains__(self, index):
+        return isinstance(index, Integral) and 0 <= index < self.num_slices
+
+    def __len__(self):
+        return self.num_slices
+
+    def __iter__(self):
+        return iter(range(self.num_slices))
+
+    def __getitem__(self, index):
+        if index not in self:
+            raise KeyError(index)
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return self._cache[index]
+
+        pixmap = self.render(index)
+
+        with self._lock:
+            self._cache[index] = pixmap
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return pixmap
+
+    @abstractmethod
+    def render(self, index):
+        """
+        Renders the pixmap of a slice, without caching it.
+        :param index: The slice number
+        :return: pixmap, a QPixmap of the slice
+        """
+
+    def is_cached(self, index):
+        """
+        :param index: The slice number
+        :return: True if the pixmap of the slice has already been rendered
+        """
+        with self._lock:
+            return index in self._cache
+
+    def cached_slices(self):
+        """
+        :return: the numbers of the rendered slices, least recently used
+        first
+        """
+        with self._lock:
+            return list(self._cache)
+
+    def prefetch(self, index, radius=constant.PIXMAP_PREFETCH_RADIUS):
+        """
+        Renders the slices either side of a slice that are not cached yet,
+        so scrolling to them does not wait on rendering.
+        :param index: The slice number
+        :param radius: The number of slices either side to render
+        """
+        for distance in range(1, radius + 1):
+            for neighbour in (index + distance, index - distance):
+                if neighbour in self and not self.is_cached(neighbour):
+                    self[neighbour]
+
+
+class SlicePixmaps(LazyPixmaps):
+    """
+    The pixmaps of one view of a volume, rendered with scaled_pixmap.
+    """
+
+    def __init__(self, pixel_array_3d, axis, num_slices, window, level,
+                 width, height, fusion=False, color=None,
+                 cache_size=constant.PIXMAP_CACHE_SIZE):
+        """
+        :param pixel_array_3d: A 3D array of converted pixel values
+        :param axis: The axis of the array that is sliced for this view
+        :param num_slices: The number of slices in this view
+        :param window: Window width of windowing function
+        :param level: Level value of windowing function
+        :param width: Pixel width of the rendered pixmaps
+        :param height: Pixel height of the rendered pixmaps
+        :param fusion: Boolean to set scaling for overlayed images
+        :param color: String for conversion of pixels to specified color map
+        :param cache_size: The maximum number of pixmaps to keep
+        """
+        super().__init__(num_slices, cache_size)
+        self.pixel_array_3d = pixel_array_3d
+        self.axis = axis
+        self.window = window
+        self.level = level
+        self.width = width
+        self.height = height
+        self.fusion = fusion
+        self.color = color
+
+    def get_slice(self, index):
+        """
+        :param index: The slice number
+        :return: the 2D array of pixel values of the slice
+        """
+        return np.take(self.pixel_array_3d, index, axis=self.axis)
+
+    def render(self, index):
+        return scaled_pixmap(self.get_slice(index), self.window, self.level,
+                             self.width, self.height, self.fusion,
+                             self.color)
+
+    def with_window(self, window, level):
+        """
+        Get the pixmaps of the same view with a different window and level.
+        None of the slices are rendered until they are looked up.
+        :param window: Window width of windowing function
+        :param level: Level value of windowing function
+        :return: a new SlicePixmaps
+        """
+        return SlicePixmaps(self.pixel_array_3d, self.axis, self.num_slices,
+                            window, level, self.width, self.height,
+                            self.fusion, self.color, self.cache_size)
+
+
 def scaled_size(width, height):
     if width > height:
         height = constant.DEFAULT_WINDOW_SIZE / width * height
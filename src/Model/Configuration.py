@@ -78,7 +78,8 @@ class Configuration(metaclass=Singleton):
                     CREATE TABLE IF NOT EXISTS CONFIGURATION (
                         id INTEGER PRIMARY KEY,
                         default_dir TEXT,
-                        csv_dir TEXT
+                        csv_dir TEXT,
+                        use_dicomdir INTEGER
                     );
                 """)
         connection.commit()
@@ -242,6 +243,65 @@ class Configuration(metaclass=Singleton):
         connection.commit()
         connection.close()
 
+    @error_handling
+    def check_use_dicomdir_attribute(self, cursor):
+        """
+        Check for the use_dicomdir attribute in the SQLite table. Add it
+        if it is not there. Included in case database exists, but is from
+        an old version of OnkoDICOM.
+        :param cursor: cursor to the SQLite database.
+        """
+        cursor.execute("SELECT * FROM CONFIGURATION")
+        attribs = list(map(lambda x: x[0], cursor.description))
+
+        # Add the column
+        if 'use_dicomdir' not in attribs:
+            cursor.execute(
+                "ALTER TABLE CONFIGURATION ADD COLUMN use_dicomdir INTEGER")
+
+    @error_handling
+    def get_use_dicomdir(self):
+        """
+        Get whether directory searches build the DICOM structure from the
+        DICOMDIR files they find. Off unless the user has turned it on.
+        """
+        connection = sqlite3.connect(self.db_file_path)
+        cursor = connection.cursor()
+
+        self.check_use_dicomdir_attribute(cursor)
+
+        cursor.execute("SELECT use_dicomdir FROM CONFIGURATION WHERE id = 1")
+        record = cursor.fetchone()
+        connection.close()
+
+        if record is None or record[0] is None:
+            return False
+        return bool(record[0])
+
+    @error_handling
+    def update_use_dicomdir(self, use_dicomdir):
+        """
+        Updates whether directory searches use DICOMDIR files.
+        :param use_dicomdir: True to use DICOMDIR files.
+        """
+        connection = sqlite3.connect(self.db_file_path)
+        cursor = connection.cursor()
+
+        self.check_use_dicomdir_attribute(cursor)
+
+        cursor.execute("SELECT COUNT(*) FROM CONFIGURATION;")
+        result = cursor.fetchone()
+
+        if result[0] == 0:
+            cursor.execute("""INSERT INTO configuration (id, use_dicomdir)
+                            VALUES (1, ?);""", (int(use_dicomdir),))
+        else:
+            cursor.execute("""UPDATE CONFIGURATION
+                            SET use_dicomdir = ?
+                            WHERE id = 1;""", (int(use_dicomdir),))
+        connection.commit()
+        connection.close()
+
     def set_db_file_path(self, new_path):
         self.db_file_path = new_path
         self.set_up_config_db()
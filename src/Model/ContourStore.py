@@ -0,0 +1,250 @@
+"""
+Compact store of the contours of an ROI. Rather than a list of pydicom
+ContourData values per image slice, with an object per coordinate, the
+points of every contour of an ROI are kept in a single NumPy array.
+"""
+import numpy as np
+from pydicom.dataelem import RawDataElement
+from pydicom.tag import Tag
+
+# Data type of the stored contour points (mm). Points on pixel centres,
+# as written by ISO2ROI and the drawing tools, would move to a
+# neighbouring pixel if rounded to float32.
+CONTOUR_POINTS_DTYPE = np.float64
+
+# Tags of the elements of a ContourSequence item
+CONTOUR_DATA_TAG = Tag("ContourData")
+CONTOUR_IMAGE_SEQUENCE_TAG = Tag("ContourImageSequence")
+
+# Little endian bytes of the ReferencedSOPInstanceUID tag
+REFERENCED_SOP_INSTANCE_UID_BYTES = b"\x08\x00\x55\x11"
+
+
+class ROIContours:
+    """
+    The contours of an ROI, grouped by the image slice they are on. The
+    points of all contours are in one read-only (N, 3) array, where the
+    contours of each slice are next to each other, so the points of a
+    slice are a single view of the array.
+
+    It can be used as the dictionary of SOPInstanceUID to list of
+    ContourData that ImageLoading.get_raw_contour_data(..) returned for
+    each ROI: roi_contours[sop_instance_uid] is the list of flattened x,
+    y, z arrays of the contours on the slice, or an empty list.
+
+    ROIContours are not changed after they are created, so an ROI whose
+    contours have not changed keeps the same ROIContours.
+
+    Example usage:
+    roi_contours = ROIContours.from_contours(
+        [(sop_instance_uid, contour.ContourData)])
+    points = roi_contours.get_points(sop_instance_uid)
+    """
+
+    def __init__(self, points, contour_offsets, slice_ranges,
+                 num_points=None):
+        """
+        :param points: (N, 3) array of the points of every contour
+        :param contour_offsets: array of the index of the first point of
+            each contour, followed by N
+        :param slice_ranges: dictionary of SOPInstanceUID to the index of
+            the first contour on the slice and the index after its last
+            contour
+        :param num_points: number of points of the ROI, from its
+            NumberOfContourPoints values. Defaults to N.
+        """
+        self.points = points
+        self.points.flags.writeable = False
+        self.contour_offsets = contour_offsets
+        self.slice_ranges = slice_ranges
+        self.num_points = len(points) if num_points is None else num_points
+
+    @classmethod
+    def from_contours(cls, contours, num_points=None):
+        """
+        :param contours: iterable of (SOPInstanceUID, ContourData) pairs,
+            where ContourData is a flat sequence of x, y, z values
+        :param num_points: number of points of the ROI, from its
+            NumberOfContourPoints values
+        :return: ROIContours of the contours
+        """
+        slice_contours = {}
+        for sop_instance_uid, contour_data in contours:
+            points = np.asarray(contour_data, dtype=CONTOUR_POINTS_DTYPE)
+            points = points.ravel()
+            points = points[:len(points) - len(points) % 3]
+            slice_contours.setdefault(sop_instance_uid, []).append(points)
+
+        arrays = []
+        slice_ranges = {}
+        for sop_instance_uid, slice_points in slice_contours.items():
+            slice_ranges[sop_instance_uid] = \
+                (len(arrays), len(arrays) + len(slice_points))
+            arrays.extend(slice_points)
+
+        contour_offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum([len(points) // 3 for points in arrays],
+                  out=contour_offsets[1:])
+        if arrays:
+            points = np.concatenate(arrays).reshape(-1, 3)
+        else:
+            points = np.empty((0, 3), dtype=CONTOUR_POINTS_DTYPE)
+        return cls(points, contour_offsets, slice_ranges, num_points)
+
+    def extend(self, contours, num_points=0):
+        """
+        :param contours: iterable of (SOPInstanceUID, ContourData) pairs
+            of the contours to add
+        :param num_points: number of points of the added contours, from
+            their NumberOfContourPoints values
+        :return: new ROIContours of the contours of this ROI and the
+            added contours
+        """
+        return ROIContours.from_contours(
+            list(self.iter_contours()) + list(contours),
+            self.num_points + num_points)
+
+    def iter_contours(self):
+        """
+        :return: generator of the (SOPInstanceUID, flattened points) pair
+            of each contour
+        """
+        for sop_instance_uid in self.slice_ranges:
+            for contour in self[sop_instance_uid]:
+                yield sop_instance_uid, contour
+
+    def get_points(self, sop_instance_uid):
+        """
+        :param sop_instance_uid: SOPInstanceUID of an image slice
+        :return: (N, 3) view of the points of the contours on the slice
+        """
+        first, end = self.slice_ranges.get(sop_instance_uid, (0, 0))
+        return self.points[
+            self.contour_offsets[first]:self.contour_offsets[end]]
+
+    def get_offsets(self, sop_instance_uid):
+        """
+        :param sop_instance_uid: SOPInstanceUID of an image slice
+        :return: array of the index of the first point of each contour on
+            the slice in get_points(..), followed by the number of points
+        """
+        first, end = self.slice_ranges.get(sop_instance_uid, (0, 0))
+        offsets = self.contour_offsets[first:end + 1]
+        return offsets - offsets[0]
+
+    @property
+    def nbytes(self):
+        """
+        :return: number of bytes of the arrays of the store
+        """
+        return self.points.nbytes + self.contour_offsets.nbytes
+
+    def __getitem__(self, sop_instance_uid):
+        points = self.get_points(sop_instance_uid).ravel()
+        offsets = self.get_offsets(sop_instance_uid) * 3
+        return [points[offsets[i]:offsets[i + 1]]
+                for i in range(len(offsets) - 1)]
+
+    def get(self, sop_instance_uid, default=None):
+        if sop_instance_uid not in self.slice_ranges:
+            return default
+        return self[sop_instance_uid]
+
+    def __contains__(self, sop_instance_uid):
+        return sop_instance_uid in self.slice_ranges
+
+    def __iter__(self):
+        return iter(self.slice_ranges)
+
+    def __len__(self):
+        return len(self.slice_ranges)
+
+    def keys(self):
+        return self.slice_ranges.keys()
+
+    def values(self):
+        return [self[sop_instance_uid] for sop_instance_uid in self]
+
+    def items(self):
+        return [(sop_instance_uid, self[sop_instance_uid])
+                for sop_instance_uid in self]
+
+    def __eq__(self, other):
+        if not isinstance(other, ROIContours):
+            return NotImplemented
+        return self.slice_ranges == other.slice_ranges \
+            and self.num_points == other.num_points \
+            and np.array_equal(self.contour_offsets, other.contour_offsets) \
+            and np.array_equal(self.points, other.points)
+
+    __hash__ = None
+
+
+def read_contour_data(contour):
+    """
+    Read the ContourData of a contour as an array. If pydicom has not
+    converted the element yet, its bytes are parsed directly, without
+    creating a DSfloat for every value or converting the element.
+    :param contour: ContourSequence item
+    :return: flat array of the x, y, z values of the contour
+    """
+    if CONTOUR_DATA_TAG not in contour:
+        return np.empty(0, dtype=CONTOUR_POINTS_DTYPE)
+    data_element = contour.get_item(CONTOUR_DATA_TAG)
+    if isinstance(data_element, RawDataElement):
+        points = parse_ds_values(data_element.value)
+        if points is not None:
+            return points
+    return np.asarray(contour.ContourData,
+                      dtype=CONTOUR_POINTS_DTYPE).ravel()
+
+
+def parse_ds_values(value):
+    """
+    Parse the bytes of a multi-valued DS element.
+    :param value: bytes of the element, values separated by backslashes
+    :return: flat array of the values, or None if the bytes are not a
+        list of numbers, e.g. because a value is missing
+    """
+    if not value:
+        return np.empty(0, dtype=CONTOUR_POINTS_DTYPE)
+    try:
+        text = value.decode("ascii")
+        values = np.fromstring(text, dtype=CONTOUR_POINTS_DTYPE, sep="\\")
+    except (UnicodeDecodeError, ValueError):
+        return None
+    if len(values) != text.count("\\") + 1:
+        return None
+    return values
+
+
+def read_referenced_sop_instance_uid(contour):
+    """
+    Get the ReferencedSOPInstanceUID of the last item of the
+    ContourImageSequence of a contour. If pydicom has not read the
+    sequence yet, the UID is found in the bytes of the sequence, without
+    reading its items.
+    :param contour: ContourSequence item
+    :return: the SOPInstanceUID of the image of the contour, or None
+    """
+    data_element = contour.get_item(CONTOUR_IMAGE_SEQUENCE_TAG)
+    if isinstance(data_element, RawDataElement) and data_element.value \
+            and data_element.is_little_endian:
+        value = data_element.value
+        index = value.rfind(REFERENCED_SOP_INSTANCE_UID_BYTES)
+        # The tag is followed by a 4 byte length, or by the VR and a 2
+        # byte length
+        if index >= 0 and data_element.is_implicit_VR:
+            length = int.from_bytes(value[index + 4:index + 8], "little")
+        elif index >= 0 and value[index + 4:index + 6] == b"UI":
+            length = int.from_bytes(value[index + 6:index + 8], "little")
+        else:
+            length = None
+        if length is not None:
+            uid = value[index + 8:index + 8 + length]
+            return uid.rstrip(b"\x00 ").decode("ascii")
+
+    referenced_sop_instance_uid = None
+    for contour_img in contour.ContourImageSequence:
+        referenced_sop_instance_uid = contour_img.ReferencedSOPInstanceUID
+    return referenced_sop_instance_uid
@@ -3,46 +3,338 @@ File to handle the DICOM directory search functionality
 Searches a given directory to extract a Patient>Study>Series>Image structure
 """
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from pydicom import dcmread
+from pydicom.dataset import Dataset
 from pydicom.errors import InvalidDicomError
+from pydicom.fileset import FileSet
 
+from src.Model.Configuration import Configuration, SqlError
+from src.Model.DICOM.DICOMHeaderIndex import header_from_json, \
+    header_to_json
 from src.Model.DICOM.Structure.DICOMStructure import DICOMStructure
 from src.Model.DICOM.Structure.DICOMPatient import Patient
 from src.Model.DICOM.Structure.DICOMStudy import Study
 from src.Model.DICOM.Structure.DICOMSeries import Series
 from src.Model.DICOM.Structure.DICOMImage import Image
 
+# Only the tags needed to build the DICOMStructure are read from each file.
+# Everything else (including pixel data and contour sequences) is skipped.
+DICOM_STRUCTURE_TAGS = [
+    "PatientID",
+    "PatientName",
+    "StudyInstanceUID",
+    "StudyDescription",
+    "SeriesInstanceUID",
+    "SeriesDescription",
+    "SOPInstanceUID",
+    "SOPClassUID",
+    "Modality",
+    "FrameOfReferenceUID",
+    "ReferencedFrameOfReferenceUID",
+    "ReferencedFrameOfReferenceSequence",
+    "ReferencedStructureSetSequence",
+    "ReferencedRTPlanSequence",
+]
 
-def get_dicom_structure(path, interrupt_flag, progress_callback):
+# Modalities whose referenced objects are not stored in DICOMDIR records,
+# so their instance files are always read when building from a DICOMDIR.
+DICOMDIR_READ_MODALITIES = ["RTSTRUCT", "RTPLAN", "RTDOSE", "SR"]
+
+# Number of threads used to read file headers. Reading is mostly I/O bound,
+# so more threads than cores helps on network shares and optical media.
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# Maximum number of files queued to the thread pool ahead of the file
+# currently being added to the structure.
+SCAN_QUEUE_SIZE = SCAN_WORKERS * 4
+
+
+def is_dicom_file(file_path):
+    """
+    Checks for the 'DICM' prefix that follows the 128 byte preamble of a
+    DICOM Part 10 file, without parsing the file.
+    :param file_path: Path of the file to check.
+    :return: True if the file has a DICOM preamble.
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            file.seek(128)
+            return file.read(4) == b"DICM"
+    except OSError:
+        return False
+
+
+def read_dicom_header(file_path):
+    """
+    Reads only the tags in DICOM_STRUCTURE_TAGS from a DICOM file.
+    :param file_path: Path of the file to read.
+    :return: A pydicom Dataset, or None if the file is not a readable
+        DICOM file.
+    """
+    if not is_dicom_file(file_path):
+        return None
+    try:
+        return dcmread(file_path, stop_before_pixels=True,
+                       specific_tags=DICOM_STRUCTURE_TAGS)
+    except (InvalidDicomError, FileNotFoundError, PermissionError):
+        return None
+
+
+def read_indexed_header(file_path, index_entries):
+    """
+    Reads the header of a file, or takes it from the header index if the
+    file has not changed since it was indexed.
+    :param file_path: Path of the file to read.
+    :param index_entries: Dictionary of {path: (size, mtime, header)} from
+        DICOMHeaderIndex.get_entries().
+    :return: Tuple of the pydicom Dataset (or None if the file is not a
+        readable DICOM file) and the new index entry for the file (or None
+        if the index is already up to date).
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None, None
+
+    entry = index_entries.get(file_path)
+    if entry is not None and entry[0] == stat.st_size \
+            and entry[1] == stat.st_mtime_ns:
+        return header_from_json(entry[2]), None
+
+    dicom_file = read_dicom_header(file_path)
+    return dicom_file, (file_path, stat.st_size, stat.st_mtime_ns,
+                        header_to_json(dicom_file))
+
+
+def get_use_dicomdir():
+    """
+    :return: True if the user has chosen to build the DICOM structure from
+        DICOMDIR files, False otherwise or if the setting cannot be read.
+    """
+    try:
+        return Configuration().get_use_dicomdir()
+    except SqlError:
+        return False
+
+
+def read_dicomdir(dicomdir_path):
+    """
+    Reads the directory records of a DICOMDIR media index.
+    :param dicomdir_path: Path of the DICOMDIR file.
+    :return: List of (instance path, Dataset) tuples, where each Dataset
+        holds the structure tags found in the instance's directory records,
+        or None if the DICOMDIR could not be read.
+    """
+    if not is_dicom_file(dicomdir_path):
+        return None
+    try:
+        file_set = FileSet(dcmread(dicomdir_path))
+        instances = []
+        for instance in file_set:
+            record = Dataset()
+            for keyword in DICOM_STRUCTURE_TAGS:
+                if keyword in instance:
+                    setattr(record, keyword, getattr(instance, keyword))
+            record.SOPInstanceUID = instance.SOPInstanceUID
+            record.SOPClassUID = instance.SOPClassUID
+            instances.append((instance.path, record))
+    except (InvalidDicomError, ValueError, KeyError, AttributeError,
+            OSError):
+        return None
+    return instances
+
+
+def read_dicomdir_instance(file_path, record):
+    """
+    Reads the header of an instance listed in a DICOMDIR, for the tags
+    that are not stored in the directory records.
+    :param file_path: Path of the instance file.
+    :param record: Dataset built from the instance's directory records.
+    :return: A pydicom Dataset, or None if the file is not readable.
+    """
+    dicom_file = read_dicom_header(file_path)
+    if dicom_file is None:
+        return None
+    for element in record:
+        if element.tag not in dicom_file:
+            dicom_file.add(element)
+    return dicom_file
+
+
+def walk_directory(path, use_dicomdir=False):
+    """
+    Generator of every file inside the given directory and its
+    subdirectories, ignoring hidden files and directories.
+    :param path: The root directory to search from.
+    :param use_dicomdir: If True, the instances listed in a readable
+        DICOMDIR are generated along with their directory records when its
+        directory is reached. Files the DICOMDIR does not list, including
+        those in subdirectories, are still generated.
+    :return: Generator of (file path, Dataset) tuples, where the Dataset is
+        None unless the file was listed in a DICOMDIR.
+    """
+    listed_paths = set()
+    for root, dirs, files in os.walk(path, topdown=True):
+        files = [f for f in files if not f[0] == '.']
+        dirs[:] = [d for d in dirs if not d[0] == '.']
+        if use_dicomdir and "DICOMDIR" in files:
+            instances = read_dicomdir(root + os.sep + "DICOMDIR")
+            for file_path, record in instances or []:
+                listed_paths.add(normalise_path(file_path))
+                yield file_path, record
+        for file in files:
+            file_path = root + os.sep + file
+            if listed_paths and normalise_path(file_path) in listed_paths:
+                continue
+            yield file_path, None
+
+
+def normalise_path(file_path):
+    """
+    :param file_path: Path of a file.
+    :return: The absolute path of the file, in the form used to compare
+        paths on this platform.
+    """
+    return os.path.normcase(os.path.abspath(file_path))
+
+
+def add_to_dicom_structure(dicom_structure, file_path, dicom_file,
+                           patient_id):
+    """
+    Adds a DICOM file to the Patient>Study>Series>Image structure.
+    :param dicom_structure: DICOMStructure object to add the file to.
+    :param file_path: Path of the DICOM file.
+    :param dicom_file: pydicom Dataset containing at least the tags in
+        DICOM_STRUCTURE_TAGS.
+    :param patient_id: PatientID to file the DICOM file under.
+    """
+    if "SOPInstanceUID" not in dicom_file \
+            or "SOPClassUID" not in dicom_file \
+            or "Modality" not in dicom_file:
+        return
+
+    new_image = Image(file_path,
+                      dicom_file.SOPInstanceUID,
+                      dicom_file.SOPClassUID,
+                      dicom_file.Modality)
+
+    existing_patient = dicom_structure.get_patient(patient_id)
+    if existing_patient is None:
+        new_patient = Patient(patient_id, dicom_file.PatientName)
+        dicom_structure.add_patient(new_patient)
+    existing_study = None if existing_patient is None \
+        else existing_patient.get_study(dicom_file.StudyInstanceUID)
+    existing_series = None if existing_study is None \
+        else existing_study.get_series(dicom_file.SeriesInstanceUID)
+
+    if existing_series is not None:
+        if not existing_series.has_image(dicom_file.SOPInstanceUID):
+            existing_series.series_description = \
+                dicom_file.get("SeriesDescription")
+            existing_series.add_image(new_image)
+        return
+
+    new_series = Series(dicom_file.SeriesInstanceUID)
+    new_series.series_description = dicom_file.get("SeriesDescription")
+    new_series.add_referenced_objects(dicom_file)
+    new_series.add_image(new_image)
+
+    if existing_study is not None:
+        existing_study.add_series(new_series)
+        return
+
+    new_study = Study(dicom_file.StudyInstanceUID)
+    new_study.study_description = dicom_file.get("StudyDescription")
+    new_study.add_series(new_series)
+    dicom_structure.get_patient(patient_id).add_study(new_study)
+
+
+def get_dicom_structure(path, interrupt_flag, progress_callback,
+                        header_index=None, use_dicomdir=False):
     """
     Searches the given directory and creates a
     Patient>Study>Series>Image structure based on the DICOM files in the
-    directory and subdirectories.
+    directory and subdirectories. File headers are read on a thread pool,
+    and only the tags needed for the structure are parsed.
 
     :param path: The root directory to search from.
     :param interrupt_flag: A threading.Event() flag to indicate whether
         or not the process has been interrupted.
     :param progress_callback: A function that receives the progress of
         the current search.
+    :param header_index: Optional DICOMHeaderIndex. When given, only files
+        that are new or have changed since the last search are read, and
+        the index is updated with the result of the search.
+    :param use_dicomdir: If True, the instances listed in any DICOMDIR are
+        added from the DICOMDIR's directory records. Only the first
+        instance of each image series and RT/SR instances are read. Files
+        not listed in the DICOMDIR are read as usual.
     :return: Complete DICOMStructure object with associated DICOM files
     """
 
     dicom_structure = DICOMStructure()
 
+    if header_index is not None:
+        path = os.path.abspath(path)
+        index_entries = header_index.get_entries(path)
+    new_index_entries = []
+    searched_paths = set()
+
     files_searched = 0
 
     files_with_no_patient_id = 1
 
-    for root, dirs, files in os.walk(path, topdown=True):
-        files = [f for f in files if not f[0] == '.']
-        dirs[:] = [d for d in dirs if not d[0] == '.']
-        for file in files:
-            if file[0] == '.':
+    # Series that already have an instance read from a DICOMDIR
+    dicomdir_series = set()
+
+    # Files are read out of order by the pool, but results are consumed in
+    # os.walk order so the structure is the same as a sequential search.
+    pending = deque()
+    files = walk_directory(path, use_dicomdir)
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        while True:
+            while len(pending) < SCAN_QUEUE_SIZE:
+                file_path, record = next(files, (None, None))
+                if file_path is None:
+                    break
+                future = None
+                indexed = False
+                if record is not None:
+                    series_uid = record.get("SeriesInstanceUID")
+                    if record.get("Modality") in DICOMDIR_READ_MODALITIES \
+                            or series_uid not in dicomdir_series:
+                        dicomdir_series.add(series_uid)
+                        future = executor.submit(read_dicomdir_instance,
+                                                 file_path, record)
+                        record = None
+                # Fix to program crashing when encountering DICOMDIR files
+                elif os.path.basename(file_path) == "DICOMDIR":
+                    pass
+                elif header_index is None:
+                    future = executor.submit(read_dicom_header, file_path)
+                else:
+                    future = executor.submit(read_indexed_header, file_path,
+                                             index_entries)
+                    indexed = True
+                pending.append((file_path, future, record, indexed))
+
+            if not pending:
                 break
+
             if interrupt_flag.is_set():
+                for _, future, _, _ in pending:
+                    if future is not None:
+                        future.cancel()
+                # Keep the headers that were read before the interruption
+                if header_index is not None:
+                    header_index.update_entries(path, new_index_entries, [])
                 return
 
+            file_path, future, dicom_file, indexed = pending.popleft()
+
             # The progress is updated first because the total files
             # represent ALL files inside the selected directory, not
             # just the DICOM files. Otherwise, most files would be
@@ -50,83 +342,30 @@ def get_dicom_structure(path, interrupt_flag, progress_callback):
             files_searched += 1
             progress_callback.emit(files_searched)
 
-            # Fix to program crashing when encountering DICOMDIR files
-            if file == "DICOMDIR":
+            if future is not None:
+                dicom_file = future.result()
+            # Files read through a DICOMDIR keep their index entries too
+            searched_paths.add(normalise_path(file_path))
+            if indexed:
+                dicom_file, index_entry = dicom_file
+                if index_entry is not None:
+                    new_index_entries.append(index_entry)
+            if dicom_file is None:
                 continue
 
-            file_path = root + os.sep + file
-            try:
-                dicom_file = dcmread(file_path)
-            except (InvalidDicomError, FileNotFoundError, PermissionError):
-                pass
+            if 'PatientID' in dicom_file:
+                patient_id = dicom_file.PatientID
             else:
-                if 'PatientID' in dicom_file:
-                    patient_id = dicom_file.PatientID
-                else:
-                    patient_id = "no_id_" + str(files_with_no_patient_id)
-                    files_with_no_patient_id += 1
-
-                if "SOPInstanceUID" in dicom_file \
-                        and "SOPClassUID" in dicom_file \
-                        and "Modality" in dicom_file:
-                    new_image = Image(file_path,
-                                      dicom_file.SOPInstanceUID,
-                                      dicom_file.SOPClassUID,
-                                      dicom_file.Modality)
-                    if not dicom_structure.has_patient(patient_id):
-                        new_series = Series(dicom_file.SeriesInstanceUID)
-                        new_series.series_description = dicom_file.get(
-                            "SeriesDescription")
-                        new_series.add_referenced_objects(dicom_file)
-                        new_series.add_image(new_image)
-
-                        new_study = Study(dicom_file.StudyInstanceUID)
-                        new_study.study_description = dicom_file.get(
-                            "StudyDescription")
-                        new_study.add_series(new_series)
-
-                        new_patient = Patient(patient_id,
-                                              dicom_file.PatientName)
-                        new_patient.add_study(new_study)
-
-                        dicom_structure.add_patient(new_patient)
-                    else:
-                        existing_patient = dicom_structure.get_patient(
-                            dicom_file.PatientID)
-                        if not existing_patient.has_study(
-                                dicom_file.StudyInstanceUID):
-                            new_series = Series(dicom_file.SeriesInstanceUID)
-                            new_series.series_description = dicom_file.get(
-                                "SeriesDescription")
-                            new_series.add_referenced_objects(dicom_file)
-                            new_series.add_image(new_image)
-
-                            new_study = Study(dicom_file.StudyInstanceUID)
-                            new_study.study_description = dicom_file.get(
-                                "StudyDescription")
-                            new_study.add_series(new_series)
-
-                            existing_patient.add_study(new_study)
-                        else:
-                            existing_study = existing_patient.get_study(
-                                dicom_file.StudyInstanceUID)
-                            if not existing_study.has_series(
-                                    dicom_file.SeriesInstanceUID):
-                                new_series = Series(
-                                    dicom_file.SeriesInstanceUID)
-                                new_series.series_description = dicom_file.get(
-                                    "SeriesDescription")
-                                new_series.add_referenced_objects(dicom_file)
-                                new_series.add_image(new_image)
-
-                                existing_study.add_series(new_series)
-                            else:
-                                existing_series = existing_study.get_series(
-                                    dicom_file.SeriesInstanceUID)
-                                if not existing_series.has_image(
-                                        dicom_file.SOPInstanceUID):
-                                    existing_series.series_description = \
-                                        dicom_file.get("SeriesDescription")
-                                    existing_series.add_image(new_image)
-                                    
+                patient_id = "no_id_" + str(files_with_no_patient_id)
+                files_with_no_patient_id += 1
+
+            add_to_dicom_structure(dicom_structure, file_path, dicom_file,
+                                   patient_id)
+
+    if header_index is not None:
+        removed_paths = [indexed_path for indexed_path in index_entries
+                         if normalise_path(indexed_path)
+                         not in searched_paths]
+        header_index.update_entries(path, new_index_entries, removed_paths)
+
     return dicom_structure
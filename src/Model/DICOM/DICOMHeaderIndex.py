@@ -0,0 +1,126 @@
+"""
+Persistent index of the DICOM header tags used to build a DICOMStructure.
+Entries are keyed by file path, size and modification time, so a rescan of
+a directory only needs to read files that are new or have changed.
+"""
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from pydicom import Dataset
+
+from src.Model.LRUDatabase import LRUDatabase
+
+# Maximum number of files kept in the index. When it is exceeded, the files
+# of the directories that were searched least recently are removed, apart
+# from the files of the directory being searched.
+MAX_INDEX_ENTRIES = 100000
+
+
+class DICOMHeaderIndex(LRUDatabase):
+    """
+    Stores the header of every file found during a directory search in a
+    SQLite database in the OnkoDICOM hidden directory. Files that are not
+    DICOM files are stored with no header, so they are not sniffed again.
+
+    Example usage:
+    header_index = DICOMHeaderIndex()
+    structure = get_dicom_structure(path, interrupt_flag, progress_callback,
+                                    header_index=header_index)
+    """
+
+    table_name = "DICOM_HEADER_INDEX"
+    # The root is the directory of the search that indexed the file
+    table_columns = ("path TEXT PRIMARY KEY", "root TEXT", "size INTEGER",
+                     "mtime INTEGER", "header TEXT")
+    indexed_columns = ("root",)
+
+    def __init__(self, db_file='DICOMHeaderIndex.db',
+                 max_entries=MAX_INDEX_ENTRIES):
+        super().__init__(db_file, max_entries)
+
+    def get_entries(self, root):
+        """
+        Get every indexed file under the given directory, and mark them as
+        used.
+        :param root: The root directory of the search.
+        :return: Dictionary of {path: (size, mtime, header)}, where header
+            is a JSON string or None for files that are not DICOM files.
+        """
+        # The separator stops /data/a from also matching /data/ab
+        prefix = os.path.join(str(root), '')
+        try:
+            connection = self.connect()
+            cursor = connection.cursor()
+            cursor.execute("""SELECT path, size, mtime, header
+                              FROM DICOM_HEADER_INDEX
+                              WHERE substr(path, 1, ?) = ?""",
+                           (len(prefix), prefix))
+            records = cursor.fetchall()
+            cursor.execute("""UPDATE DICOM_HEADER_INDEX SET last_used = ?
+                              WHERE substr(path, 1, ?) = ?""",
+                           (time.time(), len(prefix), prefix))
+            connection.commit()
+            connection.close()
+        except sqlite3.Error:
+            logging.exception("Could not read the DICOM header index")
+            return {}
+        return {path: (size, mtime, header)
+                for path, size, mtime, header in records}
+
+    def update_entries(self, root, entries, removed_paths):
+        """
+        Add or replace indexed files, and remove files that no longer
+        exist. If the index then has more than max_entries files, the
+        files of the least recently searched directories are removed.
+        :param root: The root directory of the search.
+        :param entries: List of (path, size, mtime, header) tuples.
+        :param removed_paths: Paths under root that are no longer present.
+        """
+        if not entries and not removed_paths:
+            return
+        try:
+            last_used = time.time()
+            connection = self.connect()
+            connection.executemany("""INSERT OR REPLACE INTO
+                                      DICOM_HEADER_INDEX
+                                      (path, size, mtime, header, root,
+                                       last_used)
+                                      VALUES (?, ?, ?, ?, ?, ?)""",
+                                   [tuple(entry) + (str(root), last_used)
+                                    for entry in entries])
+            connection.executemany("""DELETE FROM DICOM_HEADER_INDEX
+                                      WHERE path = ?""",
+                                   [(path,) for path in removed_paths])
+            # Files under the root of the current search are never removed
+            prefix = os.path.join(str(root), '')
+            self.remove_least_recently_used(
+                connection, "root", "substr(path, 1, ?) = ?",
+                (len(prefix), prefix))
+            connection.commit()
+            connection.close()
+        except sqlite3.Error:
+            logging.exception("Could not update the DICOM header index "
+                              "for %s", root)
+
+
+def header_to_json(dicom_file):
+    """
+    :param dicom_file: pydicom Dataset read from a file, or None.
+    :return: JSON string of the dataset, or None.
+    """
+    if dicom_file is None:
+        return None
+    return json.dumps(dicom_file.to_json_dict())
+
+
+def header_from_json(header):
+    """
+    :param header: JSON string stored in the index, or None.
+    :return: pydicom Dataset, or None.
+    """
+    if header is None:
+        return None
+    return Dataset.from_json(header)
@@ -0,0 +1,162 @@
+"""
+Persistent cache of calculated DVHs. Entries are keyed by a hash of the
+contours of an ROI together with the RTDOSE, dose limit and thickness the
+DVH was calculated with, so a DVH is only recalculated when its ROI has
+changed.
+"""
+import hashlib
+import logging
+import sqlite3
+import time
+
+import numpy as np
+from dicompylercore.dvh import DVH
+
+from src.Model.ContourStore import read_contour_data
+from src.Model.LRUDatabase import LRUDatabase
+
+# Maximum number of DVHs kept in the cache. Every edit of an ROI adds a
+# DVH, so when it is exceeded the least recently used DVHs are removed.
+MAX_CACHE_ENTRIES = 2000
+
+
+class DVHCache(LRUDatabase):
+    """
+    Stores calculated DVHs in a SQLite database in the OnkoDICOM hidden
+    directory, so they are kept across sessions and shared between
+    patients' RTSTRUCTs that have identical ROIs.
+
+    Example usage:
+    dvh_cache = DVHCache()
+    raw_dvh = ImageLoading.calc_dvhs_from_files(
+        rtss_path, rtdose_path, rois, dict_thickness, interrupt_flag,
+        dvh_cache=dvh_cache)
+    """
+
+    table_name = "DVH_CACHE"
+    table_columns = ("key TEXT PRIMARY KEY", "dvh_type TEXT",
+                     "dose_units TEXT", "volume_units TEXT", "notes TEXT",
+                     "bins BLOB", "counts BLOB")
+
+    def __init__(self, db_file='DVHCache.db',
+                 max_entries=MAX_CACHE_ENTRIES):
+        super().__init__(db_file, max_entries)
+
+    def get_dvhs(self, dict_keys, rois):
+        """
+        Get the cached DVHs of ROIs, and mark them as used.
+        :param dict_keys: Dictionary of ROINumber to the key of its DVH,
+            from get_dvh_keys(..).
+        :param rois: Dictionary of ROI information, used to name the DVHs.
+        :return: Dictionary of ROINumber to DVH, for the ROIs whose DVH is
+            in the cache.
+        """
+        if not dict_keys:
+            return {}
+        keys = list(set(dict_keys.values()))
+        records = []
+        try:
+            connection = self.connect()
+            cursor = connection.cursor()
+            # SQLite limits the number of variables of a statement
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                cursor.execute("""SELECT key, dvh_type, dose_units,
+                                  volume_units, notes, bins, counts
+                                  FROM DVH_CACHE WHERE key IN (%s)"""
+                               % ", ".join("?" * len(chunk)), chunk)
+                records.extend(cursor.fetchall())
+            last_used = time.time()
+            cursor.executemany("""UPDATE DVH_CACHE SET last_used = ?
+                                  WHERE key = ?""",
+                               [(last_used, record[0])
+                                for record in records])
+            connection.commit()
+            connection.close()
+        except sqlite3.Error:
+            logging.exception("Could not read the DVH cache")
+            return {}
+
+        entries = {record[0]: record[1:] for record in records}
+        dict_dvh = {}
+        for roi, key in dict_keys.items():
+            if key not in entries:
+                continue
+            dvh_type, dose_units, volume_units, notes, bins, counts = \
+                entries[key]
+            dict_dvh[roi] = DVH(counts=np.frombuffer(counts).copy(),
+                                bins=np.frombuffer(bins).copy(),
+                                dvh_type=dvh_type, dose_units=dose_units,
+                                volume_units=volume_units, notes=notes,
+                                name=rois[roi]['name'] if roi in rois
+                                else None)
+        return dict_dvh
+
+    def update_dvhs(self, dict_keys, dict_dvh):
+        """
+        Add or replace calculated DVHs. If the cache then has more than
+        max_entries DVHs, the least recently used DVHs are removed.
+        :param dict_keys: Dictionary of ROINumber to the key of its DVH,
+            from get_dvh_keys(..).
+        :param dict_dvh: Dictionary of ROINumber to DVH.
+        """
+        entries = []
+        last_used = time.time()
+        for roi, dvh in dict_dvh.items():
+            if roi not in dict_keys:
+                continue
+            entries.append((dict_keys[roi], dvh.dvh_type, dvh.dose_units,
+                            dvh.volume_units, dvh.notes,
+                            np.asarray(dvh.bins, dtype=float).tobytes(),
+                            np.asarray(dvh.counts, dtype=float).tobytes(),
+                            last_used))
+        if not entries:
+            return
+        try:
+            connection = self.connect()
+            connection.executemany("""INSERT OR REPLACE INTO DVH_CACHE
+                                      (key, dvh_type, dose_units,
+                                       volume_units, notes, bins, counts,
+                                       last_used)
+                                      VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                                   entries)
+            self.remove_least_recently_used(connection, "key")
+            connection.commit()
+            connection.close()
+        except sqlite3.Error:
+            logging.exception("Could not update the DVH cache")
+
+
+def get_dvh_keys(dataset_rtss, rtdose_uid, rois, dict_thickness,
+                 dose_limit=None):
+    """
+    Get the cache keys of the DVHs of ROIs. A key changes when any point
+    of the ROI's contours, the RTDOSE, the dose limit or the thickness of
+    the ROI changes, but not when the ROI is renamed.
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :param rtdose_uid: SOPInstanceUID of the RTDOSE.
+    :param rois: Dictionary of ROI information, or iterable of
+        ROINumbers.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI.
+    :param dose_limit: Limit of dose for DVH calculation.
+    :return: Dictionary of ROINumber to key.
+    """
+    roi_contours = {}
+    for roi_contour in dataset_rtss.get('ROIContourSequence', []):
+        roi_contours[int(roi_contour.ReferencedROINumber)] = roi_contour
+
+    dict_keys = {}
+    for roi in rois:
+        digest = hashlib.sha256()
+        digest.update(repr((str(rtdose_uid), dose_limit,
+                            dict_thickness.get(roi))).encode())
+        roi_contour = roi_contours.get(int(roi))
+        if roi_contour is not None:
+            for contour in roi_contour.get('ContourSequence', []):
+                points = read_contour_data(contour)
+                # The number of points separates consecutive contours
+                digest.update(np.int64(points.size).tobytes())
+                digest.update(points.tobytes())
+        dict_keys[roi] = digest.hexdigest()
+    return dict_keys
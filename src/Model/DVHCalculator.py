@@ -0,0 +1,331 @@
+"""
+Vectorised calculation of dose volume histograms (DVHs).
+
+The DVHs are calculated the way dicompylercore.dvhcalc.get_dvh(..) does,
+with the same dose planes, voxel masks, bins and volumes, so the results
+are interchangeable. Instead of re-reading and re-interpolating the dose
+for every plane of every ROI, the dose is resampled once onto every
+contour plane of the structure set, each ROI is rasterised to a mask
+only within the bounding box of its contours, and the histograms of all
+the ROIs are counted in a single pass.
+"""
+import threading
+
+import numpy as np
+from dicompylercore import dvh
+from dicompylercore.dicomparser import DicomParser
+from matplotlib.path import Path
+
+from src.Model.ContourStore import read_contour_data
+
+# Maximum distance (in mm) from a plane to a dose frame for the frame to
+# be used as it is, without interpolation (as in dicompyler-core)
+DOSE_FRAME_THRESHOLD = 0.5
+
+# Notes of the DVH of an ROI with contours outside of the dose grid
+OUTSIDE_DOSE_GRID_NOTES = 'Dose grid does not encompass every contour.' \
+    ' Volume calculated for all contours.'
+
+
+class DoseGrid:
+    """
+    The dose of an RTDOSE dataset in cGy, resampled onto the contour
+    planes of a structure set. Resampled planes are kept, so every plane
+    is only interpolated once. A dose grid can be shared between threads.
+    """
+
+    def __init__(self, dataset_rtdose):
+        """
+        :param dataset_rtdose: RTDOSE DICOM dataset object.
+        """
+        parser = DicomParser(dataset_rtdose)
+        self.sop_instance_uid = dataset_rtdose.SOPInstanceUID
+        self.pixel_array = None
+        if 'PixelData' in dataset_rtdose:
+            self.pixel_array = parser.GetPixelArray()
+            if self.pixel_array.ndim == 2:
+                self.pixel_array = self.pixel_array[np.newaxis]
+
+        self.scaling = float(getattr(dataset_rtdose, 'DoseGridScaling', 1))
+        self.lut = parser.GetPatientToPixelLUT()
+        self.x_lut_index = parser.x_lut_index()
+        self.origin_z = float(dataset_rtdose.ImagePositionPatient[2])
+        self.frames_z = None
+        if 'GridFrameOffsetVector' in dataset_rtdose:
+            z_sign = 1 if parser.is_head_first_orientation() else -1
+            self.frames_z = z_sign \
+                * np.array(dataset_rtdose.GridFrameOffsetVector, dtype=float) \
+                + self.origin_z
+
+        # Volume of a voxel (in mm^3) for a thickness of 1 mm
+        self.pixel_area = abs(np.mean(np.diff(self.lut[0]))) \
+            * abs(np.mean(np.diff(self.lut[1])))
+
+        self.planes = {}
+        self.planes_lock = threading.Lock()
+
+    def is_empty(self):
+        """
+        :return: True if the RTDOSE has no dose data.
+        """
+        return self.pixel_array is None
+
+    def max_dose_bin(self, dose_limit=None):
+        """
+        :param dose_limit: Limit of dose (in cGy) for DVH calculation.
+        :return: The number of 1 cGy bins of the DVHs.
+        """
+        max_bin = int(float(self.pixel_array.max()) * self.scaling * 100) + 1
+        if isinstance(dose_limit, int) and dose_limit < max_bin:
+            max_bin = dose_limit
+        return max_bin
+
+    def get_planes(self, z_positions):
+        """
+        Resample the dose onto planes, interpolating linearly between the
+        two closest frames when no frame is within DOSE_FRAME_THRESHOLD.
+        :param z_positions: list of plane positions (mm).
+        :return: list of 2d numpy arrays of the dose (cGy) of each plane,
+            which are empty for planes outside of the dose grid.
+        """
+        with self.planes_lock:
+            missing = [z for z in dict.fromkeys(z_positions)
+                       if z not in self.planes]
+            if missing:
+                self.planes.update(zip(missing, self.resample(missing)))
+            return [self.planes[z] for z in z_positions]
+
+    def resample(self, z_positions):
+        """
+        :param z_positions: list of plane positions (mm).
+        :return: list of 2d numpy arrays of the dose (cGy) of each plane.
+        """
+        empty = np.array([])
+        if self.frames_z is None:
+            return [empty] * len(z_positions)
+
+        z = np.array(z_positions, dtype=float)
+        distances = np.fabs(self.frames_z[np.newaxis] - z[:, np.newaxis])
+        upper = np.argmin(distances, axis=1)
+        distances[np.arange(len(z)), upper] = np.inf
+        lower = np.argmin(distances, axis=1)
+
+        exact = np.fabs(self.frames_z[upper] - z) < DOSE_FRAME_THRESHOLD
+        outside = (z < self.frames_z.min()) | (z > self.frames_z.max())
+        interpolated = ~exact & ~outside
+
+        planes = [empty] * len(z)
+        for i in np.flatnonzero(exact):
+            planes[i] = self.pixel_array[upper[i]] * self.scaling * 100
+        if interpolated.any():
+            # Fractional distance of each plane from the lower frame
+            fz = (z[interpolated] - self.frames_z[lower[interpolated]]) \
+                / (self.frames_z[upper[interpolated]]
+                   - self.frames_z[lower[interpolated]])
+            fz = fz[:, np.newaxis, np.newaxis]
+            doses = fz * self.pixel_array[upper[interpolated]] \
+                + (1.0 - fz) * self.pixel_array[lower[interpolated]]
+            doses = doses * self.scaling * 100
+            for i, dose in zip(np.flatnonzero(interpolated), doses):
+                planes[i] = dose
+        return planes
+
+    def get_mask(self, contours):
+        """
+        Rasterise the contours of a plane to the voxels of the dose grid
+        whose centres they contain. Contours inside other contours are
+        holes.
+        :param contours: list of (N, 2) numpy arrays of the x and y
+            coordinates of each contour.
+        :return: 2d boolean numpy array of the voxels inside the contours.
+        """
+        col_lut, row_lut = self.lut
+        mask = np.zeros((len(row_lut), len(col_lut)), dtype=bool)
+        for contour in contours:
+            x_min, y_min = contour.min(axis=0)
+            x_max, y_max = contour.max(axis=0)
+            if self.x_lut_index == 0:
+                cols = np.flatnonzero(
+                    (col_lut >= x_min) & (col_lut <= x_max))
+                rows = np.flatnonzero(
+                    (row_lut >= y_min) & (row_lut <= y_max))
+            else:
+                cols = np.flatnonzero(
+                    (col_lut >= y_min) & (col_lut <= y_max))
+                rows = np.flatnonzero(
+                    (row_lut >= x_min) & (row_lut <= x_max))
+            if not len(cols) or not len(rows):
+                continue
+
+            # Centres of the voxels within the bounding box of the contour
+            cols_grid, rows_grid = np.meshgrid(cols, rows)
+            if self.x_lut_index == 0:
+                points = np.column_stack((col_lut[cols_grid.ravel()],
+                                          row_lut[rows_grid.ravel()]))
+            else:
+                points = np.column_stack((row_lut[rows_grid.ravel()],
+                                          col_lut[cols_grid.ravel()]))
+            inside = Path(contour).contains_points(points)
+            inside = inside.reshape(len(rows), len(cols))
+            mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1] ^= inside
+        return mask
+
+
+def get_roi_planes(dataset_rtss):
+    """
+    Group the closed contours of every ROI by plane.
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :return: dictionary of ROINumber to a dictionary of plane position
+        (mm) to a list of (N, 2) numpy arrays of the contour coordinates
+    """
+    roi_planes = {}
+    for roi_contour in dataset_rtss.get('ROIContourSequence', []):
+        planes = roi_planes.setdefault(
+            int(roi_contour.ReferencedROINumber), {})
+        for contour in roi_contour.get('ContourSequence', []):
+            points = read_contour_data(contour).reshape(-1, 3)
+            # Planes are identified to 1/100th of a mm
+            z = round(float(points[0, 2]), 2)
+            planes.setdefault(z, []).append(points[:, :2])
+    return roi_planes
+
+
+def get_plane_thickness(z_positions):
+    """
+    :param z_positions: list of the plane positions (mm) of an ROI.
+    :return: The smallest distance between two planes, or 0 for a single
+        plane.
+    """
+    if len(z_positions) < 2:
+        return 0
+    return float(np.min(np.diff(np.sort(z_positions))))
+
+
+def calculate_dvhs(dataset_rtss, dataset_rtdose, rois, dict_thickness=None,
+                   dose_limit=None, dose_grid=None):
+    """
+    Calculate the cumulative DVHs of ROIs.
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :param dataset_rtdose: RTDOSE DICOM dataset object.
+    :param rois: Dictionary of ROI information, or iterable of
+        ROINumbers.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI. The thickness of other ROIs
+        is the distance between their planes.
+    :param dose_limit: Limit of dose (in cGy) for DVH calculation.
+    :param dose_grid: DoseGrid of the RTDOSE, to reuse its resampled
+        planes between calls.
+    :return: Dictionary of ROINumber to dicompylercore DVH.
+    """
+    if dict_thickness is None:
+        dict_thickness = {}
+    if dose_grid is None:
+        dose_grid = DoseGrid(dataset_rtdose)
+
+    names = {int(roi.ROINumber): roi.ROIName
+             for roi in dataset_rtss.get('StructureSetROISequence', [])}
+    roi_planes = get_roi_planes(dataset_rtss)
+    rois = list(rois)
+
+    if dose_grid.is_empty():
+        return {roi: empty_dvh(names.get(roi)) for roi in rois}
+    max_bin = dose_grid.max_dose_bin(dose_limit)
+
+    # Resample the dose once for the planes of all the ROIs
+    z_positions = sorted({z for roi in rois
+                          for z in roi_planes.get(roi, {})})
+    dose_planes = dict(zip(z_positions, dose_grid.get_planes(z_positions)))
+    origin_plane = None
+
+    # Rasterise every ROI, collecting the bin of each voxel in the dose
+    # grid and the number of voxels within the range of the bins
+    voxel_rois = []
+    voxel_bins = []
+    volumes = np.zeros(len(rois))
+    outside_dose_grid = set()
+    for i, roi in enumerate(rois):
+        planes = roi_planes.get(roi, {})
+        thickness = dict_thickness.get(roi)
+        if not thickness:
+            thickness = get_plane_thickness(list(planes))
+        voxel_count = 0
+        for z, contours in planes.items():
+            mask = dose_grid.get_mask(contours)
+            dose_plane = dose_planes[z]
+            in_dose_grid = bool(dose_plane.size)
+            if not in_dose_grid:
+                # The volume of contours outside of the dose grid is still
+                # calculated, from the first dose frame
+                if origin_plane is None:
+                    origin_plane = \
+                        dose_grid.get_planes([dose_grid.origin_z])[0]
+                dose_plane = origin_plane
+                outside_dose_grid.add(roi)
+            doses = dose_plane[mask]
+            doses = doses[(doses >= 0) & (doses <= max_bin)]
+            voxel_count += doses.size
+            if in_dose_grid:
+                bins = np.minimum(doses.astype(np.int64), max_bin - 1)
+                voxel_bins.append(bins)
+                voxel_rois.append(np.full(bins.size, i))
+        volumes[i] = voxel_count * dose_grid.pixel_area * thickness / 1000
+
+    # Histogram all the ROIs in one pass
+    histograms = np.zeros((len(rois), max_bin))
+    if voxel_bins:
+        histograms = np.bincount(
+            np.concatenate(voxel_rois) * max_bin
+            + np.concatenate(voxel_bins),
+            minlength=len(rois) * max_bin).reshape(len(rois), max_bin)
+
+    dict_dvh = {}
+    for i, roi in enumerate(rois):
+        if roi not in roi_planes or not roi_planes[roi]:
+            dict_dvh[roi] = empty_dvh(names.get(roi))
+        else:
+            notes = None
+            if roi in outside_dose_grid:
+                notes = OUTSIDE_DOSE_GRID_NOTES
+            dict_dvh[roi] = histogram_dvh(histograms[i], volumes[i],
+                                          notes, names.get(roi))
+    return dict_dvh
+
+
+def histogram_dvh(histogram, volume, notes, name):
+    """
+    :param histogram: Number of voxels of an ROI in each 1 cGy bin.
+    :param volume: Volume of the ROI in cm^3.
+    :param notes: Notes of the DVH.
+    :param name: Name of the ROI.
+    :return: Cumulative dicompylercore DVH of the ROI.
+    """
+    if histogram.max() <= 0:
+        return empty_dvh(name)
+    # Rescale the histogram to reflect the total volume
+    histogram = histogram * volume / histogram.sum()
+    # Remove the bins above the max dose for the structure
+    histogram = np.trim_zeros(histogram, trim='b')
+    return make_dvh(histogram, notes, name)
+
+
+def empty_dvh(name):
+    """
+    :param name: Name of the ROI.
+    :return: The DVH of an ROI without contours or dose.
+    """
+    return make_dvh(np.array([0]), 'Empty DVH', name)
+
+
+def make_dvh(histogram, notes, name):
+    """
+    :param histogram: Differential histogram of the ROI in 1 cGy bins.
+    :param notes: Notes of the DVH.
+    :param name: Name of the ROI.
+    :return: Cumulative dicompylercore DVH of the ROI.
+    """
+    if histogram.size == 1:
+        bins = np.arange(0, 2)
+    else:
+        bins = np.arange(0, histogram.size + 1) / 100
+    return dvh.DVH(counts=histogram, bins=bins, dvh_type='differential',
+                   dose_units='Gy', notes=notes, name=name).cumulative
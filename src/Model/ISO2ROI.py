@@ -1,10 +1,26 @@
+import logging
+import os
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+import numpy as np
 from skimage import measure
 from src.Controller.PathHandler import data_path
 from src.Model import ImageLoading
 from src.Model import ROI
-from src.Model.Isodose import get_dose_grid
+from src.Model.Isodose import get_dose_volume
 from src.Model.PatientDictContainer import PatientDictContainer
 
+# Maximum number of worker processes that trace isodose boundaries.
+ISO2ROI_MAX_WORKERS = ImageLoading.DVH_MAX_WORKERS
+
+# Number of slices whose boundaries are traced by each task of the pool.
+ISO2ROI_CHUNK_SIZE = 16
+
+# Seconds between checks of the interrupt flag while tracing boundaries.
+ISO2ROI_POLL_INTERVAL = 0.2
+
 
 class ISO2ROI:
     """This class is for converting isodose levels to ROIs."""
@@ -35,7 +51,13 @@ class ISO2ROI:
 
         # Calculate dose boundaries
         progress_callback.emit(("Calculating Boundaries", 50))
-        boundaries = self.calculate_isodose_boundaries(isodose_levels)
+        boundaries = self.calculate_isodose_boundaries(
+            isodose_levels, progress_callback, interrupt_flag)
+
+        # Stop loading
+        if interrupt_flag.is_set():
+            logging.info("Stopped ISO2ROI")
+            return False
 
         # Return if boundaries could not be calculated
         if not boundaries:
@@ -71,18 +93,30 @@ class ISO2ROI:
                                             int(items[0])]
         return isodose_levels
 
-    def calculate_isodose_boundaries(self, isodose_levels):
+    def calculate_isodose_boundaries(self, isodose_levels,
+                                     progress_callback=None,
+                                     interrupt_flag=None,
+                                     progress_range=(50, 75),
+                                     max_workers=None):
         """
-        Calculates isodose boundaries for each isodose level.
+        Calculates isodose boundaries for each isodose level. The
+        boundaries of every level on every slice are traced on a pool of
+        worker processes, from the dose volume resampled onto the slices.
+        :param isodose_levels: dictionary of isodose levels, from
+            get_iso_levels(..).
+        :param progress_callback: signal that receives the current
+                                  progress of the calculation.
+        :param interrupt_flag: interrupt flag to stop process
+        :param progress_range: tuple of the progress percentages at the
+            start and end of the calculation.
+        :param max_workers: Maximum number of worker processes, defaults
+            to ISO2ROI_MAX_WORKERS.
         :return: coutours, a list containing the countours for each
-                 isodose level.
+                 isodose level, or None if the prescription dose does not
+                 exist or the calculation was interrupted.
         """
         # Initialise variables needed to find isodose levels
         patient_dict_container = PatientDictContainer()
-        pixmaps = patient_dict_container.get("pixmaps_axial")
-        slider_min = 0
-        slider_max = len(pixmaps)
-
         rt_plan_dose = patient_dict_container.dataset['rtdose']
         rt_dose_dose = patient_dict_container.get("rx_dose_in_cgray")
 
@@ -90,32 +124,31 @@ class ISO2ROI:
         if not rt_dose_dose:
             return None
 
-        contours = {}
-
+        # Dose level of each isodose level, in the units of the dose grid
+        dose_levels = []
         for item in isodose_levels:
-            # Calculate boundaries for each isodose level for each slice
-            contours[item] = []
-            for slider_id in range(slider_min, slider_max):
-                contours[item].append([])
-                temp_ds = patient_dict_container.dataset[slider_id]
-                z = temp_ds.ImagePositionPatient[2]
-                grid = get_dose_grid(rt_plan_dose, float(z))
-
-                if not (grid == []):
-                    if isodose_levels[item][0]:
-                        dose_level = isodose_levels[item][1] / \
-                                     (rt_plan_dose.DoseGridScaling * 100)
-                        contours[item][slider_id] =\
-                            (measure.find_contours(grid, dose_level))
-                    else:
-                        dose_level = isodose_levels[item][1] * \
-                                     rt_dose_dose / \
-                                     (rt_plan_dose.DoseGridScaling * 10000)
-                        contours[item][slider_id] = \
-                            (measure.find_contours(grid, dose_level))
+            if isodose_levels[item][0]:
+                dose_levels.append(isodose_levels[item][1] /
+                                   (rt_plan_dose.DoseGridScaling * 100))
+            else:
+                dose_levels.append(isodose_levels[item][1] * rt_dose_dose /
+                                   (rt_plan_dose.DoseGridScaling * 10000))
+
+        def report_progress(fraction):
+            if progress_callback is not None:
+                start, end = progress_range
+                progress_callback.emit(("Calculating Boundaries",
+                                        int(start + (end - start) *
+                                            fraction)))
+
+        boundaries = calc_isodose_boundaries(
+            get_dose_volume(), dose_levels, interrupt_flag,
+            report_progress, max_workers)
+        if boundaries is None:
+            return None
 
         # Return list of contours for each isodose level for each slice
-        return contours
+        return dict(zip(isodose_levels, boundaries))
 
     def generate_roi(self, contours, progress_callback):
         """
@@ -137,6 +170,9 @@ class ISO2ROI:
             for roi in rois.StructureSetROISequence:
                 existing_rois.append(roi.ROIName)
 
+        # The contours of every level are added to the RTSS in one pass
+        rtss_builder = ROI.RTSSBuilder(dataset_rtss)
+
         # Loop through each isodose level
         for item in contours:
             # Delete ROI if it already exists to recreate it
@@ -189,15 +225,147 @@ class ISO2ROI:
                         single_array[j].append(rcs_pixels[1])
                         single_array[j].append(z_coord)
 
-                # Create the ROI(s)
+                # Collect the contours of the ROI(s)
                 for array in single_array:
-                    rtss = ROI.create_roi(dataset_rtss, item,
-                                          [{'coords': array, 'ds': dataset}],
-                                          "DOSE_REGION")
+                    rtss_builder.add_contour(item, array, dataset,
+                                             "DOSE_REGION")
 
-                    # Save the updated rtss
-                    patient_dict_container.set("dataset_rtss", rtss)
-                    patient_dict_container.set("rois",
-                                               ImageLoading.get_roi_info(rtss))
+        # Save the updated rtss
+        rtss = rtss_builder.build()
+        patient_dict_container.set("dataset_rtss", rtss)
+        patient_dict_container.set("rois", ImageLoading.get_roi_info(rtss))
 
         progress_callback.emit(("Writing to RT Structure Set", 85))
+
+
+def calc_isodose_boundaries(dose_volume, dose_levels, interrupt_flag=None,
+                            report_progress=None, max_workers=None):
+    """
+    Trace the boundaries of dose levels on every slice of a dose volume.
+    The slices are split into chunks of ISO2ROI_CHUNK_SIZE, which are
+    traced on a bounded pool of worker processes. The volume is written
+    to a temporary file once and memory mapped by every worker, so only
+    slice numbers and dose levels are sent to the workers.
+    :param dose_volume: Isodose.DoseVolume resampled onto the slices.
+    :param dose_levels: List of dose levels, in the units of the dose
+        grid.
+    :param interrupt_flag: A threading.Event() object that tells the
+        function to stop calculation.
+    :param report_progress: Function that receives the fraction of the
+        slices that have been traced.
+    :param max_workers: Maximum number of worker processes, defaults to
+        ISO2ROI_MAX_WORKERS.
+    :return: List of the boundaries of each dose level, where the
+        boundaries of a dose level are a list of the contours of each
+        slice, or None if the calculation was interrupted.
+    """
+    num_slices = len(dose_volume.rows)
+    boundaries = [[[] for _ in range(num_slices)] for _ in dose_levels]
+    slice_ids = [int(slice_id)
+                 for slice_id in np.flatnonzero(dose_volume.rows >= 0)]
+    tasks = [(slice_ids[i:i + ISO2ROI_CHUNK_SIZE],
+              [int(row) for row in
+               dose_volume.rows[slice_ids[i:i + ISO2ROI_CHUNK_SIZE]]],
+              dose_levels)
+             for i in range(0, len(slice_ids), ISO2ROI_CHUNK_SIZE)]
+    if max_workers is None:
+        max_workers = ISO2ROI_MAX_WORKERS
+    max_workers = min(max_workers, len(tasks))
+
+    def add_boundaries(chunk_boundaries, done):
+        for (level, slice_id), contours in chunk_boundaries.items():
+            boundaries[level][slice_id] = contours
+        if report_progress is not None:
+            report_progress(done / len(tasks))
+
+    # Starting a process costs more than tracing a single chunk
+    if max_workers <= 1:
+        for done, task in enumerate(tasks, start=1):
+            add_boundaries(trace_isodose_boundaries(
+                dose_volume.volume, *task), done)
+            if interrupt_flag is not None and interrupt_flag.is_set():
+                return None
+        return boundaries
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        volume_path = os.path.join(temp_dir, "dose_volume.npy")
+        np.save(volume_path, dose_volume.volume)
+
+        # Workers are spawned on every platform, as forking the threads
+        # of a running Qt application is not safe
+        executor = ProcessPoolExecutor(max_workers=max_workers,
+                                       mp_context=get_context("spawn"),
+                                       initializer=init_isodose_worker,
+                                       initargs=(volume_path,))
+        futures = []
+        try:
+            for task in tasks:
+                futures.append(executor.submit(calc_isodose_worker, *task))
+            pending = set(futures)
+            done = 0
+            while pending:
+                finished, pending = wait(pending,
+                                         timeout=ISO2ROI_POLL_INTERVAL,
+                                         return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done += 1
+                    add_boundaries(future.result(), done)
+                if interrupt_flag is not None and interrupt_flag.is_set():
+                    return None
+        finally:
+            # Tasks that have not started are cancelled, so an
+            # interrupted calculation does not wait for them
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    return boundaries
+
+
+def trace_isodose_boundaries(volume, slice_ids, rows, dose_levels):
+    """
+    Trace the boundaries of dose levels on a chunk of slices.
+    :param volume: Resampled dose volume.
+    :param slice_ids: List of the slice numbers of the chunk.
+    :param rows: List of the rows of the volume of the slices.
+    :param dose_levels: List of dose levels, in the units of the dose
+        grid.
+    :return: Dictionary of (index of the dose level, slice number) to the
+        list of contours.
+    """
+    chunk_boundaries = {}
+    for slice_id, row in zip(slice_ids, rows):
+        grid = volume[row]
+        for level, dose_level in enumerate(dose_levels):
+            chunk_boundaries[(level, slice_id)] = \
+                measure.find_contours(grid, dose_level)
+    return chunk_boundaries
+
+
+# Memory mapped dose volume of the isodose worker of the current process
+_isodose_worker_volume = None
+
+
+def init_isodose_worker(volume_path):
+    """
+    Memory map the dose volume used by calc_isodose_worker(..) in a
+    worker process.
+    :param volume_path: Path of the .npy file of the dose volume.
+    """
+    global _isodose_worker_volume
+    _isodose_worker_volume = np.load(volume_path, mmap_mode='r')
+
+
+def calc_isodose_worker(slice_ids, rows, dose_levels):
+    """
+    Trace the boundaries of a chunk of slices of the volume mapped by
+    init_isodose_worker(..). Runs in a worker process.
+    :param slice_ids: List of the slice numbers of the chunk.
+    :param rows: List of the rows of the volume of the slices.
+    :param dose_levels: List of dose levels, in the units of the dose
+        grid.
+    :return: Dictionary of (index of the dose level, slice number) to the
+        list of contours.
+    """
+    return trace_isodose_boundaries(_isodose_worker_volume, slice_ids,
+                                    rows, dose_levels)
@@ -11,6 +11,7 @@ from copy import deepcopy
 from pydicom.tag import Tag
 
 from src.constants import CT_RESCALE_INTERCEPT
+from src.Model.CalculateImages import LazyPixmaps
 from src.Controller.PathHandler import data_path
 
 from src.Model.PatientDictContainer import PatientDictContainer
@@ -341,11 +342,11 @@ def get_fused_window(level, window):
         window(any): the window (range) of windowing
     
     Return:
-        color_axial (QtGui.QPixmap): pixmap of the registered image from axial 
-        view
-        color_sagittal (QtGui.QPixmap): pixmap of the registered image from 
+        color_axial (FusedPixmaps): pixmaps of the registered image from
+        axial view
+        color_sagittal (FusedPixmaps): pixmaps of the registered image from
         sagittal view
-        color_coronal (QtGui.QPixmap): pixmap of the registered image from 
+        color_coronal (FusedPixmaps): pixmaps of the registered image from
         coronal view
         tfm (sitk.CompositeTransform): transformation object containing data 
         that is a product from linear_registration
@@ -364,28 +365,46 @@ def get_fused_window(level, window):
     sp_plane, _, sp_slice = old_images.GetSpacing()
     asp = (1.0 * sp_slice) / sp_plane
 
-    color_axial = {}
-    color_sagittal = {}
-    color_coronal = {}
-
     windowing = (int(level - CT_RESCALE_INTERCEPT), int(window))
 
-    for i in range(axial_slice_count):
-        color_axial[i] = \
-            get_fused_pixmap(old_images, fused_image[0], asp, i, "axial",
-                             windowing)
+    # Fused slices are rendered when they are first displayed
+    color_axial = FusedPixmaps(old_images, fused_image[0], asp, "axial",
+                               windowing, axial_slice_count)
+    color_sagittal = FusedPixmaps(old_images, fused_image[0], asp,
+                                  "sagittal", windowing, sagittal_slice_count)
+    color_coronal = FusedPixmaps(old_images, fused_image[0], asp, "coronal",
+                                 windowing, coronal_slice_count)
 
-    for i in range(sagittal_slice_count):
-        color_sagittal[i] = \
-            get_fused_pixmap(old_images, fused_image[0], asp, i, "sagittal",
-                             windowing)
+    return color_axial, color_sagittal, color_coronal, tfm
 
-    for i in range(coronal_slice_count):
-        color_coronal[i] = \
-            get_fused_pixmap(old_images, fused_image[0], asp, i, "coronal",
-                             windowing)
 
-    return color_axial, color_sagittal, color_coronal, tfm
+class FusedPixmaps(LazyPixmaps):
+    """
+    The pixmaps of one view of the fixed and moving images, rendered with
+    get_fused_pixmap when they are first looked up.
+    """
+
+    def __init__(self, orig_image, fused_image, aspect, view, windowing,
+                 num_slices):
+        """
+        Args:
+            orig_image(sitk): Image set from Primary/Fixed Image
+            fused_image(sitk): The registered Secondary/Moving Image
+            aspect(Any): currently not used
+            view(String): sagittal, coronal or axial
+            windowing: target level and window of the fused image
+            num_slices(int): number of slices in the view
+        """
+        super().__init__(num_slices)
+        self.orig_image = orig_image
+        self.fused_image = fused_image
+        self.aspect = aspect
+        self.view = view
+        self.windowing = windowing
+
+    def render(self, index):
+        return get_fused_pixmap(self.orig_image, self.fused_image,
+                                self.aspect, index, self.view, self.windowing)
 
 
 # Can be expanded to peform all of platipy's registrations
@@ -0,0 +1,82 @@
+"""
+Vectorised calculation of the pixel lookup tables (pixluts) that map
+image pixel indices to patient coordinates.
+"""
+import numpy as np
+
+
+def get_pixlut_parameters(img_ds):
+    """
+    Get the values of an image dataset that its pixlut depends on.
+    :param img_ds: DICOM(image) dataset
+    :return: tuple of the x scale, x origin, y scale, y origin, number of
+        columns and number of rows
+    """
+    # Physical distance (in mm) between the center of each image pixel,
+    # specified by a numeric pair
+    # - adjacent row spacing (delimiter) adjacent column spacing.
+    dist_row = float(img_ds.PixelSpacing[0])
+    dist_col = float(img_ds.PixelSpacing[1])
+    # The direction cosines of the first row and the first column with
+    # respect to the patient.
+    # 6 values inside: [Xx, Xy, Xz, Yx, Yy, Yz]
+    orientation = img_ds.ImageOrientationPatient
+    # The x, y, and z coordinates of the upper left hand corner
+    # (center of the first voxel transmitted) of the image, in mm.
+    # 3 values: [Sx, Sy, Sz]
+    position = img_ds.ImagePositionPatient
+
+    # Equation C.7.6.2.1-1.
+    # https://dicom.innolitics.com/ciods/rt-structure-set/roi-contour/30060039/30060040/30060050
+    # x of column i is M[0] . (i, 0, 0, 1) and y of row j is
+    # M[1] . (0, j, 0, 1)
+    return (float(orientation[0]) * dist_row, float(position[0]),
+            float(orientation[4]) * dist_col, float(position[1]),
+            int(img_ds.Columns), int(img_ds.Rows))
+
+
+def calculate_pixlut(img_ds):
+    """
+    Calculate the transformation matrix of a DICOM(image) dataset.
+    :param img_ds: DICOM(image) dataset
+    :return: pair of numpy arrays that represents the transformation
+        matrix
+    """
+    x_scale, x_origin, y_scale, y_origin, columns, rows = \
+        get_pixlut_parameters(img_ds)
+    x = x_origin + x_scale * np.arange(columns, dtype=float)
+    y = y_origin + y_scale * np.arange(rows, dtype=float)
+    return x, y
+
+
+def calculate_pixluts(datasets):
+    """
+    Calculate the pixluts of many image datasets. Datasets with the same
+    orientation, spacing, in-plane position and size share a single,
+    read-only pixlut, and the distinct pixluts of each image size are
+    calculated in one broadcast expression.
+    :param datasets: list of DICOM(image) datasets
+    :return: list of pixluts, in the order of the datasets
+    """
+    parameters = [get_pixlut_parameters(img_ds) for img_ds in datasets]
+    distinct = list(dict.fromkeys(parameters))
+
+    # Group the distinct parameters by image size
+    sizes = {}
+    for params in distinct:
+        sizes.setdefault(params[4:], []).append(params)
+
+    pixluts = {}
+    for (columns, rows), group in sizes.items():
+        values = np.array([params[:4] for params in group], dtype=float)
+        x_scale, x_origin, y_scale, y_origin = values.T
+        x = x_origin[:, np.newaxis] \
+            + x_scale[:, np.newaxis] * np.arange(columns, dtype=float)
+        y = y_origin[:, np.newaxis] \
+            + y_scale[:, np.newaxis] * np.arange(rows, dtype=float)
+        x.flags.writeable = False
+        y.flags.writeable = False
+        for i, params in enumerate(group):
+            pixluts[params] = (x[i], y[i])
+
+    return [pixluts[params] for params in parameters]
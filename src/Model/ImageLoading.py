@@ -18,16 +18,23 @@ function should not need to be added to. (Of course realistically this is
 not the case, however this alternative function promotes scalability and
 durability of the process).
 """
-import collections
+import copy
 import math
+import os
 import re
-from multiprocessing import Queue, Process
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, \
+    ThreadPoolExecutor, wait
+from multiprocessing import get_context
 
 import numpy as np
-from dicompylercore import dvhcalc
-from pydicom import dcmread
+from pydicom import Dataset, dcmread
 from pydicom.errors import InvalidDicomError
 
+from src.Model import DVHCache, DVHCalculator
+from src.Model.ImageGeometry import calculate_pixlut, calculate_pixluts
+from src.Model.RTSSIndex import get_rtss_index
+
 allowed_classes = {
     # CT Image
     "1.2.840.10008.5.1.4.1.1.2": {
@@ -72,6 +79,33 @@ allowed_classes = {
 }
 
 
+# Size above which element values of image slices are not read until they
+# are first accessed. Pixel data is always larger than this, so it is only
+# read (and decoded) when a slice's pixel array is needed.
+DEFERRED_READ_SIZE = "4 KB"
+
+# Maximum number of processes calculating DVHs at the same time. Each one
+# holds a copy of the RTSTRUCT and RTDOSE datasets.
+DVH_MAX_WORKERS = max(1, min(8, (os.cpu_count() or 1) - 1))
+
+# Number of ROIs whose DVHs are calculated by one task of a DVH worker
+DVH_CHUNK_SIZE = 25
+
+# Seconds between checks of the interrupt flag while DVHs are calculated
+DVH_POLL_INTERVAL = 0.2
+
+# Number of threads that run the background stages of loading a patient,
+# such as decoding the image volume and parsing the contours of the RTSS.
+LOADING_STAGE_WORKERS = 4
+
+# Seconds between checks of the interrupt flag while loading a patient
+# waits, such as for the answer to a prompt.
+LOADING_POLL_INTERVAL = 0.1
+
+_loading_executor = ThreadPoolExecutor(max_workers=LOADING_STAGE_WORKERS,
+                                       thread_name_prefix="LoadingStage")
+
+
 class NotRTSetError(Exception):
     pass
 
@@ -80,7 +114,33 @@ class NotAllowedClassError(Exception):
     pass
 
 
-def get_datasets(filepath_list, file_type=None):
+def read_dicom_file(file, defer_pixels=False):
+    """
+    Reads a DICOM file.
+    :param file: Path of the DICOM file.
+    :param defer_pixels: If True, element values larger than
+        DEFERRED_READ_SIZE (such as pixel data) are not read until they
+        are accessed.
+    :return: PyDicom Dataset object.
+    """
+    if defer_pixels:
+        return dcmread(file, defer_size=DEFERRED_READ_SIZE)
+    return dcmread(file)
+
+
+def load_deferred_elements(dataset):
+    """
+    Reads the values of all deferred elements of a dataset read with
+    defer_pixels, so it no longer depends on the file it was read from.
+    Needed for datasets that may be saved back over their own file.
+    :param dataset: PyDicom Dataset object.
+    """
+    # Accessing an element through the dataset reads its deferred value
+    for tag in dataset.keys():
+        dataset[tag]
+
+
+def get_datasets(filepath_list, file_type=None, defer_pixels=False):
     """
     This function generates two dictionaries: the dictionary of PyDicom
     datasets, and the dictionary of filepaths. These two dictionaries
@@ -91,6 +151,10 @@ def get_datasets(filepath_list, file_type=None):
     are filepaths pointing to the location of the .dcm file on the
     user's computer.
     :param filepath_list: List of all files to be searched.
+    :param file_type: Modality of the files to keep, or None for all.
+    :param defer_pixels: If True, the pixel data of image slices is only
+        read from file when the slice's pixel array is first accessed.
+        Sorting and metadata only need the slice headers.
     :return: Tuple (read_data_dict, file_names_dict)
     """
     read_data_dict = {}
@@ -100,7 +164,7 @@ def get_datasets(filepath_list, file_type=None):
     sr_count = 0
     for file in natural_sort(filepath_list):
         try:
-            read_file = dcmread(file)
+            read_file = read_dicom_file(file, defer_pixels)
         except InvalidDicomError:
             pass
         else:
@@ -110,6 +174,9 @@ def get_datasets(filepath_list, file_type=None):
                     slice_name = slice_count
                     slice_count += 1
                 else:
+                    # RT and SR datasets are edited and saved in place
+                    if defer_pixels:
+                        load_deferred_elements(read_file)
                     # Read from Series Description to determine what is
                     # stored in the SR file.
                     if allowed_class["name"] == "sr":
@@ -342,8 +409,12 @@ def get_thickness_dict(dataset_rtss, read_data_dict):
 
 
 def calc_dvhs(dataset_rtss, dataset_rtdose, rois, dict_thickness,
-              interrupt_flag, dose_limit=None):
+              interrupt_flag=None, dose_limit=None, dvh_cache=None):
     """
+    Calculate the DVHs of RTSTRUCT and RTDOSE datasets held in memory.
+    The datasets are written once to a temporary directory so that the
+    DVH worker processes only receive their file paths (the RTSTRUCT may
+    have been modified since it was read).
     :param dataset_rtss: RTSTRUCT DICOM dataset object.
     :param dataset_rtdose: RTDOSE DICOM dataset object.
     :param rois: Dictionary of ROI information.
@@ -352,63 +423,272 @@ def calc_dvhs(dataset_rtss, dataset_rtdose, rois, dict_thickness,
     :param interrupt_flag: A threading.Event() object that tells the
         function to stop calculation.
     :param dose_limit: Limit of dose for DVH calculation.
-    :return: Dictionary of all the DVHs of all the ROIs of the patient.
+    :param dvh_cache: DVHCache of previously calculated DVHs. Only the
+        DVHs of ROIs that are not in the cache are calculated.
+    :return: Dictionary of all the DVHs of all the ROIs of the patient, or
+        None if the calculation was interrupted.
     """
-    dict_dvh = {}
-    roi_list = []
-    for key in rois:
-        roi_list.append(key)
-
-    for roi in roi_list:
-        thickness = None
-        if roi in dict_thickness:
-            thickness = dict_thickness[roi]
-        dict_dvh[roi] = dvhcalc.get_dvh(dataset_rtss, dataset_rtdose, roi,
-                                        dose_limit, thickness=thickness)
-        if interrupt_flag.is_set():  # Stop calculating at the next DVH.
-            return
-
-    return dict_dvh
-
-
-def calc_dvh_worker(rtss, dose, roi, queue, thickness, dose_limit=None):
-    dvh = {}
-    dvh[roi] = \
-        dvhcalc.get_dvh(rtss, dose, roi, dose_limit, thickness=thickness)
-    queue.put(dvh)
+    dict_dvh, dict_keys = get_cached_dvhs(
+        dvh_cache, dataset_rtss, dataset_rtdose.SOPInstanceUID, rois,
+        dict_thickness, dose_limit)
+    missing = [roi for roi in rois if roi not in dict_dvh]
+    if missing:
+        with tempfile.TemporaryDirectory() as directory:
+            rtss_path = os.path.join(directory, "rtss.dcm")
+            rtdose_path = os.path.join(directory, "rtdose.dcm")
+            dataset_rtss.save_as(rtss_path)
+            dataset_rtdose.save_as(rtdose_path)
+            calculated = calc_dvhs_on_pool(rtss_path, rtdose_path, missing,
+                                           dict_thickness, interrupt_flag,
+                                           dose_limit)
+        if calculated is None:
+            return None
+        if dvh_cache is not None:
+            dvh_cache.update_dvhs(dict_keys, calculated)
+        dict_dvh.update(calculated)
+    return {roi: dict_dvh[roi] for roi in rois}
 
 
 def multi_calc_dvh(dataset_rtss, dataset_rtdose, rois, dict_thickness,
                    dose_limit=None):
     """
-    Multiprocessing variant of calc_dvh for fork-based platforms.
+    Calculate the DVHs of all the ROIs of the patient without interruption.
+    Kept for compatibility, calc_dvhs(..) is already multiprocessed.
     """
-    queue = Queue()
-    processes = []
-    dict_dvh = {}
+    return calc_dvhs(dataset_rtss, dataset_rtdose, rois, dict_thickness,
+                     dose_limit=dose_limit)
 
-    roi_list = []
-    for key in rois:
-        roi_list.append(key)
 
-    for i in range(len(roi_list)):
-        thickness = None
-        if roi_list[i] in dict_thickness:
-            thickness = dict_thickness[roi_list[i]]
-        p = Process(target=calc_dvh_worker,
-                    args=(dataset_rtss, dataset_rtdose, roi_list[i],
-                          queue, thickness, dose_limit,))
-        processes.append(p)
-        p.start()
+def calc_dvhs_in_process(dataset_rtss, dose_grid, rois, dict_thickness,
+                         dose_limit=None, dvh_cache=None):
+    """
+    Calculate the DVHs of a few ROIs in the current process, without
+    writing the datasets to files or starting worker processes.
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :param dose_grid: DVHCalculator.DoseGrid of the RTDOSE, which keeps
+        its resampled planes between calls.
+    :param rois: Dictionary of ROI information.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI.
+    :param dose_limit: Limit of dose for DVH calculation.
+    :param dvh_cache: DVHCache of previously calculated DVHs. Only the
+        DVHs of ROIs that are not in the cache are calculated.
+    :return: Dictionary of ROINumber to DVH.
+    """
+    dict_dvh, dict_keys = get_cached_dvhs(
+        dvh_cache, dataset_rtss, dose_grid.sop_instance_uid, rois,
+        dict_thickness, dose_limit)
+    missing = [roi for roi in rois if roi not in dict_dvh]
+    if missing:
+        calculated = DVHCalculator.calculate_dvhs(
+            dataset_rtss, None, missing, dict_thickness, dose_limit,
+            dose_grid=dose_grid)
+        if dvh_cache is not None:
+            dvh_cache.update_dvhs(dict_keys, calculated)
+        dict_dvh.update(calculated)
+    return {roi: dict_dvh[roi] for roi in rois}
+
+
+def copy_rtss_contours(dataset_rtss, rois):
+    """
+    Copy the parts of an RTSTRUCT that the DVH calculation reads: the
+    names and contours of some of its ROIs. The ContourSequence items are
+    shallow copies that share their data elements with the RTSTRUCT, as
+    editing an RTSTRUCT adds and removes contours rather than changing
+    them. The copy can therefore be taken on the GUI thread after every
+    edit, and read by DVH workers while the RTSTRUCT is edited again.
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :param rois: Iterable of the ROINumbers to copy.
+    :return: RTSTRUCT DICOM dataset object with the ROIs' contours.
+    """
+    rois = set(rois)
+    rtss_copy = Dataset()
+    rtss_copy.StructureSetROISequence = []
+    for roi in dataset_rtss.get('StructureSetROISequence', []):
+        if roi.ROINumber in rois:
+            roi_copy = Dataset()
+            roi_copy.ROINumber = roi.ROINumber
+            roi_copy.ROIName = roi.get('ROIName')
+            rtss_copy.StructureSetROISequence.append(roi_copy)
+    rtss_copy.ROIContourSequence = []
+    for roi_contour in dataset_rtss.get('ROIContourSequence', []):
+        if roi_contour.ReferencedROINumber in rois:
+            roi_contour_copy = Dataset()
+            roi_contour_copy.ReferencedROINumber = \
+                roi_contour.ReferencedROINumber
+            roi_contour_copy.ContourSequence = [
+                copy.copy(contour)
+                for contour in roi_contour.get('ContourSequence', [])]
+            rtss_copy.ROIContourSequence.append(roi_contour_copy)
+    return rtss_copy
+
+
+def get_cached_dvhs(dvh_cache, dataset_rtss, rtdose_uid, rois,
+                    dict_thickness, dose_limit=None):
+    """
+    :param dvh_cache: DVHCache of previously calculated DVHs, or None.
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :param rtdose_uid: SOPInstanceUID of the RTDOSE.
+    :param rois: Dictionary of ROI information.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI.
+    :param dose_limit: Limit of dose for DVH calculation.
+    :return: Tuple of the dictionary of cached DVHs and the dictionary of
+        the cache keys of all the ROIs.
+    """
+    if dvh_cache is None:
+        return {}, {}
+    dict_keys = DVHCache.get_dvh_keys(dataset_rtss, rtdose_uid, rois,
+                                      dict_thickness, dose_limit)
+    return dvh_cache.get_dvhs(dict_keys, rois), dict_keys
 
-    for process in processes:
-        dvh = queue.get()
-        dict_dvh.update(dvh)
 
-    for process in processes:
-        process.join()
+def calc_dvhs_from_files(rtss_path, rtdose_path, rois, dict_thickness,
+                         interrupt_flag=None, dose_limit=None,
+                         dvh_cache=None):
+    """
+    Calculate the DVHs of all the ROIs of an RTSTRUCT file.
+    :param rtss_path: Path of the RTSTRUCT file.
+    :param rtdose_path: Path of the RTDOSE file.
+    :param rois: Dictionary of ROI information.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI.
+    :param interrupt_flag: A threading.Event() object that tells the
+        function to stop calculation.
+    :param dose_limit: Limit of dose for DVH calculation.
+    :param dvh_cache: DVHCache of previously calculated DVHs. Only the
+        DVHs of ROIs that are not in the cache are calculated.
+    :return: Dictionary of all the DVHs of all the ROIs of the patient, or
+        None if the calculation was interrupted.
+    """
+    dict_dvh, dict_keys = {}, {}
+    if dvh_cache is not None:
+        rtdose_uid = dcmread(rtdose_path,
+                             stop_before_pixels=True).SOPInstanceUID
+        dict_dvh, dict_keys = get_cached_dvhs(
+            dvh_cache, dcmread(rtss_path), rtdose_uid, rois,
+            dict_thickness, dose_limit)
+
+    missing = [roi for roi in rois if roi not in dict_dvh]
+    if missing:
+        calculated = calc_dvhs_on_pool(rtss_path, rtdose_path, missing,
+                                       dict_thickness, interrupt_flag,
+                                       dose_limit)
+        if calculated is None:
+            return None
+        if dvh_cache is not None:
+            dvh_cache.update_dvhs(dict_keys, calculated)
+        dict_dvh.update(calculated)
+    return {roi: dict_dvh[roi] for roi in rois}
+
+
+def calc_dvhs_on_pool(rtss_path, rtdose_path, rois, dict_thickness,
+                      interrupt_flag=None, dose_limit=None, max_workers=None):
+    """
+    Calculate the DVHs of ROIs of an RTSTRUCT file. Large
+    structure sets are split into chunks of DVH_CHUNK_SIZE ROIs, which
+    are calculated on a bounded pool of worker processes. Each worker
+    reads the RTSTRUCT and RTDOSE files once, so only file paths and ROI
+    numbers are sent between processes, and the pool works with the
+    spawn start method of Windows and macOS.
+    :param rtss_path: Path of the RTSTRUCT file.
+    :param rtdose_path: Path of the RTDOSE file.
+    :param rois: List of ROINumbers.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI.
+    :param interrupt_flag: A threading.Event() object that tells the
+        function to stop calculation.
+    :param dose_limit: Limit of dose for DVH calculation.
+    :param max_workers: Maximum number of worker processes, defaults to
+        DVH_MAX_WORKERS.
+    :return: Dictionary of ROINumber to DVH, or None if the calculation
+        was interrupted.
+    """
+    roi_list = list(rois)
+    tasks = []
+    for i in range(0, len(roi_list), DVH_CHUNK_SIZE):
+        chunk = roi_list[i:i + DVH_CHUNK_SIZE]
+        chunk_thickness = {roi: dict_thickness[roi] for roi in chunk
+                           if roi in dict_thickness}
+        tasks.append((chunk, chunk_thickness, dose_limit))
+    if max_workers is None:
+        max_workers = DVH_MAX_WORKERS
+    max_workers = min(max_workers, len(tasks))
 
-    return dict_dvh
+    dict_dvh = {}
+    if not tasks:
+        return dict_dvh
+
+    # Starting a process costs more than calculating a single chunk
+    if max_workers <= 1:
+        dataset_rtss = dcmread(rtss_path)
+        dose_grid = DVHCalculator.DoseGrid(dcmread(rtdose_path))
+        for chunk, chunk_thickness, limit in tasks:
+            dict_dvh.update(DVHCalculator.calculate_dvhs(
+                dataset_rtss, None, chunk, chunk_thickness, limit,
+                dose_grid=dose_grid))
+            if interrupt_flag is not None and interrupt_flag.is_set():
+                return None
+        return dict_dvh
+
+    # Workers are spawned on every platform, as forking the threads of a
+    # running Qt application is not safe
+    executor = ProcessPoolExecutor(max_workers=max_workers,
+                                   mp_context=get_context("spawn"),
+                                   initializer=init_dvh_worker,
+                                   initargs=(rtss_path, rtdose_path))
+    futures = []
+    try:
+        for task in tasks:
+            futures.append(executor.submit(calc_dvh_worker, *task))
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=DVH_POLL_INTERVAL,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                dict_dvh.update(future.result())
+            if interrupt_flag is not None and interrupt_flag.is_set():
+                return None
+    finally:
+        # Tasks that have not started are cancelled, so an interrupted
+        # calculation does not wait for them
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+    return {roi: dict_dvh[roi] for roi in roi_list}
+
+
+# RTSTRUCT dataset and dose grid of the DVH worker of the current process
+_dvh_worker_data = None
+
+
+def init_dvh_worker(rtss_path, rtdose_path):
+    """
+    Read the RTSTRUCT and RTDOSE files used by calc_dvh_worker(..) in
+    a worker process.
+    :param rtss_path: Path of the RTSTRUCT file.
+    :param rtdose_path: Path of the RTDOSE file.
+    """
+    global _dvh_worker_data
+    _dvh_worker_data = (dcmread(rtss_path),
+                        DVHCalculator.DoseGrid(dcmread(rtdose_path)))
+
+
+def calc_dvh_worker(rois, dict_thickness, dose_limit=None):
+    """
+    Calculate the DVHs of a chunk of ROIs from the files read by
+    init_dvh_worker(..).
+    :param rois: List of ROINumbers.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI.
+    :param dose_limit: Limit of dose for DVH calculation.
+    :return: Dictionary of ROINumber to DVH.
+    """
+    dataset_rtss, dose_grid = _dvh_worker_data
+    return DVHCalculator.calculate_dvhs(dataset_rtss, None, rois,
+                                        dict_thickness, dose_limit,
+                                        dose_grid=dose_grid)
 
 
 def converge_to_0_dvh(raw_dvh):
@@ -454,76 +734,13 @@ def get_raw_contour_data(dataset_rtss):
     """
     :param dataset_rtss: RTSTRUCT DICOM dataset object.
     :return: Tuple (dict_roi, dict_numpoints) raw contour data of the
-        ROIs.
+        ROIs, where dict_roi is a dictionary of ROIName to ROIContours.
     """
-    dict_id = {}
-    for i, elem in enumerate(dataset_rtss.StructureSetROISequence):
-        roi_number = elem.ROINumber
-        roi_name = elem.ROIName
-        dict_id[roi_number] = roi_name
-
-    dict_roi = {}
-    dict_numpoints = {}
-    for roi in dataset_rtss.ROIContourSequence:
-        referenced_roi_number = roi.ReferencedROINumber
-        roi_name = dict_id[referenced_roi_number]
-        dict_contour = collections.defaultdict(list)
-        roi_points_count = 0
-        if 'ContourSequence' in roi:
-            for roi_slice in roi.ContourSequence:
-                if 'ContourImageSequence' in roi_slice:
-                    for contour_img in roi_slice.ContourImageSequence:
-                        referenced_sop_instance_uid = \
-                            contour_img.ReferencedSOPInstanceUID
-                    contour_geometric_type = roi_slice.ContourGeometricType
-                    number_of_contour_points = roi_slice.NumberOfContourPoints
-                    roi_points_count += int(number_of_contour_points)
-                    contour_data = roi_slice.ContourData
-                    dict_contour[
-                        referenced_sop_instance_uid].append(contour_data)
-        dict_roi[roi_name] = dict_contour
-        dict_numpoints[roi_name] = roi_points_count
-
-    return dict_roi, dict_numpoints
+    return get_rtss_index(dataset_rtss).get_raw_contour_data()
 
 
 def calculate_matrix(img_ds):
-    # Physical distance (in mm) between the center of each image pixel,
-    # specified by a numeric pair
-    # - adjacent row spacing (delimiter) adjacent column spacing.
-    dist_row = img_ds.PixelSpacing[0]
-    dist_col = img_ds.PixelSpacing[1]
-    # The direction cosines of the first row and the first column
-    # with respect to the patient.
-    # 6 values inside: [Xx, Xy, Xz, Yx, Yy, Yz]
-    orientation = img_ds.ImageOrientationPatient
-    # The x, y, and z coordinates of the upper left hand corner
-    # (center of the first voxel transmitted) of the image, in mm.
-    # 3 values: [Sx, Sy, Sz]
-    position = img_ds.ImagePositionPatient
-
-    # Equation C.7.6.2.1-1.
-    # https://dicom.innolitics.com/ciods/rt-structure-set/roi-contour/30060039/30060040/30060050
-    matrix_m = np.matrix(
-        [[orientation[0] * dist_row, orientation[3] * dist_col, 0,
-          position[0]],
-         [orientation[1] * dist_row, orientation[4] * dist_col, 0,
-          position[1]],
-         [orientation[2] * dist_row, orientation[5] * dist_col, 0,
-          position[2]],
-         [0, 0, 0, 1]]
-    )
-    x = []
-    y = []
-    for i in range(0, img_ds.Columns):
-        i_mat = matrix_m * np.matrix([[i], [0], [0], [1]])
-        x.append(float(i_mat[0]))
-
-    for j in range(0, img_ds.Rows):
-        j_mat = matrix_m * np.matrix([[0], [j], [0], [1]])
-        y.append(float(j_mat[1]))
-
-    return np.array(x), np.array(y)
+    return calculate_pixlut(img_ds)
 
 
 def get_pixluts(read_data_dict):
@@ -531,18 +748,19 @@ def get_pixluts(read_data_dict):
     :param read_data_dict: Dictionary of all DICOM dataset objects.
     :return: Dictionary of pixluts for the transformation from 3D to 2D.
     """
-    dict_pixluts = {}
     non_img_type = ['rtdose', 'rtplan', 'rtss', 'rtimage']
+    img_datasets = []
     for ds in read_data_dict:
         if ds not in non_img_type:
             if isinstance(ds, str) and ds[0:3] == 'sr-':
                 continue
             else:
-                img_ds = read_data_dict[ds]
-                pixlut = calculate_matrix(img_ds)
-                dict_pixluts[img_ds.SOPInstanceUID] = pixlut
+                img_datasets.append(read_data_dict[ds])
 
-    return dict_pixluts
+    # Slices with the same geometry share one pixlut
+    pixluts = calculate_pixluts(img_datasets)
+    return {img_ds.SOPInstanceUID: pixlut
+            for img_ds, pixlut in zip(img_datasets, pixluts)}
 
 
 def get_image_uid_list(dataset):
@@ -567,3 +785,15 @@ def get_image_uid_list(dataset):
                 uid_list.append(dataset[key].SOPInstanceUID)
 
     return uid_list
+
+
+def start_loading_stage(fn, *args):
+    """
+    Start a stage of loading a patient on a background thread. The future
+    of the stage is not meant to be stored or waited for: the image loader
+    delivers the result of the stage to the GUI thread when it finishes.
+    :param fn: The function of the stage.
+    :param args: The function's parameters.
+    :return: concurrent.futures.Future of the result of the stage.
+    """
+    return _loading_executor.submit(fn, *args)
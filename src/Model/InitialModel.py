@@ -79,7 +79,11 @@ def create_initial_model():
 
     patient_dict_container.set("dict_windowing", dict_windowing)
 
-    if not patient_dict_container.has_attribute("scaled"):
+    if patient_dict_container.has_attribute("pixel_values"):
+        # Set by the image loader, which may still be decoding the volume
+        # in the background
+        pixel_values = patient_dict_container.get("pixel_values")
+    elif not patient_dict_container.has_attribute("scaled"):
         patient_dict_container.set("scaled", True)
         pixel_values = convert_raw_data(dataset, False, is_ct)
     else:
@@ -92,14 +96,8 @@ def create_initial_model():
     pixmap_aspect["axial"] = pixel_spacing[1] / pixel_spacing[0]
     pixmap_aspect["sagittal"] = pixel_spacing[1] / slice_thickness
     pixmap_aspect["coronal"] = slice_thickness / pixel_spacing[0]
-    pixmaps_axial, pixmaps_coronal, pixmaps_sagittal = \
-        get_pixmaps(pixel_values, window, level, pixmap_aspect)
-
-    patient_dict_container.set("pixmaps_axial", pixmaps_axial)
-    patient_dict_container.set("pixmaps_coronal", pixmaps_coronal)
-    patient_dict_container.set("pixmaps_sagittal", pixmaps_sagittal)
-    patient_dict_container.set("pixel_values", pixel_values)
     patient_dict_container.set("pixmap_aspect", pixmap_aspect)
+    set_pixel_values(pixel_values)
 
     basic_info = get_basic_info(dataset[0])
     patient_dict_container.set("basic_info", basic_info)
@@ -109,9 +107,13 @@ def create_initial_model():
     # Set RTSS attributes
     patient_dict_container.set("file_rtss", filepaths['rtss'])
     patient_dict_container.set("dataset_rtss", dataset['rtss'])
-    dict_raw_contour_data, dict_numpoints = \
-        ImageLoading.get_raw_contour_data(dataset['rtss'])
-    patient_dict_container.set("raw_contour", dict_raw_contour_data)
+    # The contours may still be parsed in the background by the image
+    # loader
+    if not patient_dict_container.has_attribute("raw_contour") \
+            and not patient_dict_container.is_loading("raw_contour"):
+        dict_raw_contour_data, dict_numpoints = \
+            ImageLoading.get_raw_contour_data(dataset['rtss'])
+        patient_dict_container.set("raw_contour", dict_raw_contour_data)
 
     # dict_dicom_tree_rtss will be set in advance if the program
     # generates a new rtss through the execution of
@@ -171,6 +173,26 @@ def create_initial_model():
                                    dicom_tree_sr_pyrad.dict)
 
 
+def set_pixel_values(pixel_values):
+    """
+    Sets the pixel values of the patient, and the axial, coronal and
+    sagittal pixmaps rendered from them with the current window and level.
+    This is called again when the image loader has finished decoding the
+    volume after the main window was created.
+    :param pixel_values: A 3D array of converted pixel values
+    """
+    patient_dict_container = PatientDictContainer()
+    pixmaps_axial, pixmaps_coronal, pixmaps_sagittal = \
+        get_pixmaps(pixel_values, patient_dict_container.get("window"),
+                    patient_dict_container.get("level"),
+                    patient_dict_container.get("pixmap_aspect"))
+
+    patient_dict_container.set("pixmaps_axial", pixmaps_axial)
+    patient_dict_container.set("pixmaps_coronal", pixmaps_coronal)
+    patient_dict_container.set("pixmaps_sagittal", pixmaps_sagittal)
+    patient_dict_container.set("pixel_values", pixel_values)
+
+
 def create_initial_model_batch():
     """
     This function initializes all the attributes in the PatientDictContainer
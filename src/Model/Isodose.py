@@ -1,7 +1,13 @@
 """ Contains functions required for isodose display """
 
+import threading
+
 import numpy as np
+from skimage import measure
 
+import src.constants as constant
+from src.Model.ImageGeometry import calculate_pixluts
+from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.ROI import calculate_matrix
 
 
@@ -44,64 +50,257 @@ def get_dose_pixluts(dict_ds):
                         SOPInstanceUID as key
     """
 
-    dict_dose_pixluts = {}
-    dict_dose_pixluts = {}
     non_img_type = ['rtdose', 'rtplan', 'rtss', 'rtimage']
-    dose_data = calculate_matrix(dict_ds['rtdose'])
+    img_datasets = []
     for ds in dict_ds:
         if ds not in non_img_type:
             if isinstance(ds, str) and ds[0:3] == 'sr-':
                 continue
             else:
-                img_ds = dict_ds[ds]
-                pixlut = calculate_matrix(img_ds)
-                dose_pixlut = get_dose_pixels(pixlut, dose_data, img_ds)
-                dict_dose_pixluts[img_ds.SOPInstanceUID] = dose_pixlut
+                img_datasets.append(dict_ds[ds])
+
+    dose_data = calculate_matrix(dict_ds['rtdose'])
+    pixluts = calculate_pixluts(img_datasets)
+
+    # Slices that share a pixlut and patient position share a dose pixlut
+    dict_dose_pixluts = {}
+    shared_dose_pixluts = {}
+    for img_ds, pixlut in zip(img_datasets, pixluts):
+        key = (id(pixlut), img_ds.PatientPosition)
+        if key not in shared_dose_pixluts:
+            shared_dose_pixluts[key] = \
+                get_dose_pixels(pixlut, dose_data, img_ds)
+        dict_dose_pixluts[img_ds.SOPInstanceUID] = shared_dose_pixluts[key]
 
     return dict_dose_pixluts
 
 
 def get_dose_grid(rtd, z=0):
     """
-    Return the 2d dose grid for the given slice position (mm). 
+    Return the 2d dose grid for the given slice position (mm).
     Based on the function GetDoseGrid in dicompyler-core
     (https://github.com/dicompyler/dicompyler-core/blob/master/dicompylercore/dicomparser.py)
 
     :param rtd:     Data from RTDose file
     :param z:       Position of slice in mm
-    :return:        Dose grid as a 2d numpy array
+    :return:        Dose grid as a 2d numpy array, or an empty array if the
+                    position is outside the dose grid
     """
+    return DoseVolume(rtd, [z]).get_grid(0)
 
-    if 'GridFrameOffsetVector' in rtd:
-        z = float(z)
 
-        planes = rtd.ImageOrientationPatient[0] \
-                 * np.array(rtd.GridFrameOffsetVector) \
-                 + rtd.ImagePositionPatient[2]
-        frame = -1
+class DoseVolume:
+    """
+    The dose grid of an RTDOSE resampled onto the positions of the image
+    slices. The planes and interpolation weights of every slice are found
+    at once and the slices are resampled into a single volume, so
+    isodoses can be drawn for any slice without interpolating the dose
+    grid again.
 
-        if np.amin(np.fabs(planes - z)) < 0.5:
-            frame = np.argmin(np.fabs(planes - z))
-            return rtd.pixel_array[frame]
+    Example usage:
+    dose_volume = get_dose_volume()
+    grid = dose_volume.get_grid(slider_id)
+    """
+
+    def __init__(self, dataset_rtdose, slice_positions, dtype=None):
+        """
+        :param dataset_rtdose: RTDOSE DICOM dataset object.
+        :param slice_positions: z position (mm) of every image slice.
+        :param dtype: Data type of the resampled dose grid, defaults to
+            constants.DOSE_VOLUME_DTYPE. float32 halves the memory used.
+        """
+        self.dataset_rtdose = dataset_rtdose
+        self.dtype = np.dtype(dtype or constant.DOSE_VOLUME_DTYPE)
+        self.slice_positions = np.array(slice_positions, dtype=float)
+
+        # Row of the volume of every slice, -1 when the slice is outside
+        # the dose grid
+        self.rows = np.full(len(self.slice_positions), -1)
+        self.volume = None
+        self.resample()
+
+    def resample(self):
+        """
+        Resample the dose grid onto the slice positions. A slice within
+        0.5mm of a dose plane takes that plane, and a slice between two
+        planes is linearly interpolated.
+        """
+        rtd = self.dataset_rtdose
+        if 'GridFrameOffsetVector' in rtd:
+            planes = rtd.ImageOrientationPatient[0] \
+                     * np.array(rtd.GridFrameOffsetVector, dtype=float) \
+                     + rtd.ImagePositionPatient[2]
+        else:
+            planes = np.array([rtd.ImagePositionPatient[2]], dtype=float)
 
-        if (z > np.amin(planes)) or (z < np.amax(planes)):
-            u_min = np.fabs(planes - z)
-            l_min = u_min.copy()
-            ub = np.argmin(u_min)
+        z = self.slice_positions
+        distance = np.fabs(planes[np.newaxis, :] - z[:, np.newaxis])
+        # Nearest plane (ub) and second nearest plane (lb) of every slice
+        ub = np.argmin(distance, axis=1)
+        second = distance.copy()
+        second[np.arange(len(z)), ub] = np.inf
+        lb = np.argmin(second, axis=1) if len(planes) > 1 else ub
 
-            l_min[ub] = np.amax(u_min)
-            lb = np.argmin(l_min)
+        on_plane = distance[np.arange(len(z)), ub] < 0.5
+        between = ~on_plane & (z > np.amin(planes)) & (z < np.amax(planes))
+        inside = on_plane | between
+        self.rows[inside] = np.arange(np.count_nonzero(inside))
 
-            # Fractional distance from bottom to top
-            # Plane is at upper plane if 1, lower plane if 0
+        # Fractional distance from bottom to top
+        # Plane is at upper plane if 1, lower plane if 0
+        with np.errstate(divide='ignore', invalid='ignore'):
             fz = (z - planes[lb]) / (planes[ub] - planes[lb])
 
-            plane = fz * rtd.pixel_array[ub] \
-                    + (1.0 - fz) * rtd.pixel_array[lb]
+        pixel_array = rtd.pixel_array
+        if pixel_array.ndim == 2:
+            pixel_array = pixel_array[np.newaxis]
+        self.volume = np.empty(
+            (np.count_nonzero(inside),) + pixel_array.shape[1:],
+            dtype=self.dtype)
+
+        # Every slice is written in place, so no temporary volume is made
+        for i in np.flatnonzero(inside):
+            grid = self.volume[self.rows[i]]
+            if on_plane[i]:
+                grid[...] = pixel_array[ub[i]]
+            else:
+                np.multiply(pixel_array[ub[i]], fz[i], out=grid,
+                            casting='unsafe')
+                grid += (1.0 - fz[i]) * pixel_array[lb[i]]
+
+    def get_grid(self, slice_id):
+        """
+        Get the resampled dose grid of a slice.
+        :param slice_id: Index of the image slice.
+        :return: Dose grid as a 2d numpy array, or an empty array if the
+            slice is outside the dose grid.
+        """
+        row = self.rows[slice_id]
+        if row < 0:
+            return np.array([])
+        return self.volume[row]
+
 
-            return plane
+def get_dose_volume():
+    """
+    Get the dose volume of the patient's RTDOSE, resampled onto the image
+    slices. The volume is resampled the first time it is needed, and
+    again only when the RTDOSE is replaced.
+    :return: DoseVolume of the RTDOSE in the PatientDictContainer.
+    """
+    patient_dict_container = PatientDictContainer()
+    dataset = patient_dict_container.dataset
+    dose_volume = patient_dict_container.get("dose_volume")
+    if dose_volume is None \
+            or dose_volume.dataset_rtdose is not dataset['rtdose']:
+        slice_ids = sorted(key for key in dataset if isinstance(key, int))
+        slice_positions = [float(dataset[i].ImagePositionPatient[2])
+                           for i in slice_ids]
+        dose_volume = DoseVolume(dataset['rtdose'], slice_positions)
+        patient_dict_container.set("dose_volume", dose_volume)
+    return dose_volume
+
+
+class IsodoseContourCache:
+    """
+    Cache of the isodose contours of a dose volume, keyed by slice, isodose
+    percentage and prescription dose, so the contours of a slice are only
+    traced once while it is scrolled past. The contours of neighbouring
+    slices can be traced in the background with prefetch(..).
+
+    Example usage:
+    contour_cache = get_isodose_contour_cache()
+    contours = contour_cache.get_contours(slider_id, 95, rx_dose_in_cgray)
+    """
+
+    def __init__(self, dose_volume):
+        """
+        :param dose_volume: DoseVolume the contours are traced in.
+        """
+        self.dose_volume = dose_volume
+        self.contours = {}
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def get_contours(self, slice_id, dose, rx_dose):
+        """
+        Get the contours of an isodose on a slice, tracing them if they are
+        not cached.
+        :param slice_id: Index of the image slice.
+        :param dose: Isodose as a percentage of the prescription dose.
+        :param rx_dose: Prescription dose in cGy.
+        :return: List of contours, as returned by measure.find_contours.
+        """
+        key = (slice_id, dose, rx_dose)
+        with self.lock:
+            if key in self.contours:
+                return self.contours[key]
 
-        return np.array([])
+        grid = self.dose_volume.get_grid(slice_id)
+        if grid.size:
+            dose_level = dose * rx_dose / \
+                (self.dose_volume.dataset_rtdose.DoseGridScaling * 10000)
+            contours = measure.find_contours(grid, dose_level)
+        else:
+            contours = []
+
+        with self.lock:
+            self.contours[key] = contours
+            self.pending.discard(key)
+        return contours
+
+    def retain(self, doses, rx_dose):
+        """
+        Remove the contours of isodoses that are no longer displayed.
+        :param doses: List of the displayed isodose percentages.
+        :param rx_dose: Prescription dose in cGy.
+        """
+        doses = set(doses)
+        with self.lock:
+            self.contours = {key: contours
+                             for key, contours in self.contours.items()
+                             if key[1] in doses and key[2] == rx_dose}
+
+    def get_missing(self, slice_ids, doses, rx_dose):
+        """
+        Get the keys of contours that are neither cached nor being
+        prefetched, and mark them as being prefetched.
+        :param slice_ids: Indices of the image slices.
+        :param doses: List of isodose percentages.
+        :param rx_dose: Prescription dose in cGy.
+        :return: List of (slice id, dose, rx dose) keys.
+        """
+        with self.lock:
+            missing = [(slice_id, dose, rx_dose)
+                       for slice_id in slice_ids for dose in doses
+                       if (slice_id, dose, rx_dose) not in self.contours
+                       and (slice_id, dose, rx_dose) not in self.pending]
+            self.pending.update(missing)
+        return missing
+
+    def prefetch(self, keys):
+        """
+        Trace the contours of keys from get_missing(..). Called on a
+        background thread.
+        :param keys: List of (slice id, dose, rx dose) keys.
+        """
+        for key in keys:
+            self.get_contours(*key)
+
+
+def get_isodose_contour_cache():
+    """
+    Get the isodose contour cache of the patient's dose volume. A new cache
+    is made when the dose volume is resampled.
+    :return: IsodoseContourCache of the PatientDictContainer.
+    """
+    patient_dict_container = PatientDictContainer()
+    dose_volume = get_dose_volume()
+    contour_cache = patient_dict_container.get("isodose_contour_cache")
+    if contour_cache is None or contour_cache.dose_volume is not dose_volume:
+        contour_cache = IsodoseContourCache(dose_volume)
+        patient_dict_container.set("isodose_contour_cache", contour_cache)
+    return contour_cache
 
 
 def calculate_rx_dose_in_cgray(rtplan):
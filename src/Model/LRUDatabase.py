@@ -0,0 +1,106 @@
+"""
+Base class of the persistent caches kept in SQLite databases in the
+OnkoDICOM hidden directory, whose entries are removed least recently used
+first once a cache is full.
+"""
+import os
+import sqlite3
+from pathlib import Path
+
+
+class LRUDatabase:
+    """
+    A SQLite table in the OnkoDICOM hidden directory that holds no more
+    than max_entries entries. Every entry has a last_used column with the
+    time the entry was last read or written.
+
+    A new connection is opened for every operation, so a single instance
+    can be used from the GUI thread and from worker threads.
+
+    Subclasses set the table attributes below, and call
+    remove_least_recently_used(..) after adding entries.
+    """
+
+    # Name of the table
+    table_name = None
+    # SQL definitions of the columns of the table, apart from last_used
+    table_columns = ()
+    # Columns of the table that are indexed
+    indexed_columns = ()
+
+    def __init__(self, db_file, max_entries):
+        """
+        :param db_file: Name of the database file in the OnkoDICOM hidden
+            directory.
+        :param max_entries: Maximum number of entries kept in the table.
+        """
+        self.db_file_path = Path(
+            os.environ['USER_ONKODICOM_HIDDEN']).joinpath(db_file)
+        self.max_entries = max_entries
+        self.set_up_db()
+
+    def set_up_db(self):
+        """
+        Create the table and its indexes inside the SQLite database
+        """
+        connection = self.connect()
+        connection.execute("CREATE TABLE IF NOT EXISTS %s (%s)"
+                           % (self.table_name,
+                              ", ".join(self.table_columns
+                                        + ("last_used REAL",))))
+        for column in self.indexed_columns:
+            connection.execute("CREATE INDEX IF NOT EXISTS %s_%s ON %s (%s)"
+                               % (self.table_name, column.upper(),
+                                  self.table_name, column))
+        connection.commit()
+        connection.close()
+
+    def set_db_file_path(self, new_path):
+        self.db_file_path = new_path
+        self.set_up_db()
+
+    def connect(self):
+        """
+        :return: A new connection to the database.
+        """
+        return sqlite3.connect(self.db_file_path)
+
+    def remove_least_recently_used(self, connection, group_column,
+                                   keep="0", parameters=()):
+        """
+        Remove the least recently used groups of entries until the table
+        has no more than max_entries entries. The entries of a group are
+        removed together, and the group was last used when any of its
+        entries was last used.
+        :param connection: Connection to the database.
+        :param group_column: Column whose value groups the entries.
+        :param keep: SQL condition of the entries that are never removed.
+        :param parameters: Parameters of the keep condition.
+        """
+        total, = connection.execute(
+            "SELECT COUNT(*) FROM %s" % self.table_name).fetchone()
+        if total <= self.max_entries:
+            return
+        groups = connection.execute("""SELECT %s, COUNT(*) FROM %s
+                                       WHERE NOT (%s)
+                                       GROUP BY %s
+                                       ORDER BY MAX(last_used)"""
+                                    % (group_column, self.table_name, keep,
+                                       group_column),
+                                    parameters).fetchall()
+        for group, count in groups:
+            if total <= self.max_entries:
+                break
+            connection.execute("DELETE FROM %s WHERE %s = ? AND NOT (%s)"
+                               % (self.table_name, group_column, keep),
+                               (group,) + tuple(parameters))
+            total -= count
+
+    def clear(self):
+        """
+        Remove every entry from the table.
+        """
+        connection = self.connect()
+        connection.execute("DELETE FROM %s" % self.table_name)
+        connection.commit()
+        connection.close()
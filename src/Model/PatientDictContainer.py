@@ -115,3 +115,13 @@ class PatientDictContainer(metaclass=Singleton):
         :return: True if additional data contains given attribute key
         """
         return attribute_key in self.additional_data
+
+    def is_loading(self, *keys):
+        """
+        Example usage: dicom_data.is_loading("raw_contour", "pixluts")
+        :param keys: Keys of the additional data to be checked
+        :return: True if any of the keys are still being loaded in the
+            background by the image loader
+        """
+        loading_stages = self.additional_data.get("loading_stages") or set()
+        return not loading_stages.isdisjoint(keys)
@@ -1,10 +1,13 @@
 import collections
 import datetime
+import os
 import random
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from pathlib import Path
 import pydicom
+import cv2
 from alphashape import alphashape
 from pydicom.uid import generate_uid
 from pydicom import Dataset, Sequence
@@ -12,16 +15,23 @@ from pydicom.dataset import FileMetaDataset, validate_file_meta
 from pydicom.tag import Tag
 from pydicom.uid import generate_uid, ImplicitVRLittleEndian
 from scipy.spatial.qhull import QhullError
+from skimage import measure
 from shapely.geometry import Polygon, MultiPolygon, GeometryCollection
 from shapely.validation import make_valid
 
+from src.Model.ContourStore import ROIContours
+from src.Model.ImageGeometry import calculate_pixlut, calculate_pixluts
 from src.Model.MovingDictContainer import MovingDictContainer
+from src.Model.RTSSIndex import get_rtss_index
 from src.View.util.PatientDictContainerHelper import get_dict_slice_to_uid
 from src.constants import DEFAULT_WINDOW_SIZE
 from src.Model.CalculateImages import *
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.Transform import inv_linear_transform
 
+# Maximum number of ROIs resliced at once
+RESLICE_WORKERS = min(8, (os.cpu_count() or 1))
+
 # Disable INFO logging of shapely
 logging.getLogger('shapely.geos').setLevel(logging.CRITICAL)
 
@@ -42,9 +52,7 @@ def rename_roi(rtss, roi_id, new_name):
         ImageLoading.get_rois(..)
     :param new_name: The structure's new name
     """
-    for sequence in rtss.StructureSetROISequence:
-        if sequence.ROINumber == roi_id:
-            sequence.ROIName = new_name
+    get_rtss_index(rtss).rename_roi(roi_id, new_name)
 
     return rtss
 
@@ -69,23 +77,9 @@ def delete_roi(rtss, roi_name):
     :param roi_name: ROIName
     :return: rtss, updated rtss dataset
     """
-    # ROINumber
-    roi_number = -1
-    # Delete related StructureSetROISequence element
-    for i, elem in enumerate(rtss.StructureSetROISequence):
-        if elem.ROIName == roi_name:
-            roi_number = rtss.StructureSetROISequence[i].ROINumber
-            del rtss.StructureSetROISequence[i]
-
-    # Delete related ROIContourSequence element
-    for i, elem in enumerate(rtss.ROIContourSequence):
-        if elem.ReferencedROINumber == roi_number:
-            del rtss.ROIContourSequence[i]
-
-    # Delete related RTROIObservationsSequence element
-    for i, elem in enumerate(rtss.RTROIObservationsSequence):
-        if elem.ReferencedROINumber == roi_number:
-            del rtss.RTROIObservationsSequence[i]
+    # Delete the related StructureSetROISequence, ROIContourSequence and
+    # RTROIObservationsSequence elements
+    get_rtss_index(rtss).delete_roi(roi_name)
 
     return rtss
 
@@ -99,58 +93,15 @@ def add_to_roi(rtss, roi_name, roi_coordinates, data_set):
         :param data_set: Data Set of selected DICOM image file
         :return: rtss, with added ROI
     """
+    rtss_index = get_rtss_index(rtss)
+    existing_roi_number = rtss_index.get_roi_number(roi_name)
+    roi_contour = rtss_index.get_item("ROIContourSequence",
+                                      existing_roi_number)
 
-    # Creating a new ROIContourSequence, ContourSequence,
-    # ContourImageSequence
-    contour_sequence = Sequence([Dataset()])
-    contour_image_sequence = Sequence([Dataset()])
-
-    number_of_contour_points = len(roi_coordinates) / 3
-    referenced_sop_class_uid = data_set.SOPClassUID
-    referenced_sop_instance_uid = data_set.SOPInstanceUID
-
-    existing_roi_number = None
-    for item in rtss["StructureSetROISequence"]:
-        if item.ROIName == roi_name:
-            existing_roi_number = item.ROINumber
-
-    position = None
-
-    # Get the index of the ROI
-    for index, contour in enumerate(rtss.ROIContourSequence):
-        if contour.ReferencedROINumber == existing_roi_number:
-            position = index
-
-    new_contour_number = len(
-        rtss.ROIContourSequence[position].ContourSequence) + 1
-
-    # ROI Sequence
-    for contour in contour_sequence:
-        # if data_set.get("ReferencedImageSequence"):
-        contour.add_new(Tag("ContourImageSequence"),
-                        "SQ", contour_image_sequence)
-
-        # Contour Sequence
-        for contour_image in contour_image_sequence:
-            # CT Image Storage
-            contour_image.add_new(Tag("ReferencedSOPClassUID"), "UI",
-                                  referenced_sop_class_uid)
-            contour_image.add_new(Tag("ReferencedSOPInstanceUID"), "UI",
-                                  referenced_sop_instance_uid)
-
-        contour.add_new(Tag("ContourNumber"), "IS", new_contour_number)
-        if not _is_closed_contour(roi_coordinates):
-            contour.add_new(Tag("ContourGeometricType"), "CS", "OPEN_PLANAR")
-            contour.add_new(Tag("NumberOfContourPoints"), "IS",
-                            number_of_contour_points)
-            contour.add_new(Tag("ContourData"), "DS", roi_coordinates)
-        else:
-            contour.add_new(Tag("ContourGeometricType"), "CS", "CLOSED_PLANAR")
-            contour.add_new(Tag("NumberOfContourPoints"), "IS",
-                            number_of_contour_points - 1)
-            contour.add_new(Tag("ContourData"), "DS", roi_coordinates[0:-3])
-
-    rtss.ROIContourSequence[position].ContourSequence.extend(contour_sequence)
+    new_contour_number = len(roi_contour.get("ContourSequence", [])) + 1
+    rtss_index.add_contours(
+        existing_roi_number,
+        [_new_contour(roi_coordinates, data_set, new_contour_number)])
 
     return rtss
 
@@ -205,116 +156,156 @@ def add_new_roi(rtss, roi_name, roi_coordinates, data_set,
     :param rt_roi_interpreted_type: the interpreted type of the new ROI
     :return: rtss, with added ROI
     """
-    number_of_contour_points = len(roi_coordinates) / 3
-    referenced_sop_class_uid = data_set.SOPClassUID
-    referenced_sop_instance_uid = data_set.SOPInstanceUID
+    rtss_index = get_rtss_index(rtss)
+    roi_number = _add_empty_roi(rtss_index, roi_name, data_set,
+                                rt_roi_interpreted_type)
+    rtss_index.add_contours(
+        roi_number, [_new_contour(roi_coordinates, data_set, 1)])
+    return rtss
 
+
+def _add_empty_roi(rtss_index, roi_name, data_set, rt_roi_interpreted_type):
+    """
+    Add the structure set, ROI contour and observation of a new ROI
+    without contours.
+    :param rtss_index: RTSSIndex of the RTSS
+    :param roi_name: ROIName
+    :param data_set: Data Set of a DICOM image of the ROI
+    :param rt_roi_interpreted_type: the interpreted type of the ROI
+    :return: ROINumber of the new ROI
+    """
+    structure_set_sequence = \
+        rtss_index.get_sequence("StructureSetROISequence")
     # Check if there is any ROIs in rtss
-    if not len(rtss["StructureSetROISequence"].value):
+    if not len(structure_set_sequence):
         referenced_frame_of_reference_uid = data_set.FrameOfReferenceUID
         roi_number = 1
     else:
-        first_roi_sequence = rtss["StructureSetROISequence"].value[0]
         referenced_frame_of_reference_uid = \
-            first_roi_sequence.ReferencedFrameOfReferenceUID
-        roi_number = \
-            rtss["StructureSetROISequence"].value[-1].ROINumber + 1
+            structure_set_sequence[0].ReferencedFrameOfReferenceUID
+        roi_number = structure_set_sequence[-1].ROINumber + 1
+
+    structure_set = Dataset()
+    structure_set.add_new(Tag("ROINumber"), 'IS', roi_number)
+    structure_set.add_new(Tag("ReferencedFrameOfReferenceUID"), 'UI',
+                          referenced_frame_of_reference_uid)
+    structure_set.add_new(Tag("ROIName"), 'LO', roi_name)
+    structure_set.add_new(Tag("ROIGenerationAlgorithm"), 'CS', "")
 
     # Colour TBC
-    red = random.randint(0, 255)
-    green = random.randint(0, 255)
-    blue = random.randint(0, 255)
-    rgb = [red, green, blue]
-
-    # Saving a new StructureSetROISequence
-    structure_set_sequence = Sequence([Dataset()])
-
-    original_structure_set = rtss.StructureSetROISequence
-
-    for structure_set in structure_set_sequence:
-        structure_set.add_new(Tag("ROINumber"), 'IS', roi_number)
-        structure_set.add_new(Tag("ReferencedFrameOfReferenceUID"), 'UI',
-                              referenced_frame_of_reference_uid)
-        structure_set.add_new(Tag("ROIName"), 'LO', roi_name)
-        structure_set.add_new(Tag("ROIGenerationAlgorithm"), 'CS', "")
-
-    # Combine old and new structure set
-    original_structure_set.extend(structure_set_sequence)
-    rtss.add_new(Tag("StructureSetROISequence"), "SQ",
-                 original_structure_set)
-
-    # Saving a new ROIContourSequence, ContourSequence,
-    # ContourImageSequence
-    roi_contour_sequence = Sequence([Dataset()])
-    contour_sequence = Sequence([Dataset()])
-    contour_image_sequence = Sequence([Dataset()])
-
-    # Original File
-    original_roi_contour = rtss.ROIContourSequence
-
-    # ROI Contour Sequence
-    for roi_contour in roi_contour_sequence:
-        roi_contour.add_new(Tag("ROIDisplayColor"), "IS", rgb)
-        roi_contour.add_new(Tag("ContourSequence"), "SQ", contour_sequence)
-
-        # ROI Sequence
-        for contour in contour_sequence:
-            # if data_set.get("ReferencedImageSequence"):
-            contour.add_new(Tag("ContourImageSequence"), "SQ",
-                            contour_image_sequence)
-
-            # Contour Sequence
-            for contour_image in contour_image_sequence:
-                contour_image.add_new(
-                    Tag("ReferencedSOPClassUID"), "UI",
-                    referenced_sop_class_uid)  # CT Image Storage
-                contour_image.add_new(Tag("ReferencedSOPInstanceUID"),
-                                      "UI", referenced_sop_instance_uid)
-
-            contour.add_new(Tag("ContourNumber"), "IS", 1)
-            if not _is_closed_contour(roi_coordinates):
-                contour.add_new(Tag("ContourGeometricType"), "CS",
-                                "OPEN_PLANAR")
-                contour.add_new(Tag("NumberOfContourPoints"), "IS",
-                                number_of_contour_points)
-                contour.add_new(Tag("ContourData"), "DS", roi_coordinates)
-            else:
-                contour.add_new(Tag("ContourGeometricType"), "CS",
-                                "CLOSED_PLANAR")
-                contour.add_new(Tag("NumberOfContourPoints"), "IS",
-                                number_of_contour_points - 1)
-                contour.add_new(Tag("ContourData"), "DS",
-                                roi_coordinates[0:-3])
-
-        roi_contour.add_new(Tag("ReferencedROINumber"), "IS", roi_number)
-
-    # Combine original ROIContourSequence with new
-    original_roi_contour.extend(roi_contour_sequence)
-
-    rtss.add_new(Tag("ROIContourSequence"), "SQ", original_roi_contour)
-
-    # Saving a new RTROIObservationsSequence
-    rt_roi_observations_sequence = Sequence([Dataset()])
-
-    original_roi_observation_sequence = rtss.RTROIObservationsSequence
-
-    for ROI_observations in rt_roi_observations_sequence:
-        # TODO: Check to make sure that there aren't multiple
-        #  observations per ROI, e.g. increment from existing
-        #  Observation Numbers?
-        ROI_observations.add_new(Tag("ObservationNumber"), 'IS',
-                                 roi_number)
-        ROI_observations.add_new(Tag("ReferencedROINumber"), 'IS',
-                                 roi_number)
-        ROI_observations.add_new(Tag("RTROIInterpretedType"), 'CS',
-                                 rt_roi_interpreted_type)
-        ROI_observations.add_new(Tag("ROIInterpreter"), 'CS',
-                                 "")
-
-    original_roi_observation_sequence.extend(rt_roi_observations_sequence)
-    rtss.add_new(Tag("RTROIObservationsSequence"), "SQ",
-                 original_roi_observation_sequence)
-    return rtss
+    rgb = [random.randint(0, 255) for _ in range(3)]
+    roi_contour = Dataset()
+    roi_contour.add_new(Tag("ROIDisplayColor"), "IS", rgb)
+    roi_contour.add_new(Tag("ContourSequence"), "SQ", Sequence())
+    roi_contour.add_new(Tag("ReferencedROINumber"), "IS", roi_number)
+
+    # TODO: Check to make sure that there aren't multiple
+    #  observations per ROI, e.g. increment from existing
+    #  Observation Numbers?
+    roi_observations = Dataset()
+    roi_observations.add_new(Tag("ObservationNumber"), 'IS', roi_number)
+    roi_observations.add_new(Tag("ReferencedROINumber"), 'IS', roi_number)
+    roi_observations.add_new(Tag("RTROIInterpretedType"), 'CS',
+                             rt_roi_interpreted_type)
+    roi_observations.add_new(Tag("ROIInterpreter"), 'CS', "")
+
+    return rtss_index.add_roi(structure_set, roi_contour, roi_observations)
+
+
+class RTSSBuilder:
+    """
+    Collects the contours of ROIs and adds them to an RTSS in one pass.
+    Unlike calling create_roi(..) for every contour, the contours of each
+    ROI are appended to its ContourSequence together.
+
+    Example usage:
+    rtss_builder = RTSSBuilder(dataset_rtss)
+    for coords, ds in contours:
+        rtss_builder.add_contour("Isodose 95", coords, ds, "DOSE_REGION")
+    rtss = rtss_builder.build()
+    patient_dict_container.set("rois", ImageLoading.get_roi_info(rtss))
+    """
+
+    def __init__(self, rtss):
+        """
+        :param rtss: dataset of RTSS the ROIs are added to
+        """
+        self.rtss = rtss
+        # ROIName to interpreted type and list of (coordinates, data set)
+        self.roi_contours = {}
+
+    def add_contour(self, roi_name, roi_coordinates, data_set,
+                    rt_roi_interpreted_type="ORGAN"):
+        """
+        Add a contour to an ROI, which is created if the RTSS has no ROI
+        of that name when the RTSS is built.
+        :param roi_name: ROIName
+        :param roi_coordinates: Coordinates of pixels for the contour
+        :param data_set: Data Set of the DICOM image of the contour
+        :param rt_roi_interpreted_type: the interpreted type of the ROI,
+            if it is new
+        """
+        if roi_name not in self.roi_contours:
+            self.roi_contours[roi_name] = (rt_roi_interpreted_type, [])
+        self.roi_contours[roi_name][1].append((roi_coordinates, data_set))
+
+    def build(self):
+        """
+        Add the collected contours to the RTSS.
+        :return: rtss, with the added ROIs
+        """
+        rtss_index = get_rtss_index(self.rtss)
+
+        for roi_name, (rt_roi_interpreted_type, contours) \
+                in self.roi_contours.items():
+            roi_number = rtss_index.get_roi_number(roi_name)
+            if roi_number is None:
+                roi_number = _add_empty_roi(rtss_index, roi_name,
+                                            contours[0][1],
+                                            rt_roi_interpreted_type)
+
+            roi_contour = rtss_index.get_item("ROIContourSequence",
+                                              roi_number)
+            first_number = len(roi_contour.get("ContourSequence", [])) + 1
+            rtss_index.add_contours(roi_number, [
+                _new_contour(roi_coordinates, data_set, first_number + i)
+                for i, (roi_coordinates, data_set) in enumerate(contours)])
+
+        self.roi_contours = {}
+        return self.rtss
+
+
+def _new_contour(roi_coordinates, data_set, contour_number):
+    """
+    Create a ContourSequence element.
+    :param roi_coordinates: Coordinates of pixels for the contour
+    :param data_set: Data Set of the DICOM image of the contour
+    :param contour_number: ContourNumber of the contour
+    :return: the contour dataset
+    """
+    contour_image = Dataset()
+    # CT Image Storage
+    contour_image.add_new(Tag("ReferencedSOPClassUID"), "UI",
+                          data_set.SOPClassUID)
+    contour_image.add_new(Tag("ReferencedSOPInstanceUID"), "UI",
+                          data_set.SOPInstanceUID)
+
+    contour = Dataset()
+    contour.add_new(Tag("ContourImageSequence"), "SQ",
+                    Sequence([contour_image]))
+    contour.add_new(Tag("ContourNumber"), "IS", contour_number)
+    number_of_contour_points = len(roi_coordinates) // 3
+    if not _is_closed_contour(roi_coordinates):
+        contour.add_new(Tag("ContourGeometricType"), "CS", "OPEN_PLANAR")
+        contour.add_new(Tag("NumberOfContourPoints"), "IS",
+                        number_of_contour_points)
+        contour.add_new(Tag("ContourData"), "DS", roi_coordinates)
+    else:
+        contour.add_new(Tag("ContourGeometricType"), "CS", "CLOSED_PLANAR")
+        contour.add_new(Tag("NumberOfContourPoints"), "IS",
+                        number_of_contour_points - 1)
+        contour.add_new(Tag("ContourData"), "DS", roi_coordinates[0:-3])
+    return contour
 
 
 def _within_tolerance(a: float, b: float, tol=0.01):
@@ -337,35 +328,10 @@ def get_raw_contour_data(rtss):
     """
     Get raw contour data of ROI in RT Structure Set
     :param rtss: RTSS dataset
-    :return: dict_roi, a dictionary of ROI contours; dict_num_points,
-        number of points of contours.
-    """
-    # Retrieve a dictionary of roi_name & ROINumber pairs
-    dict_id = {}
-    for i, elem in enumerate(rtss.StructureSetROISequence):
-        roi_number = elem.ROINumber
-        roi_name = elem.ROIName
-        dict_id[roi_number] = roi_name
-
-    dict_roi = {}
-    dict_num_points = {}
-    for roi in rtss.ROIContourSequence:
-        referenced_roi_number = roi.ReferencedROINumber
-        roi_name = dict_id[referenced_roi_number]
-        dict_contour = collections.defaultdict(list)
-        roi_points_count = 0
-        for roi_slice in roi.ContourSequence:
-            referenced_sop_instance_uid = None
-            for contour_img in roi_slice.ContourImageSequence:
-                referenced_sop_instance_uid = \
-                    contour_img.ReferencedSOPInstanceUID
-            number_of_contour_points = roi_slice.NumberOfContourPoints
-            roi_points_count += int(number_of_contour_points)
-            contour_data = roi_slice.ContourData
-            dict_contour[referenced_sop_instance_uid].append(contour_data)
-        dict_roi[roi_name] = dict_contour
-        dict_num_points[roi_name] = roi_points_count
-    return dict_roi, dict_num_points
+    :return: dict_roi, a dictionary of ROIName to ROIContours;
+        dict_num_points, number of points of contours.
+    """
+    return get_rtss_index(rtss).get_raw_contour_data()
 
 
 def calculate_matrix(img_ds):
@@ -375,61 +341,7 @@ def calculate_matrix(img_ds):
     :return: pair of numpy arrays that represents the transformation
         matrix
     """
-    # Physical distance (in mm) between the center of each image pixel,
-    # specified by a numeric pair
-    # - adjacent row spacing (delimiter) adjacent column spacing.
-    dist_row = img_ds.PixelSpacing[0]
-    dist_col = img_ds.PixelSpacing[1]
-    # The direction cosines of the first row and the first column with
-    # respect to the patient.
-    # 6 values inside: [Xx, Xy, Xz, Yx, Yy, Yz]
-    orientation = img_ds.ImageOrientationPatient
-    # The x, y, and z coordinates of the upper left hand corner
-    # (center of the first voxel transmitted) of the image, in mm.
-    # 3 values: [Sx, Sy, Sz]
-    position = img_ds.ImagePositionPatient
-
-    # Equation C.7.6.2.1-1.
-    # https://dicom.innolitics.com/ciods/rt-structure-set/roi-contour/30060039/30060040/30060050
-    matrix_m = np.ndarray(
-        shape=(4, 4),
-        buffer=np.array(
-            [
-                [orientation[0] * dist_row, orientation[3] * dist_col, 0,
-                 position[0]],
-                [orientation[1] * dist_row, orientation[4] * dist_col, 0,
-                 position[1]],
-                [orientation[2] * dist_row, orientation[5] * dist_col, 0,
-                 position[2]],
-                [0, 0, 0, 1],
-            ],
-            dtype=float,
-        ),
-    )
-
-    x = []
-    y = []
-    for i in range(0, img_ds.Columns):
-        i_mat = np.matmul(
-            matrix_m,
-            np.ndarray(
-                shape=(4, 1),
-                buffer=np.array([[i], [0], [0], [1]], dtype=float)
-            ),
-        )
-        x.append(float(i_mat[0]))
-
-    for j in range(0, img_ds.Rows):
-        j_mat = np.matmul(
-            matrix_m,
-            np.ndarray(
-                shape=(4, 1),
-                buffer=np.array([[0], [j], [0], [1]], dtype=float)
-            ),
-        )
-        y.append(float(j_mat[1]))
-
-    return np.array(x), np.array(y)
+    return calculate_pixlut(img_ds)
 
 
 def get_pixluts(dict_ds):
@@ -438,18 +350,18 @@ def get_pixluts(dict_ds):
     :param dict_ds: a dictionary of all the datasets
     :return: a dictionary of transformation matrices
     """
-    dict_pixluts = {}
     non_img_type = ["rtdose", "rtplan", "rtss"]
+    img_datasets = []
     for ds in dict_ds:
         if ds not in non_img_type:
             if isinstance(ds, str) and ds[0:3] == 'sr-':
                 continue
             else:
-                img_ds = dict_ds[ds]
-                pixlut = calculate_matrix(img_ds)
-                dict_pixluts[img_ds.SOPInstanceUID] = pixlut
+                img_datasets.append(dict_ds[ds])
 
-    return dict_pixluts
+    pixluts = calculate_pixluts(img_datasets)
+    return {img_ds.SOPInstanceUID: pixlut
+            for img_ds, pixlut in zip(img_datasets, pixluts)}
 
 
 def calculate_pixels(pixlut, contour, prone=False, feetfirst=False):
@@ -461,33 +373,8 @@ def calculate_pixels(pixlut, contour, prone=False, feetfirst=False):
     :param feetfirst: label of feetfirst or head first
     :return: contour pixels
     """
-    pixels = []
-
-    np_x = np.array(pixlut[0])
-    np_y = np.array(pixlut[1])
-    if not feetfirst and not prone:
-        for i in range(0, len(contour), 3):
-            con_x = contour[i]
-            con_y = contour[i + 1]
-            x = np.argmax(np_x > con_x)
-            y = np.argmax(np_y > con_y)
-            pixels.append([x, y])
-    if feetfirst and not prone:
-        for i in range(0, len(contour), 3):
-            con_x = contour[i]
-            con_y = contour[i + 1]
-            x = np.argmin(np_x < con_x)
-            y = np.argmax(np_y > con_y)
-            pixels.append([x, y])
-    if prone:
-        for i in range(0, len(contour), 3):
-            con_x = contour[i]
-            con_y = contour[i + 1]
-            x = np.argmin(np_x < con_x)
-            y = np.argmin(np_y < con_y)
-            pixels.append([x, y])
-
-    return pixels
+    return calculate_contour_pixels(
+        pixlut, contour, prone, feetfirst).tolist()
 
 
 def calculate_pixels_sagittal(pixlut, contour, prone=False, feetfirst=False):
@@ -502,33 +389,100 @@ def calculate_pixels_sagittal(pixlut, contour, prone=False, feetfirst=False):
     ----------
     contour : object
     """
-    pixels = []
-    np_x = np.array(pixlut[0])
-    np_y = np.array(pixlut[1])
-    if not feetfirst and not prone:
-        for i in range(0, len(contour), 3):
-            con_x = contour[i]
-            con_y = contour[i + 1]
-            x = np.argmax(np_x > con_x)
-            y = np.argmax(np_y > con_y)
-            pixels.append([x, y])
-    if feetfirst and not prone:
-        for i in range(0, len(contour), 3):
-            con_x = contour[i]
-            con_y = contour[i + 1]
-            x = np.argmin(np_x < con_x)
-            y = np.argmax(np_y > con_y)
-            pixels.append([x, y])
-    if prone:
-        for i in range(0, len(contour), 3):
-            con_x = contour[i]
-            con_y = contour[i + 1]
-            x = np.argmin(np_x < con_x)
-            y = np.argmin(np_y < con_y)
-            pixels.append([x, y])
+    return calculate_contour_pixels(
+        pixlut, contour, prone, feetfirst).tolist()
+
+
+def calculate_contour_pixels(pixlut, contour, prone=False, feetfirst=False):
+    """
+    Convert all the points of a contour to pixels at once.
+    A coordinate maps to the first pixel whose position is greater than it
+    (greater than or equal to it for the flipped axes of prone and feet
+    first patients), or to pixel 0 when there is none.
+    :param pixlut: transformation matrixx
+    :param contour: raw contour data (3D), flattened x, y, z values
+    :param prone: label of prone
+    :param feetfirst: label of feetfirst or head first
+    :return: an (N, 2) numpy array of the x, y pixels of the N points
+    """
+    points = np.asarray(contour, dtype=float)
+    points = points[:len(points) - len(points) % 3].reshape(-1, 3)
+
+    pixels = np.empty((len(points), 2), dtype=np.int64)
+    pixels[:, 0] = first_pixel_index(pixlut[0], points[:, 0],
+                                     strict=not (feetfirst or prone))
+    pixels[:, 1] = first_pixel_index(pixlut[1], points[:, 1],
+                                     strict=not prone)
     return pixels
 
 
+def calculate_contours_pixels(pixlut, contours, prone=False,
+                              feetfirst=False):
+    """
+    Convert the points of several contours on one slice in one batch.
+    :param pixlut: transformation matrixx
+    :param contours: list of raw contour data (3D)
+    :param prone: label of prone
+    :param feetfirst: label of feetfirst or head first
+    :return: list of (N, 2) numpy arrays of the contour pixels of each
+        contour
+    """
+    if not contours:
+        return []
+    points = [np.asarray(contour, dtype=float) for contour in contours]
+    points = [contour[:len(contour) - len(contour) % 3]
+              for contour in points]
+    pixels = calculate_contour_pixels(
+        pixlut, np.concatenate(points), prone, feetfirst)
+    offsets = np.cumsum([len(contour) // 3 for contour in points])[:-1]
+    return np.split(pixels, offsets)
+
+
+def calculate_slice_pixels(pixlut, raw_contours, curr_slice, prone=False,
+                           feetfirst=False):
+    """
+    Convert the points of the contours of an ROI on one slice. The points
+    of ROIContours are converted from their array without copying each
+    contour first.
+    :param pixlut: transformation matrixx
+    :param raw_contours: ROIContours, or dictionary of slice to list of
+        raw contour data (3D)
+    :param curr_slice: Current slice identifier
+    :param prone: label of prone
+    :param feetfirst: label of feetfirst or head first
+    :return: list of (N, 2) numpy arrays of the contour pixels of each
+        contour
+    """
+    if not isinstance(raw_contours, ROIContours):
+        return calculate_contours_pixels(
+            pixlut, raw_contours[curr_slice], prone, feetfirst)
+    if curr_slice not in raw_contours:
+        return []
+    pixels = calculate_contour_pixels(
+        pixlut, raw_contours.get_points(curr_slice).ravel(), prone,
+        feetfirst)
+    return np.split(pixels, raw_contours.get_offsets(curr_slice)[1:-1])
+
+
+def first_pixel_index(lut, values, strict=True):
+    """
+    For each value, find the index of the first element of the lookup
+    table that is greater than it (strict) or greater than or equal to it.
+    Values with no such element get index 0.
+    :param lut: one axis of a pixlut
+    :param values: numpy array of coordinates
+    :param strict: whether the element must be strictly greater
+    :return: numpy array of indices
+    """
+    # The first element exceeding a value is also the first element of the
+    # running maximum exceeding it, and the running maximum is sorted.
+    running_max = np.maximum.accumulate(np.asarray(lut, dtype=float))
+    indices = np.searchsorted(running_max, values,
+                              side='right' if strict else 'left')
+    indices[indices == len(running_max)] = 0
+    return indices
+
+
 def convert_hull_list_to_contours_data(rois_to_save, patient_dict_container):
     """
     Convert list of border coordinates from each slice
@@ -653,12 +607,8 @@ def get_contour_pixel(
         # slice
         dict_pixels_of_roi = collections.defaultdict(list)
         raw_contours = dict_raw_contour_data[roi]
-        number_of_contours = len(raw_contours[curr_slice])
-        for i in range(number_of_contours):
-            contour_pixels = calculate_pixels(
-                pixlut, raw_contours[curr_slice][i], prone, feetfirst
-            )
-            dict_pixels_of_roi[curr_slice].append(contour_pixels)
+        dict_pixels_of_roi[curr_slice].extend(calculate_slice_pixels(
+            pixlut, raw_contours, curr_slice, prone, feetfirst))
         dict_pixels[roi] = dict_pixels_of_roi
 
     return dict_pixels
@@ -679,11 +629,8 @@ def get_roi_contour_pixel(dict_raw_contour_data, roi_list, dict_pixluts):
         raw_contour = dict_raw_contour_data[roi]
         for roi_slice in raw_contour:
             pixlut = dict_pixluts[roi_slice]
-            number_of_contours = len(raw_contour[roi_slice])
-            for i in range(number_of_contours):
-                contour_pixels = calculate_pixels(pixlut,
-                                                  raw_contour[roi_slice][i])
-                dict_pixels_of_roi[roi_slice].append(contour_pixels)
+            dict_pixels_of_roi[roi_slice].extend(calculate_slice_pixels(
+                pixlut, raw_contour, roi_slice))
         dict_pixels[roi] = dict_pixels_of_roi
     return dict_pixels
 
@@ -691,60 +638,133 @@ def get_roi_contour_pixel(dict_raw_contour_data, roi_list, dict_pixluts):
 def transform_rois_contours(axial_rois_contours):
     """
        Transform the axial ROI contours into coronal and sagittal
-       contours
+       contours. Each ROI is rasterised into a 3D mask, and the outlines
+       of its coronal and sagittal slices are traced from the mask. ROIs
+       are processed in parallel.
        :param axial_rois_contours: the dictionary of axial ROI contours
        :return: Tuple of coronal and sagittal ROI contours
     """
+    patient_dict_container = PatientDictContainer()
+    slice_ids = get_dict_slice_to_uid(patient_dict_container)
+    dataset = patient_dict_container.dataset[0]
+    shape = (len(slice_ids), dataset.Rows, dataset.Columns)
+
+    def reslice(name):
+        mask, offset = rasterise_roi(axial_rois_contours[name], slice_ids,
+                                     shape)
+        return reslice_roi_mask(mask, offset)
+
     coronal_rois_contours = {}
     sagittal_rois_contours = {}
-    slice_ids = get_dict_slice_to_uid(PatientDictContainer())
-    for name in axial_rois_contours.keys():
-        coronal_rois_contours[name] = {}
-        sagittal_rois_contours[name] = {}
-        for slice_id in slice_ids:
-            contours = axial_rois_contours[name][slice_id]
-            for contour in contours:
-                for i in range(len(contour)):
-                    if contour[i][1] in coronal_rois_contours[name]:
-                        coronal_rois_contours[name][contour[i][1]][0] \
-                            .append([contour[i][0], slice_ids[slice_id]])
-                    else:
-                        coronal_rois_contours[name][contour[i][1]] = [[]]
-                        coronal_rois_contours[name][contour[i][1]][0] \
-                            .append([contour[i][0], slice_ids[slice_id]])
-
-                    if contour[i][0] in sagittal_rois_contours[name]:
-                        sagittal_rois_contours[name][contour[i][0]][0] \
-                            .append([contour[i][1], slice_ids[slice_id]])
-                    else:
-                        sagittal_rois_contours[name][contour[i][0]] = [[]]
-                        sagittal_rois_contours[name][contour[i][0]][0] \
-                            .append([contour[i][1], slice_ids[slice_id]])
-
-    coronal_rois_contours = convert_coordinates_map_to_polygon_of_rois(
-        coronal_rois_contours)
-    sagittal_rois_contours = convert_coordinates_map_to_polygon_of_rois(
-        sagittal_rois_contours)
+    names = list(axial_rois_contours.keys())
+    with ThreadPoolExecutor(max_workers=RESLICE_WORKERS) as executor:
+        for name, (coronal, sagittal) in zip(names,
+                                             executor.map(reslice, names)):
+            coronal_rois_contours[name] = coronal
+            sagittal_rois_contours[name] = sagittal
+
     return coronal_rois_contours, sagittal_rois_contours
 
 
-def convert_coordinates_map_to_polygon_of_rois(contours_map):
+def rasterise_roi(roi_contours, slice_ids, shape):
     """
-
-    this function converts a map (dictionary) of ROI contours into polygon for
-    better ROI display
-
-    :param contours_map: a map(dictionary) of ROI contours.
-
+    Fill the axial contours of an ROI into a 3D mask of the bounding box
+    of the ROI. Overlapping contours on a slice are combined with XOR, so
+    contours inside another contour are holes.
+    :param roi_contours: dictionary of the contour pixels of the ROI, per
+        slice UID
+    :param slice_ids: dictionary of slice UID to slice number
+    :param shape: shape of the volume, (slices, rows, columns)
+    :return: Tuple of the 3D boolean numpy array of the bounding box and
+        the (slice, row, column) position of the box in the volume
     """
-    polygon_dict = {}
-    for name, contours_dict in contours_map.items():
-        polygon_dict[name] = {}
-        for slice_id, contour_array in contours_dict.items():
-            roi_array = contour_array[0]
-            hull_list = calculate_concave_hull_of_points(roi_array, alpha=0)
-            polygon_dict[name][slice_id] = hull_list
-    return polygon_dict
+    slice_contours = {}
+    for slice_uid, slice_id in slice_ids.items():
+        for contour in roi_contours.get(slice_uid, []):
+            contour = np.asarray(contour, dtype=np.int32)
+            if len(contour) >= 3:
+                slice_contours.setdefault(slice_id, []).append(contour)
+    if not slice_contours:
+        return np.zeros((0, 0, 0), dtype=bool), (0, 0, 0)
+
+    # Contour points are (column, row) pixels, and may be outside the image
+    points = np.concatenate([contour for contours in slice_contours.values()
+                             for contour in contours])
+    min_column, min_row = np.maximum(points.min(axis=0), 0)
+    max_column, max_row = np.minimum(points.max(axis=0),
+                                     (shape[2] - 1, shape[1] - 1))
+    min_slice = min(slice_contours)
+    mask = np.zeros((max(slice_contours) - min_slice + 1,
+                     max(max_row - min_row + 1, 0),
+                     max(max_column - min_column + 1, 0)), dtype=bool)
+    offset = (min_slice, int(min_row), int(min_column))
+    if not mask.size:
+        return mask, offset
+
+    filled = np.zeros(mask.shape[1:], dtype=np.uint8)
+    box_position = np.array([min_column, min_row], dtype=np.int32)
+    for slice_id, contours in slice_contours.items():
+        for contour in contours:
+            filled[:] = 0
+            cv2.fillPoly(filled, [contour - box_position], 1)
+            mask[slice_id - min_slice] ^= filled.view(bool)
+    return mask, offset
+
+
+def reslice_roi_mask(mask, offset=(0, 0, 0)):
+    """
+    Trace the outlines of the coronal and sagittal slices of an ROI mask.
+    :param mask: 3D boolean numpy array, (slices, rows, columns)
+    :param offset: (slice, row, column) position of the mask in the volume
+    :return: Tuple of dictionaries of the coronal contours per row and the
+        sagittal contours per column. Each contour is a list of
+        [x, slice] points.
+    """
+    coronal_contours = {}
+    sagittal_contours = {}
+    slices = np.flatnonzero(mask.any(axis=(1, 2)))
+    rows = np.flatnonzero(mask.any(axis=(0, 2)))
+    columns = np.flatnonzero(mask.any(axis=(0, 1)))
+    if not len(slices):
+        return coronal_contours, sagittal_contours
+
+    # Only trace the bounding box of the ROI
+    box = mask[slices[0]:slices[-1] + 1, rows[0]:rows[-1] + 1,
+               columns[0]:columns[-1] + 1]
+    slice_offset, row_offset, column_offset = offset
+    for row in rows:
+        coronal_contours[int(row + row_offset)] = mask_outlines(
+            box[:, row - rows[0], :],
+            (columns[0] + column_offset, slices[0] + slice_offset))
+    for column in columns:
+        sagittal_contours[int(column + column_offset)] = mask_outlines(
+            box[:, :, column - columns[0]],
+            (rows[0] + row_offset, slices[0] + slice_offset))
+    return coronal_contours, sagittal_contours
+
+
+def mask_outlines(mask_slice, offset=(0, 0)):
+    """
+    Trace the outlines of a 2D mask with marching squares.
+    :param mask_slice: 2D boolean numpy array, (slices, pixels)
+    :param offset: (pixel, slice) position of the mask in the view
+    :return: list of contours, each a list of [pixel, slice] points in
+        pixmap coordinates
+    """
+    # Pad the slice so regions touching the edge have closed outlines
+    padded = np.pad(mask_slice, 1).astype(np.uint8)
+    outlines = []
+    for contour in measure.find_contours(padded, 0.5):
+        # Undo the padding, and move from pixel centres to pixel edges.
+        # Points on a pixel centre always move to the edge after it, where
+        # rounding half to even would pick either edge by its parity.
+        points = contour[:, ::-1] - 0.5
+        points = np.floor(points + 0.5).astype(int) + offset
+        # Drop points repeated by the rounding
+        repeated = np.all(points[1:] == points[:-1], axis=1)
+        points = points[np.concatenate(([True], ~repeated))]
+        outlines.append(points.tolist())
+    return outlines
 
 
 def calculate_concave_hull_of_points(pixel_coords, alpha=0.2):
@@ -1046,25 +1066,10 @@ def merge_rtss(old_rtss, new_rtss, duplicated_names):
     new_roi_contour = new_rtss.ROIContourSequence
     new_roi_observation_sequence = new_rtss.RTROIObservationsSequence
 
-    # Get the indexes of duplicated ROIs
-    old_duplicated_roi_indexes = {}
-    index = 0
-    for structure_set in original_structure_set:
-        if structure_set.ROIName in duplicated_names:
-            old_duplicated_roi_indexes[structure_set.ROIName] = index
-        index += 1
-
-    # Remove old values out of the original sequences
-    rm_indices = [old_duplicated_roi_indexes[name]
-                  for name in duplicated_names]
-    for index in sorted(rm_indices, reverse=True):
-        # Remove the old value out of the original structure set
-        # sequence
-        original_structure_set.pop(index)
-        # Remove the old value out of the original contour sequence
-        original_roi_contour.pop(index)
-        # Remove the old value out of the original observation sequence
-        original_roi_observation_sequence.pop(index)
+    # Remove the old duplicated ROIs out of the original sequences
+    old_rtss_index = get_rtss_index(old_rtss)
+    for name in duplicated_names:
+        old_rtss_index.delete_roi(name)
 
     # Merge the original sequences with the new sequences
     original_structure_set.extend(new_structure_set)
@@ -1084,6 +1089,9 @@ def merge_rtss(old_rtss, new_rtss, duplicated_names):
     old_rtss.add_new(Tag("RTROIObservationsSequence"), "SQ",
                      original_roi_observation_sequence)
 
+    # Every ROI has been renumbered
+    old_rtss_index.rebuild()
+
     return old_rtss
 
 
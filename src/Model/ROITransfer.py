@@ -8,6 +8,7 @@ import logging
 from platipy.dicom.io.rtstruct_to_nifti import fix_missing_data
 from skimage.draw import polygon
 
+from src.Model.ContourStore import read_contour_data
 from src.View.util.ProgressWindowHelper import check_interrupt_flag
 
 
@@ -88,12 +89,13 @@ def transform_point_set_from_dicom_struct(dicom_image, dicom_struct,
                     not check_interrupt_flag(interrupt_flag):
                 return [], []
 
-            contour_data = fix_missing_data(
-                struct_point_sequence[struct_index].ContourSequence[
-                    sl].ContourData
-            )
-
-            struct_slice_contour_data = np.array(contour_data, dtype=np.double)
+            contour = struct_point_sequence[struct_index].ContourSequence[sl]
+            try:
+                struct_slice_contour_data = read_contour_data(contour)
+            except ValueError:
+                # Interpolate missing values
+                struct_slice_contour_data = np.array(
+                    fix_missing_data(contour.ContourData), dtype=np.double)
             vertex_arr_physical = struct_slice_contour_data.reshape(
                 struct_slice_contour_data.shape[0] // 3, 3
             )
@@ -0,0 +1,319 @@
+"""
+Index of the ROIs of an RTSTRUCT dataset, so ROIs can be found and edited
+without scanning the sequences of the dataset, and the contours of the
+ROIs are kept up to date as they are edited instead of being read again
+from every contour.
+"""
+from pydicom import Sequence
+
+from src.Model.ContourStore import ROIContours, read_contour_data, \
+    read_referenced_sop_instance_uid
+
+# Sequences of an RTSS with an item per ROI, and the keyword of the number
+# of the ROI in their items
+ROI_SEQUENCES = (("StructureSetROISequence", "ROINumber"),
+                 ("ROIContourSequence", "ReferencedROINumber"),
+                 ("RTROIObservationsSequence", "ReferencedROINumber"))
+
+
+class RTSSIndex:
+    """
+    Keeps the ROINumber of each ROIName and the position of the items of
+    each ROI in the sequences of an RTSS. The index is updated by the
+    edits made through it. Edits made directly to the dataset that add or
+    remove items are detected by get_rtss_index(..), which then rebuilds
+    the index, and a lookup that finds a different ROI than expected
+    rebuilds it too. Contours whose ContourData is replaced directly are
+    not detected, so they should be edited through the index, or the
+    index rebuilt afterwards.
+
+    Example usage:
+    rtss_index = get_rtss_index(dataset_rtss)
+    roi_number = rtss_index.get_roi_number("Body")
+    rtss_index.rename_roi(roi_number, "External")
+    """
+
+    def __init__(self, rtss):
+        """
+        :param rtss: RTSTRUCT DICOM dataset object
+        """
+        self.rtss = rtss
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        Index every ROI of the RTSS.
+        """
+        # ROIName to ROINumber
+        self.roi_numbers = {}
+        # ROINumber to ROIName
+        self.roi_names = {}
+        # Sequence keyword to dictionary of ROINumber to item index
+        self.indices = {keyword: {} for keyword, _ in ROI_SEQUENCES}
+        # ROINumber to ROIContours and number of contours, calculated on
+        # the first call to get_raw_contour_data()
+        self.contours = None
+
+        for keyword, number_keyword in ROI_SEQUENCES:
+            indices = self.indices[keyword]
+            for i, item in enumerate(self.get_sequence(keyword)):
+                roi_number = item.get(number_keyword)
+                if roi_number is not None:
+                    indices[roi_number] = i
+
+        for item in self.get_sequence("StructureSetROISequence"):
+            if item.get("ROINumber") is None:
+                continue
+            self.roi_numbers[item.get("ROIName")] = item.ROINumber
+            self.roi_names[item.ROINumber] = item.get("ROIName")
+
+        self.state = self.get_state()
+
+    def get_state(self):
+        """
+        :return: the identity and length of each ROI sequence of the RTSS
+        """
+        state = []
+        for keyword, _ in ROI_SEQUENCES:
+            sequence = self.rtss.get(keyword)
+            state.append((id(sequence), len(sequence or [])))
+        return tuple(state)
+
+    def is_current(self):
+        """
+        :return: whether no items were added to or removed from the ROI
+            sequences of the RTSS outside of the index
+        """
+        return self.get_state() == self.state
+
+    def get_sequence(self, keyword, create=False):
+        """
+        :param keyword: keyword of an ROI sequence of the RTSS
+        :param create: whether to add the sequence to the RTSS if missing
+        :return: the sequence, or an empty list if it is missing
+        """
+        if keyword not in self.rtss:
+            if not create:
+                return []
+            setattr(self.rtss, keyword, Sequence())
+        return self.rtss[keyword].value
+
+    def get_roi_number(self, roi_name):
+        """
+        :param roi_name: ROIName
+        :return: ROINumber of the ROI, or None if the RTSS has no ROI of
+            that name
+        """
+        roi_number = self.roi_numbers.get(roi_name)
+        if roi_number is None:
+            return None
+        item = self.get_item("StructureSetROISequence", roi_number)
+        if item is None or item.get("ROIName") != roi_name:
+            self.rebuild()
+            roi_number = self.roi_numbers.get(roi_name)
+        return roi_number
+
+    def get_item(self, keyword, roi_number):
+        """
+        :param keyword: keyword of an ROI sequence of the RTSS
+        :param roi_number: ROINumber
+        :return: the item of the ROI in the sequence, or None
+        """
+        for attempt in range(2):
+            index = self.indices[keyword].get(roi_number)
+            if index is None:
+                return None
+            sequence = self.get_sequence(keyword)
+            if index < len(sequence):
+                item = sequence[index]
+                number_keyword = dict(ROI_SEQUENCES)[keyword]
+                if item.get(number_keyword) == roi_number:
+                    return item
+            self.rebuild()
+        return None
+
+    def add_roi(self, structure_set, roi_contour, roi_observations):
+        """
+        Append the items of a new ROI to the ROI sequences of the RTSS.
+        :param structure_set: StructureSetROISequence item of the ROI
+        :param roi_contour: ROIContourSequence item of the ROI
+        :param roi_observations: RTROIObservationsSequence item of the ROI
+        :return: ROINumber of the new ROI
+        """
+        roi_number = structure_set.ROINumber
+        for (keyword, _), item in zip(
+                ROI_SEQUENCES,
+                (structure_set, roi_contour, roi_observations)):
+            sequence = self.get_sequence(keyword, create=True)
+            sequence.append(item)
+            self.indices[keyword][roi_number] = len(sequence) - 1
+
+        self.roi_numbers[structure_set.ROIName] = roi_number
+        self.roi_names[roi_number] = structure_set.ROIName
+        if self.contours is not None:
+            self.contours[roi_number] = self.get_roi_contours(roi_contour)
+        self.state = self.get_state()
+        return roi_number
+
+    def add_contours(self, roi_number, contours):
+        """
+        Append contours to the ContourSequence of an ROI.
+        :param roi_number: ROINumber
+        :param contours: list of ContourSequence items
+        """
+        roi_contour = self.get_item("ROIContourSequence", roi_number)
+        if "ContourSequence" not in roi_contour:
+            roi_contour.ContourSequence = Sequence()
+        roi_contour.ContourSequence.extend(contours)
+
+        if self.contours is None:
+            return
+        if roi_number not in self.contours:
+            self.contours[roi_number] = self.get_roi_contours(roi_contour)
+            return
+        roi_contours, contours_count = self.contours[roi_number]
+        contour_data, points_count = get_contour_data(contours)
+        self.contours[roi_number] = \
+            (roi_contours.extend(contour_data, points_count),
+             contours_count + len(contours))
+
+    def delete_roi(self, roi_name):
+        """
+        Delete every ROI of a name.
+        :param roi_name: ROIName
+        """
+        roi_number = self.get_roi_number(roi_name)
+        while roi_number is not None:
+            for keyword, _ in ROI_SEQUENCES:
+                indices = self.indices[keyword]
+                index = indices.pop(roi_number, None)
+                if index is None:
+                    continue
+                del self.get_sequence(keyword)[index]
+                for number, i in indices.items():
+                    if i > index:
+                        indices[number] = i - 1
+
+            del self.roi_names[roi_number]
+            if self.contours is not None:
+                self.contours.pop(roi_number, None)
+            self.roi_numbers.pop(roi_name)
+            self.state = self.get_state()
+
+            # Other ROIs may have the same name
+            roi_number = self.find_roi_number(roi_name)
+            if roi_number is not None:
+                self.roi_numbers[roi_name] = roi_number
+
+    def rename_roi(self, roi_number, new_name):
+        """
+        :param roi_number: ROINumber
+        :param new_name: new ROIName of the ROI
+        """
+        item = self.get_item("StructureSetROISequence", roi_number)
+        if item is None:
+            return
+        old_name = item.get("ROIName")
+        item.ROIName = new_name
+        self.roi_names[roi_number] = new_name
+        self.roi_numbers[new_name] = roi_number
+        if self.roi_numbers.get(old_name) == roi_number:
+            del self.roi_numbers[old_name]
+            other_roi_number = self.find_roi_number(old_name)
+            if other_roi_number is not None:
+                self.roi_numbers[old_name] = other_roi_number
+
+    def find_roi_number(self, roi_name):
+        """
+        :param roi_name: ROIName
+        :return: ROINumber of the last indexed ROI of the name, or None
+        """
+        roi_number = None
+        for number, name in self.roi_names.items():
+            if name == roi_name:
+                roi_number = number
+        return roi_number
+
+    def get_raw_contour_data(self):
+        """
+        Get the contours of every ROI. The contours of an ROI are only
+        read from the RTSS the first time, or again if its number of
+        contours has changed outside of the index, and its ROIContours
+        are replaced when it is edited.
+        :return: Tuple (dict_roi, dict_numpoints) of the dictionary of
+            ROIName to ROIContours and the number of points of the ROIs
+        """
+        if not self.is_current():
+            self.rebuild()
+        if self.contours is None:
+            self.contours = {}
+        structure_sets = self.get_sequence("StructureSetROISequence")
+        structure_set_indices = self.indices["StructureSetROISequence"]
+        roi_contours = self.get_sequence("ROIContourSequence")
+
+        dict_roi = {}
+        dict_numpoints = {}
+        for roi_number, index in self.indices["ROIContourSequence"].items():
+            if roi_number not in structure_set_indices:
+                continue
+            roi_contour = roi_contours[index]
+            entry = self.contours.get(roi_number)
+            if entry is None or \
+                    entry[1] != len(roi_contour.get("ContourSequence", [])):
+                entry = self.get_roi_contours(roi_contour)
+                self.contours[roi_number] = entry
+
+            # The name is read from the RTSS, as it may have been renamed
+            roi_name = structure_sets[
+                structure_set_indices[roi_number]].get("ROIName")
+            dict_roi[roi_name] = entry[0]
+            dict_numpoints[roi_name] = entry[0].num_points
+
+        return dict_roi, dict_numpoints
+
+    @staticmethod
+    def get_roi_contours(roi_contour):
+        """
+        :param roi_contour: ROIContourSequence item of an ROI
+        :return: tuple of the ROIContours and the number of contours of
+            the ROI
+        """
+        contours = roi_contour.get("ContourSequence", [])
+        contour_data, points_count = get_contour_data(contours)
+        return ROIContours.from_contours(contour_data, points_count), \
+            len(contours)
+
+
+def get_contour_data(contours):
+    """
+    Get the ContourData of contours and the images they are on. Contours
+    without a ContourImageSequence are ignored.
+    :param contours: list of ContourSequence items
+    :return: tuple of the list of (SOPInstanceUID, ContourData) pairs and
+        the number of points of the contours
+    """
+    contour_data = []
+    points_count = 0
+    for contour in contours:
+        if 'ContourImageSequence' not in contour:
+            continue
+        contour_data.append((read_referenced_sop_instance_uid(contour),
+                             read_contour_data(contour)))
+        points_count += int(contour.NumberOfContourPoints)
+    return contour_data, points_count
+
+
+def get_rtss_index(rtss):
+    """
+    Get the index of an RTSS, which is kept with the dataset and rebuilt
+    when the ROI sequences of the dataset were changed outside of it.
+    :param rtss: RTSTRUCT DICOM dataset object
+    :return: RTSSIndex of the RTSS
+    """
+    rtss_index = getattr(rtss, "rtss_index", None)
+    if rtss_index is None or rtss_index.rtss is not rtss:
+        rtss_index = RTSSIndex(rtss)
+        rtss.rtss_index = rtss_index
+    elif not rtss_index.is_current():
+        rtss_index.rebuild()
+    return rtss_index
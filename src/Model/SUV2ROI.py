@@ -221,6 +221,9 @@ class SUV2ROI:
             for roi in rois.StructureSetROISequence:
                 existing_rois.append(roi.ROIName)
 
+        # The contours of every level are added to the RTSS in one pass
+        rtss_builder = ROI.RTSSBuilder(dataset_rtss)
+
         # Loop through each SUV level
         item_count = len(contours)
         current_progress = 60
@@ -268,13 +271,11 @@ class SUV2ROI:
                         single_array[j].append(rcs_pixels[1])
                         single_array[j].append(z_coord)
 
-                # Create the ROI(s)
+                # Collect the contours of the ROI(s)
                 for array in single_array:
-                    rtss = ROI.create_roi(dataset_rtss, item,
-                                          [{'coords': array, 'ds': dataset}],
-                                          "")
-
-                    # Save the updated rtss
-                    patient_dict_container.set("dataset_rtss", rtss)
-                    patient_dict_container.set("rois",
-                                               ImageLoading.get_roi_info(rtss))
+                    rtss_builder.add_contour(item, array, dataset, "")
+
+        # Save the updated rtss
+        rtss = rtss_builder.build()
+        patient_dict_container.set("dataset_rtss", rtss)
+        patient_dict_container.set("rois", ImageLoading.get_roi_info(rtss))
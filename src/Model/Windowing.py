@@ -1,7 +1,6 @@
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.PTCTDictContainer import PTCTDictContainer
 from src.Model.MovingDictContainer import MovingDictContainer
-from src.Model.CalculateImages import get_pixmaps
 from src.Model.ImageFusion import get_fused_window
 
 
@@ -22,53 +21,45 @@ def windowing_model(text, init):
     window = windowing_limits[0]
     level = windowing_limits[1]
 
-    # Update the dictionary of pixmaps with the update window and
-    # level values
+    # Swap the pixmaps for ones with the new window and level. Slices are
+    # only rendered when they are next displayed, so the visible slices are
+    # rendered when the views update and the rest when scrolled to.
     if init[0]:
-        pixel_values = patient_dict_container.get("pixel_values")
-        pixmap_aspect = patient_dict_container.get("pixmap_aspect")
-        pixmaps_axial, pixmaps_coronal, pixmaps_sagittal = \
-            get_pixmaps(pixel_values, window, level, pixmap_aspect)
-
-        patient_dict_container.set("pixmaps_axial", pixmaps_axial)
-        patient_dict_container.set("pixmaps_coronal", pixmaps_coronal)
-        patient_dict_container.set("pixmaps_sagittal", pixmaps_sagittal)
+        set_pixmaps_window(patient_dict_container, "pixmaps_", window, level)
         patient_dict_container.set("window", window)
         patient_dict_container.set("level", level)
 
     # Update CT
     if init[2]:
-        ct_pixel_values = pt_ct_dict_container.get("ct_pixel_values")
-        ct_pixmap_aspect = pt_ct_dict_container.get("ct_pixmap_aspect")
-        ct_pixmaps_axial, ct_pixmaps_coronal, ct_pixmaps_sagittal = \
-            get_pixmaps(ct_pixel_values, window, level, ct_pixmap_aspect,
-                        fusion=True)
-
-        pt_ct_dict_container.set("ct_pixmaps_axial", ct_pixmaps_axial)
-        pt_ct_dict_container.set("ct_pixmaps_coronal", ct_pixmaps_coronal)
-        pt_ct_dict_container.set("ct_pixmaps_sagittal", ct_pixmaps_sagittal)
+        set_pixmaps_window(pt_ct_dict_container, "ct_pixmaps_", window, level)
         pt_ct_dict_container.set("ct_window", window)
         pt_ct_dict_container.set("ct_level", level)
 
     # Update PT
     if init[1]:
-        pt_pixel_values = pt_ct_dict_container.get("pt_pixel_values")
-        pt_pixmap_aspect = pt_ct_dict_container.get("pt_pixmap_aspect")
-        pt_pixmaps_axial, pt_pixmaps_coronal, pt_pixmaps_sagittal = \
-            get_pixmaps(pt_pixel_values, window, level, pt_pixmap_aspect,
-                        fusion=True, color="Heat")
-
-        pt_ct_dict_container.set("pt_pixmaps_axial", pt_pixmaps_axial)
-        pt_ct_dict_container.set("pt_pixmaps_coronal", pt_pixmaps_coronal)
-        pt_ct_dict_container.set("pt_pixmaps_sagittal", pt_pixmaps_sagittal)
+        set_pixmaps_window(pt_ct_dict_container, "pt_pixmaps_", window, level)
         pt_ct_dict_container.set("pt_window", window)
         pt_ct_dict_container.set("pt_level", level)
 
     # Update Fusion
     if init[3]:
-        fusion_axial, fusion_coronal, fusion_sagittal, tfm = \
+        fusion_axial, fusion_sagittal, fusion_coronal, tfm = \
             get_fused_window(level, window)
         patient_dict_container.set("color_axial", fusion_axial)
         patient_dict_container.set("color_coronal", fusion_coronal)
         patient_dict_container.set("color_sagittal", fusion_sagittal)
         moving_dict_container.set("tfm", tfm)
+
+
+def set_pixmaps_window(dict_container, prefix, window, level):
+    """
+    Replaces the axial, coronal and sagittal pixmaps in a dict container
+    with pixmaps of the same volume with a new window and level.
+    :param dict_container: The dict container holding the pixmaps
+    :param prefix: The prefix of the pixmaps' keys, e.g. "ct_pixmaps_"
+    :param window: Window width of windowing function
+    :param level: Level value of windowing function
+    """
+    for view in ("axial", "coronal", "sagittal"):
+        pixmaps = dict_container.get(prefix + view)
+        dict_container.set(prefix + view, pixmaps.with_window(window, level))
@@ -88,7 +88,8 @@ class BatchProcess:
             # Convert paths to a common file system representation
             for i, file in enumerate(files):
                 files[i] = Path(file).as_posix()
-            read_data_dict, file_names_dict = cls.get_datasets(files)
+            read_data_dict, file_names_dict = cls.get_datasets(
+                files, defer_pixels=True)
             path = os.path.dirname(
                 os.path.commonprefix(list(file_names_dict.values())))
         # Otherwise raise an exception (OnkoDICOM does not support the
@@ -120,10 +121,12 @@ class BatchProcess:
         return True
 
     @classmethod
-    def get_datasets(cls, file_path_list):
+    def get_datasets(cls, file_path_list, defer_pixels=False):
         """
         Gets datasets in the passed-in file path.
         :param file_path_list: list of file paths to load datasets from.
+        :param defer_pixels: if True, the pixel data of image slices is
+                             only read when it is first accessed.
         """
         read_data_dict = {}
         file_names_dict = {}
@@ -140,7 +143,7 @@ class BatchProcess:
         for file in ImageLoading.natural_sort(file_path_list):
             # Try to open it
             try:
-                read_file = dcmread(file)
+                read_file = ImageLoading.read_dicom_file(file, defer_pixels)
             except InvalidDicomError:
                 continue
 
@@ -151,6 +154,10 @@ class BatchProcess:
                     slice_name = slice_count
                     slice_count += 1
                 else:
+                    # RT and SR datasets are edited and saved in place
+                    if defer_pixels:
+                        ImageLoading.load_deferred_elements(read_file)
+
                     # Add one (the first) clinical data SR
                     if allowed_class["name"] == 'sr':
                         sr_type = read_file.SeriesDescription
@@ -2,6 +2,7 @@ import os
 from src.Model import CalculateDVHs
 from src.Model import ImageLoading
 from src.Model.batchprocessing.BatchProcess import BatchProcess
+from src.Model.DVHCache import DVHCache
 from src.Model.PatientDictContainer import PatientDictContainer
 import pandas as pd
 
@@ -89,15 +90,16 @@ class BatchProcessDVH2CSV(BatchProcess):
             self.progress_callback.emit(("Calculating DVH...", 60))
             read_data_dict = self.patient_dict_container.dataset
             dataset_rtss = self.patient_dict_container.dataset['rtss']
-            dataset_rtdose = self.patient_dict_container.dataset['rtdose']
             rois = self.patient_dict_container.get("rois")
             try:
                 dict_thickness = \
                     ImageLoading.get_thickness_dict(dataset_rtss,
                                                     read_data_dict)
-                raw_dvh = ImageLoading.calc_dvhs(dataset_rtss, dataset_rtdose,
-                                                 rois, dict_thickness,
-                                                 self.interrupt_flag)
+                raw_dvh = ImageLoading.calc_dvhs_from_files(
+                    self.patient_dict_container.filepaths['rtss'],
+                    self.patient_dict_container.filepaths['rtdose'],
+                    rois, dict_thickness, self.interrupt_flag,
+                    dvh_cache=DVHCache())
             except TypeError:
                 self.summary = "DVH_TYPE_ERROR"
                 return False
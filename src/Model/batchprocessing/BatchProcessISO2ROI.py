@@ -1,3 +1,4 @@
+import logging
 from src.Controller.PathHandler import data_path
 from src.Model import InitialModel
 from src.Model import ImageLoading
@@ -124,7 +125,16 @@ class BatchProcessISO2ROI(BatchProcess):
 
         # Calculate boundaries
         self.progress_callback.emit(("Calculating boundaries...", 60))
-        boundaries = iso2roi.calculate_isodose_boundaries(isodose_levels)
+        boundaries = iso2roi.calculate_isodose_boundaries(
+            isodose_levels, self.progress_callback, self.interrupt_flag,
+            progress_range=(60, 80))
+
+        # Stop loading
+        if self.interrupt_flag.is_set():
+            logging.info("Stopped ISO2ROI")
+            self.patient_dict_container.clear()
+            self.summary = "INTERRUPT"
+            return False
 
         # Return if boundaries could not be calculated
         if not boundaries:
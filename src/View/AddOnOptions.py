@@ -884,8 +884,10 @@ class ChangeDefaultDirectory(object):
     def create_change_default_directory_frame(self):
         config = Configuration()
         default_directory = None
+        use_dicomdir = False
         try:
             default_directory = config.get_default_directory()
+            use_dicomdir = config.get_use_dicomdir()
         except SqlError:
             config.set_up_config_db()
             QtWidgets.QMessageBox.critical(
@@ -937,8 +939,15 @@ class ChangeDefaultDirectory(object):
         self.change_default_directory_input_widget.setLayout(
             self.change_default_directory_input_horizontal_box)
         self.change_default_directory_vertical_layout.addWidget(
-            self.change_default_directory_input_widget, 1,
-            QtCore.Qt.AlignTop)
+            self.change_default_directory_input_widget)
+
+        # Create a checkbox to build directory searches from DICOMDIR files.
+        # Files a DICOMDIR does not list are still searched.
+        self.use_dicomdir_checkbox = QtWidgets.QCheckBox(
+            "Use DICOMDIR files to find the images of a directory")
+        self.use_dicomdir_checkbox.setChecked(use_dicomdir)
+        self.change_default_directory_vertical_layout.addWidget(
+            self.use_dicomdir_checkbox, 1, QtCore.Qt.AlignTop)
 
         self.window.change_default_directory_frame.setLayout(
             self.change_default_directory_vertical_layout)
@@ -179,6 +179,7 @@ class ImageFusionAxialView(DicomView):
         label = QtWidgets.QGraphicsPixmapItem(image)
         self.scene = GraphicsScene(
             label, self.horizontal_view, self.vertical_view)
+        self.prefetch_pixmaps(pixmaps, slider_id)
 
     def update_view(self, zoom_change=False):
         """
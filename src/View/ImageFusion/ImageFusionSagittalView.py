@@ -30,6 +30,7 @@ class ImageFusionSagittalView(DicomView):
         label = QtWidgets.QGraphicsPixmapItem(image)
         self.scene = GraphicsScene(
             label, self.horizontal_view, self.vertical_view)
+        self.prefetch_pixmaps(pixmaps, slider_id)
 
     def roi_display(self):
         """
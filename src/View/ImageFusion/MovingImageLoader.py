@@ -1,11 +1,12 @@
 import os
-import platform
+import threading
 from pathlib import Path
 
 from PySide6 import QtCore
 from pydicom import dcmread
 
 from src.Model import ImageLoading
+from src.Model.DVHCache import DVHCache
 from src.Model.MovingDictContainer import MovingDictContainer
 from src.Model.MovingModel import create_moving_model
 from src.Model.ROI import create_initial_rtss_from_ct
@@ -25,6 +26,9 @@ class MovingImageLoader(ImageLoader):
 
     def __init__(self, *args, **kwargs):
         super(MovingImageLoader, self).__init__(*args, **kwargs)
+        self.calc_dvh = False
+        # Set when the user has answered whether to calculate DVHs
+        self.advised_calc_dvh = threading.Event()
 
     def load(self, interrupt_flag, progress_callback):
         """
@@ -42,7 +46,7 @@ class MovingImageLoader(ImageLoader):
             # Gets the common root folder.
             path = os.path.dirname(os.path.commonprefix(self.selected_files))
             read_data_dict, file_names_dict = ImageLoading.get_datasets(
-                self.selected_files)
+                self.selected_files, defer_pixels=True)
         except ImageLoading.NotAllowedClassError:
             raise ImageLoading.NotAllowedClassError
 
@@ -65,8 +69,13 @@ class MovingImageLoader(ImageLoader):
                 self.update_calc_dvh)
             self.signal_request_calc_dvh.emit()
 
-            while not self.advised_calc_dvh:
-                pass
+            # Wait for the answer without busy-waiting, while still
+            # responding to the interrupt flag
+            while not self.advised_calc_dvh.wait(
+                    ImageLoading.LOADING_POLL_INTERVAL):
+                if interrupt_flag.is_set():  # Stop loading.
+                    print("stopped")
+                    return False
 
         if 'rtss' in file_names_dict:
             dataset_rtss = dcmread(file_names_dict['rtss'])
@@ -104,28 +113,11 @@ class MovingImageLoader(ImageLoader):
             moving_dict_container.set("pixluts", dict_pixluts)
 
             if 'rtdose' in file_names_dict and self.calc_dvh:
-                dataset_rtdose = dcmread(file_names_dict['rtdose'])
-
-                # Spawn-based platforms (i.e Windows and MacOS) have a large
-                # overhead when creating a new process, which ends up making
-                # multiprocessing on these platforms more expensive than linear
-                # calculation. As such, multiprocessing is only available on
-                # Linux until a better solution is found.
-                fork_safe_platforms = ['Linux']
-                if platform.system() in fork_safe_platforms:
-                    progress_callback.emit(("Calculating DVHs...", 60))
-                    raw_dvh = ImageLoading.multi_calc_dvh(dataset_rtss,
-                                                          dataset_rtdose,
-                                                          rois,
-                                                          dict_thickness)
-                else:
-                    progress_callback.emit(
-                        ("Calculating DVHs... (This may take a while)", 60))
-                    raw_dvh = ImageLoading.calc_dvhs(dataset_rtss,
-                                                     dataset_rtdose,
-                                                     rois,
-                                                     dict_thickness,
-                                                     interrupt_flag)
+                progress_callback.emit(("Calculating DVHs...", 60))
+                raw_dvh = ImageLoading.calc_dvhs_from_files(
+                    file_names_dict['rtss'], file_names_dict['rtdose'],
+                    rois, dict_thickness, interrupt_flag,
+                    dvh_cache=DVHCache())
 
                 if interrupt_flag.is_set():  # Stop loading.
                     print("stopped")
@@ -154,6 +146,10 @@ class MovingImageLoader(ImageLoader):
 
         return True
 
+    def update_calc_dvh(self, advice):
+        self.calc_dvh = advice
+        self.advised_calc_dvh.set()
+
     def load_temp_rtss(self, path, progress_callback, interrupt_flag):
         """
         Generate a temporary rtss and load its data into
@@ -1,12 +1,13 @@
+import logging
 import os
-import platform
+import traceback
 from pathlib import Path
 
 from PySide6 import QtCore
 from pydicom import dcmread
 
 from src.Model import ImageLoading
-from src.Model.CalculateDVHs import dvh2rtdose, rtdose2dvh
+from src.Model.CalculateImages import convert_first_slice, convert_raw_data
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.ROI import create_initial_rtss_from_ct
 from src.Model.GetPatientInfo import DicomTree
@@ -19,7 +20,17 @@ class ImageLoader(QtCore.QObject):
     to store all the DICOM-related data used to create the patient window.
     """
 
-    signal_request_calc_dvh = QtCore.Signal()
+    # Signal that emits the results of a stage of loading from the thread
+    # of the stage. It is received on the GUI thread, which the loader
+    # belongs to.
+    signal_stage_finished = QtCore.Signal(dict)
+
+    # Signal that emits the results of a stage of loading once they have
+    # been added to the PatientDictContainer
+    signal_stage_loaded = QtCore.Signal(dict)
+
+    # Signal that emits when a stage of loading raises an exception
+    signal_stage_error = QtCore.Signal(tuple)
 
     def __init__(self, selected_files, existing_rtss, parent_window,
                  *args, **kwargs):
@@ -27,11 +38,24 @@ class ImageLoader(QtCore.QObject):
         self.selected_files = selected_files
         self.parent_window = parent_window
         self.existing_rtss = existing_rtss
-        self.calc_dvh = False
-        self.advised_calc_dvh = False
+        self.read_data_dict = None
+        # The values in the PatientDictContainer of the keys of each stage
+        # when the stage started
+        self.stage_start_values = {}
+
+        self.signal_stage_finished.connect(self.stage_loaded)
+        if parent_window is not None:
+            self.signal_stage_loaded.connect(
+                parent_window.signal_stage_loaded)
+            self.signal_stage_error.connect(parent_window.on_error)
 
     def load(self, interrupt_flag, progress_callback):
         """
+        Loads the selected files in stages. The method returns once the
+        image stack is sorted and its first slice is decoded. The image
+        volume, pixel LUTs and contours are then loaded in the background,
+        and added to the PatientDictContainer on the GUI thread as each
+        of them finishes (see stage_loaded).
         :param interrupt_flag: A threading.Event() object that tells the
         function to stop loading. :param progress_callback: A signal that
         receives the current progress of the loading. :return:
@@ -43,7 +67,7 @@ class ImageLoader(QtCore.QObject):
             # Gets the common root folder.
             path = os.path.dirname(os.path.commonprefix(self.selected_files))
             read_data_dict, file_names_dict = ImageLoading.get_datasets(
-                self.selected_files)
+                self.selected_files, defer_pixels=True)
         except ImageLoading.NotAllowedClassError:
             raise ImageLoading.NotAllowedClassError
 
@@ -70,106 +94,98 @@ class ImageLoader(QtCore.QObject):
             print("stopped")
             return False
 
+        # Decode the first slice before starting the background stages, so
+        # that images that cannot be decoded fail early. The main window
+        # shows the first slice until the rest of the volume is decoded.
+        progress_callback.emit(("Decoding first slice...", 10))
+        is_ct = read_data_dict[0].Modality == "CT"
+        patient_dict_container.set("scaled", True)
+        patient_dict_container.set(
+            "pixel_values", convert_first_slice(read_data_dict, is_ct))
+
+        # The stages get their own copy of the dictionary of datasets, as
+        # the temporary RTSS may be added to it while they are running
+        self.read_data_dict = read_data_dict
+        image_datasets = dict(read_data_dict)
+        patient_dict_container.set("loading_stages", set())
+        self.start_loading_stage(("pixel_values",), convert_raw_data,
+                                 image_datasets, False, is_ct)
+        self.start_loading_stage(("pixluts",), ImageLoading.get_pixluts,
+                                 image_datasets)
+
         if 'rtss' in file_names_dict:
             dataset_rtss = dcmread(file_names_dict['rtss'])
 
-            progress_callback.emit(("Getting ROI info...", 10))
+            progress_callback.emit(("Getting ROI info...", 20))
             rois = ImageLoading.get_roi_info(dataset_rtss)
 
-            if interrupt_flag.is_set():  # Stop loading.
-                return False
-
-            progress_callback.emit(("Getting contour data...", 30))
-            dict_raw_contour_data, dict_numpoints = \
-                ImageLoading.get_raw_contour_data(dataset_rtss)
-
-            # Determine which ROIs are one slice thick
-            dict_thickness = ImageLoading.get_thickness_dict(
-                dataset_rtss, read_data_dict)
-
-            if interrupt_flag.is_set():  # Stop loading.
-                return False
-
-            progress_callback.emit(("Getting pixel LUTs...", 50))
-            dict_pixluts = ImageLoading.get_pixluts(read_data_dict)
-
             if interrupt_flag.is_set():  # Stop loading.
                 return False
 
             # Add RTSS values to PatientDictContainer
             patient_dict_container.set("rois", rois)
-            patient_dict_container.set("raw_contour", dict_raw_contour_data)
-            patient_dict_container.set("num_points", dict_numpoints)
-            patient_dict_container.set("pixluts", dict_pixluts)
-
-            if 'rtdose' in file_names_dict:
-                # Check to see if DVH data exists in the RT Dose. If
-                # it is there, return (it will be populated later). If
-                # not, ask if the user wants it calculated.
-                try:
-                    dvh_data = rtdose2dvh()
-                    if bool(dvh_data) and not dvh_data["diff"]:
-                        return True
-                except KeyError:
-                    pass
-
-                self.parent_window.signal_advise_calc_dvh.connect(
-                    self.update_calc_dvh)
-                self.signal_request_calc_dvh.emit()
-
-                while not self.advised_calc_dvh:
-                    pass
-
-                # Calculate DVHs
-                if self.calc_dvh:
-                    dataset_rtdose = dcmread(file_names_dict['rtdose'])
-
-                    # Spawn-based platforms (i.e Windows and MacOS) have
-                    # a large overhead when creating a new process, which
-                    # ends up making multiprocessing on these platforms more
-                    # expensive than linear calculation. As such,
-                    # multiprocessing is only available on Linux until a better
-                    # solution is found.
-                    fork_safe_platforms = ['Linux']
-                    if platform.system() in fork_safe_platforms:
-                        progress_callback.emit(("Calculating DVHs...", 60))
-                        raw_dvh = \
-                            ImageLoading.multi_calc_dvh(dataset_rtss,
-                                                        dataset_rtdose, rois,
-                                                        dict_thickness)
-                    else:
-                        progress_callback.emit(
-                            ("Calculating DVHs... (This may take a while)",
-                             60))
-                        raw_dvh = \
-                            ImageLoading.calc_dvhs(dataset_rtss,
-                                                   dataset_rtdose, rois,
-                                                   dict_thickness,
-                                                   interrupt_flag)
-
-                    if interrupt_flag.is_set():  # Stop loading.
-                        return False
-
-                    progress_callback.emit(("Converging to zero...", 80))
-                    dvh_x_y = ImageLoading.converge_to_0_dvh(raw_dvh)
-
-                    if interrupt_flag.is_set():  # Stop loading.
-                        return False
-
-                    # Add DVH values to PatientDictContainer
-                    patient_dict_container.set("raw_dvh", raw_dvh)
-                    patient_dict_container.set("dvh_x_y", dvh_x_y)
-                    patient_dict_container.set("dvh_outdated", False)
-
-                    # Write DVH data to the RT Dose
-                    dvh2rtdose(raw_dvh)
-
-                    return True
+            self.start_loading_stage(("raw_contour", "num_points"),
+                                     ImageLoading.get_raw_contour_data,
+                                     dataset_rtss)
+
+            # DVHs are calculated by the DVH tab, as their ROIs are selected
         else:
             self.load_temp_rtss(path, progress_callback, interrupt_flag)
 
         return True
 
+    def start_loading_stage(self, keys, fn, *args):
+        """
+        Start a stage of loading in the background. Its results are added
+        to the PatientDictContainer by stage_loaded, on the GUI thread.
+        Until then, the keys of the stage are in the "loading_stages" set
+        of the PatientDictContainer. The value of each key when the stage
+        starts is kept, so that the results of the stage do not replace
+        values set while it is running (e.g. by editing the ROIs).
+        :param keys: Tuple of the PatientDictContainer keys of the results
+        of the stage. A stage with several keys returns a tuple.
+        :param fn: The function of the stage.
+        :param args: The function's parameters.
+        """
+        patient_dict_container = PatientDictContainer()
+        for key in keys:
+            self.stage_start_values[key] = patient_dict_container.get(key)
+        patient_dict_container.get("loading_stages").update(keys)
+
+        def stage_finished(stage):
+            error = stage.exception()
+            if error is not None:
+                # Reported the way errors of the loader's worker are
+                trace = "".join(traceback.format_exception(
+                    type(error), error, error.__traceback__))
+                logging.error(trace)
+                self.signal_stage_error.emit((type(error), error, trace))
+                return
+            values = stage.result() if len(keys) > 1 else (stage.result(),)
+            self.signal_stage_finished.emit(dict(zip(keys, values)))
+
+        ImageLoading.start_loading_stage(fn, *args).add_done_callback(
+            stage_finished)
+
+    def stage_loaded(self, values):
+        """
+        Executes on the GUI thread when a stage of loading has finished.
+        Adds the results of the stage to the PatientDictContainer, unless
+        another patient has been opened since. Results whose key has been
+        set since the stage started are dropped, as they are out of date.
+        :param values: Dictionary of the results of the stage.
+        """
+        patient_dict_container = PatientDictContainer()
+        if patient_dict_container.dataset is not self.read_data_dict:
+            return
+        patient_dict_container.get("loading_stages").difference_update(values)
+        values = {key: value for key, value in values.items()
+                  if patient_dict_container.get(key)
+                  is self.stage_start_values[key]}
+        for key, value in values.items():
+            patient_dict_container.set(key, value)
+        self.signal_stage_loaded.emit(values)
+
     def load_temp_rtss(self, path, progress_callback, interrupt_flag):
         """
         Generate a temporary rtss and load its data into
@@ -197,10 +213,6 @@ class ImageLoader(QtCore.QObject):
         rois = ImageLoading.get_roi_info(rtss)
         patient_dict_container.set("rois", rois)
 
-        # Set pixluts
-        dict_pixluts = ImageLoading.get_pixluts(patient_dict_container.dataset)
-        patient_dict_container.set("pixluts", dict_pixluts)
-
         # Add RT Struct file path and dataset to patient dict container
         patient_dict_container.filepaths['rtss'] = rtss_path
         patient_dict_container.dataset['rtss'] = rtss
@@ -211,7 +223,3 @@ class ImageLoader(QtCore.QObject):
         ordered_dict = DicomTree(None).dataset_to_dict(rtss)
         patient_dict_container.set("dict_dicom_tree_rtss", ordered_dict)
         patient_dict_container.set("selected_rois", [])
-
-    def update_calc_dvh(self, advice):
-        self.advised_calc_dvh = True
-        self.calc_dvh = advice
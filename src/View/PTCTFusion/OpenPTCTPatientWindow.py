@@ -8,6 +8,7 @@ from PySide6.QtWidgets import QWidget, QTreeWidget, QTreeWidgetItem, \
     QLabel, QLineEdit, QSizePolicy, QPushButton
 
 from src.Model.DICOM import DICOMDirectorySearch
+from src.Model.DICOM.DICOMHeaderIndex import DICOMHeaderIndex
 from src.Model.Worker import Worker
 from src.View.PTCTFusion.PTCTProgressWindow import PTCTProgressWindow
 from src.View.resources_open_patient_rc import *
@@ -225,6 +226,9 @@ class UIOpenPTCTPatientWindow(object):
               self.threadpool.maxThreadCount())
         # Create interrupt event for stopping the directory search
         self.interrupt_flag = threading.Event()
+        # Index of previously searched files, so rescans only read new or
+        # changed files
+        self.header_index = DICOMHeaderIndex()
 
         # Bind all texts into the buttons and labels
         self.retranslate_ui(open_pt_ct_window_instance)
@@ -298,9 +302,12 @@ class UIOpenPTCTPatientWindow(object):
             self.interrupt_flag.clear()
 
             # Then, create a new thread that will load the selected folder
+            use_dicomdir = DICOMDirectorySearch.get_use_dicomdir()
             worker = Worker(DICOMDirectorySearch.get_dicom_structure,
                             self.filepath,
-                            self.interrupt_flag, progress_callback=True)
+                            self.interrupt_flag, progress_callback=True,
+                            header_index=self.header_index,
+                            use_dicomdir=use_dicomdir)
             worker.signals.result.connect(self.on_search_complete)
             worker.signals.progress.connect(self.search_progress)
 
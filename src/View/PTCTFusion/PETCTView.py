@@ -233,6 +233,11 @@ class PetCtView(QtWidgets.QWidget):
         self.scene = QtWidgets.QGraphicsScene()
         self.scene.addItem(label)
 
+        # Render the neighbouring slices once the event loop is idle
+        QtCore.QTimer.singleShot(0, lambda: (
+            ct_pixmaps.prefetch(slider_id),
+            pt_pixmaps.prefetch(int(m * slider_id))))
+
     def zoom_in(self):
         """
         Zooms in on PET/CT
@@ -49,7 +49,7 @@ class PTCTImageLoader(ImageLoader):
         progress_callback.emit(("Finding PT Files...", 20))
         try:
             pt_data_dict, pt_names_dict = ImageLoading.get_datasets(
-                self.selected_files, "PT")
+                self.selected_files, "PT", defer_pixels=True)
         except ImageLoading.NotAllowedClassError:
             raise ImageLoading.NotAllowedClassError
         if interrupt_flag.is_set():
@@ -59,7 +59,7 @@ class PTCTImageLoader(ImageLoader):
         progress_callback.emit(("Finding CT Files...", 40))
         try:
             ct_data_dict, ct_names_dict = ImageLoading.get_datasets(
-                self.selected_files, "CT")
+                self.selected_files, "CT", defer_pixels=True)
         except ImageLoading.NotAllowedClassError:
             raise ImageLoading.NotAllowedClassError
         if interrupt_flag.is_set():
@@ -20,6 +20,10 @@ class ProgressWindow(QDialog):
     # Signal that emits when calc dvh is advised
     signal_advise_calc_dvh = QtCore.Signal(bool)
 
+    # Signal that emits when a background stage of loading finishes,
+    # which may be after loading has completed
+    signal_stage_loaded = QtCore.Signal(dict)
+
     def __init__(self, *args, **kwargs):
         super(ProgressWindow, self).__init__(*args, **kwargs)
 
@@ -9,11 +9,17 @@ from PySide6 import QtWidgets, QtCore, QtGui
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 
 from src.Controller.PathHandler import resource_path
-from src.Model import ImageLoading
+from src.Model import DVHCalculator, ImageLoading
 from src.Model.CalculateDVHs import dvh2csv, dvh2rtdose, rtdose2dvh
+from src.Model.DVHCache import DVHCache
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.Worker import Worker
 
+# Priorities of the DVH workers on the thread pool. The DVHs of selected
+# ROIs are calculated before the DVHs of the remaining ROIs.
+DVH_SELECTED_PRIORITY = 1
+DVH_BACKGROUND_PRIORITY = -1
+
 
 class DVHTab(QtWidgets.QWidget):
 
@@ -29,6 +35,24 @@ class DVHTab(QtWidgets.QWidget):
 
         self.selected_rois = self.patient_dict_container.get("selected_rois")
 
+        # DVHs that are not in the RT Dose are calculated when their ROI is
+        # selected, on the application's thread pool. The dose grid is
+        # shared by all calculations, and the workers read a copy of the
+        # RTSS, which is taken again once the RTSS has been edited.
+        self.threadpool = QtCore.QThreadPool.globalInstance()
+        self.dvh_cache = DVHCache()
+        self.dose_grid = None
+        self.rois = self.patient_dict_container.get("rois")
+        self.dataset_rtss = None
+        self.dict_thickness = None
+        self.thickness_rtss = None
+        self.calculation_lock = threading.Lock()
+        self.pending_rois = set()
+        self.background_rois = None
+        self.unsaved_dvhs = False
+        self.interrupt_flag = threading.Event()
+        self.destroyed.connect(self.interrupt_flag.set)
+
         self.dvh_tab_layout = QtWidgets.QVBoxLayout()
 
         try:
@@ -42,7 +66,7 @@ class DVHTab(QtWidgets.QWidget):
             if self.dvh_calculated:
                 self.init_layout_dvh()
             else:
-                self.init_layout_no_dvh()
+                self.start_dvh_calculation()
 
         self.setLayout(self.dvh_tab_layout)
 
@@ -231,8 +255,194 @@ class DVHTab(QtWidgets.QWidget):
         self.dvh_calculated = True
         self.init_layout_dvh()
 
+    def start_dvh_calculation(self):
+        """
+        Show the DVH plot without calculating every DVH first. The DVHs
+        of selected ROIs are calculated as they are selected, and the
+        remaining DVHs are filled in by a low priority worker.
+        """
+        if not self.patient_dict_container.has_attribute("raw_dvh"):
+            self.patient_dict_container.set("raw_dvh", {})
+            self.patient_dict_container.set("dvh_x_y", {})
+        raw_dvh = self.patient_dict_container.get("raw_dvh")
+        self.selected_rois = [roi for roi in self.selected_rois or []
+                              if roi in raw_dvh]
+        self.dvh_calculated = True
+        self.init_layout_dvh()
+        self.calc_selected_dvhs()
+        self.start_background_dvhs()
+
+    def rtss_modified(self):
+        """
+        Check whether the RTSS has been edited since the DVH workers were
+        started. The copy of an edited RTSS is dropped, and the DVHs being
+        calculated from it are discarded.
+        :return: True if the RTSS has been edited.
+        """
+        rois = self.patient_dict_container.get("rois")
+        if rois is self.rois:
+            return False
+        self.dataset_rtss = None
+        self.rois = rois
+        self.pending_rois.clear()
+        self.background_rois = None
+        return True
+
+    def copy_rtss(self):
+        """
+        :return: A copy of the contours of the ROIs without a DVH for the
+            DVH workers, so that they never read an RTSS while it is
+            being edited.
+        """
+        if self.dataset_rtss is None:
+            raw_dvh = self.patient_dict_container.get("raw_dvh") or {}
+            self.dataset_rtss = ImageLoading.copy_rtss_contours(
+                self.patient_dict_container.get("dataset_rtss"),
+                [roi for roi in self.rois if roi not in raw_dvh])
+        return self.dataset_rtss
+
+    def calc_selected_dvhs(self):
+        """
+        Start calculating the DVHs of the selected ROIs that do not have
+        one yet.
+        """
+        raw_dvh = self.patient_dict_container.get("raw_dvh")
+        rois = self.rois
+        selected_rois = self.patient_dict_container.get("selected_rois")
+        missing = [roi for roi in selected_rois
+                   if roi in rois and roi not in raw_dvh
+                   and roi not in self.pending_rois]
+        if not missing:
+            return
+
+        self.pending_rois.update(missing)
+        worker = Worker(self.calc_roi_dvhs, self.copy_rtss(), rois, missing)
+        worker.signals.result.connect(
+            lambda result: self.roi_dvhs_calculated(result, rois))
+        self.threadpool.start(worker, DVH_SELECTED_PRIORITY)
+
+    def start_background_dvhs(self):
+        """
+        Start calculating the DVHs of all the ROIs that do not have one,
+        in chunks, on a low priority worker. The worker stops once the
+        RTSS is edited.
+        """
+        rois = self.rois
+        worker = Worker(self.calc_background_dvhs, self.copy_rtss(), rois,
+                        self.interrupt_flag, progress_callback=True)
+        worker.signals.progress.connect(
+            lambda result: self.roi_dvhs_calculated(result, rois))
+        worker.signals.result.connect(
+            lambda result: self.background_dvhs_calculated(rois))
+        self.threadpool.start(worker, DVH_BACKGROUND_PRIORITY)
+
+    def calc_roi_dvhs(self, dataset_rtss, rois, roi_list):
+        """
+        Calculate the DVHs of ROIs in this thread.
+        :param dataset_rtss: The copy of the RTSS of the workers.
+        :param rois: Dictionary of the ROIs of the RTSS.
+        :param roi_list: List of ROINumbers.
+        :return: Dictionary of ROINumber to DVH.
+        """
+        with self.calculation_lock:
+            if self.dose_grid is None:
+                self.dose_grid = DVHCalculator.DoseGrid(self.rt_dose)
+            if self.thickness_rtss is not dataset_rtss:
+                self.dict_thickness = ImageLoading.get_thickness_dict(
+                    dataset_rtss, self.patient_dict_container.dataset)
+                self.thickness_rtss = dataset_rtss
+            dict_thickness = self.dict_thickness
+        return ImageLoading.calc_dvhs_in_process(
+            dataset_rtss, self.dose_grid,
+            {roi: rois[roi] for roi in roi_list if roi in rois},
+            dict_thickness, dvh_cache=self.dvh_cache)
+
+    def calc_background_dvhs(self, dataset_rtss, rois, interrupt_flag,
+                             progress_callback):
+        """
+        Calculate the DVHs of the ROIs that do not have one yet, emitting
+        the DVHs of each chunk of ROIs as they are calculated.
+        :param dataset_rtss: The copy of the RTSS of the workers.
+        :param rois: Dictionary of the ROIs of the RTSS.
+        :param interrupt_flag: A threading.Event() object that tells the
+            function to stop calculation.
+        :param progress_callback: A signal that receives the dictionary of
+            DVHs of each chunk.
+        """
+        roi_list = list(rois)
+        for i in range(0, len(roi_list), ImageLoading.DVH_CHUNK_SIZE):
+            # Stop when the RTSS has been edited since the worker started
+            if interrupt_flag.is_set() or rois is not self.rois:
+                return
+            # ROIs calculated since the worker started are skipped
+            raw_dvh = self.patient_dict_container.get("raw_dvh")
+            if raw_dvh is None:
+                return
+            chunk = [roi for roi in roi_list[i:i + ImageLoading.DVH_CHUNK_SIZE]
+                     if roi not in raw_dvh and roi not in self.pending_rois]
+            if chunk:
+                progress_callback.emit(
+                    self.calc_roi_dvhs(dataset_rtss, rois, chunk))
+
+    def roi_dvhs_calculated(self, dict_dvh, rois):
+        """
+        Add calculated DVHs to the patient and redraw the plot.
+        :param dict_dvh: Dictionary of ROINumber to DVH.
+        :param rois: Dictionary of the ROIs the DVHs were calculated from.
+        """
+        # DVHs of an RTSS that has since been edited are discarded
+        if self.interrupt_flag.is_set() or rois is not self.rois:
+            return
+        self.pending_rois.difference_update(dict_dvh)
+        raw_dvh = self.patient_dict_container.get("raw_dvh")
+        dvh_x_y = self.patient_dict_container.get("dvh_x_y")
+        if raw_dvh is None or dvh_x_y is None:
+            return
+        new_dvhs = {roi: dvh for roi, dvh in dict_dvh.items()
+                    if roi not in raw_dvh}
+        raw_dvh.update(new_dvhs)
+        dvh_x_y.update(ImageLoading.converge_to_0_dvh(new_dvhs))
+        if new_dvhs:
+            self.unsaved_dvhs = True
+        self.save_calculated_dvhs()
+
+        selected_rois = self.patient_dict_container.get("selected_rois")
+        if any(roi in selected_rois for roi in new_dvhs):
+            self.update_plot()
+
+    def background_dvhs_calculated(self, rois):
+        """
+        Executes when the background worker has gone through every ROI.
+        :param rois: Dictionary of the ROIs the DVHs were calculated from.
+        """
+        if self.interrupt_flag.is_set() or rois is not self.rois:
+            return
+        self.background_rois = rois
+        self.save_calculated_dvhs()
+
+    def save_calculated_dvhs(self):
+        """
+        Write the DVHs to the RT Dose once the DVH of every ROI has been
+        calculated, as was done when all the DVHs were calculated while
+        the patient was loaded. DVHs of an edited RTSS are not written,
+        since they are written when they are recalculated.
+        """
+        raw_dvh = self.patient_dict_container.get("raw_dvh")
+        if raw_dvh is None or not self.unsaved_dvhs \
+                or self.background_rois is not self.rois \
+                or self.patient_dict_container.get("dvh_outdated") \
+                or any(roi not in raw_dvh for roi in self.rois):
+            return
+        self.unsaved_dvhs = False
+        dvh2rtdose(raw_dvh)
+
     def update_plot(self):
         if self.dvh_calculated:
+            # Start again on the edited RTSS, for the ROIs without a DVH
+            if self.rtss_modified():
+                self.start_background_dvhs()
+            self.calc_selected_dvhs()
+
             # Get new list of selected rois that have DVHs calculated
             self.selected_rois = [roi for roi in self.patient_dict_container.get("selected_rois")
                                   if roi in self.raw_dvh.keys()]
@@ -293,6 +503,10 @@ class DVHTab(QtWidgets.QWidget):
 
             # Initialise the display
             self.dvh_calculation_finished()
+
+            # Calculate the DVHs of ROIs that are not in the RT Dose
+            if incomplete:
+                self.start_background_dvhs()
         else:
             result.pop("diff")
             self.init_layout_no_dvh()
@@ -340,11 +554,8 @@ class CalculateDVHProgressWindow(QtWidgets.QDialog):
         dict_thickness = ImageLoading.get_thickness_dict(dataset_rtss, self.patient_dict_container.dataset)
 
         interrupt_flag = threading.Event()
-        fork_safe_platforms = ['Linux']
-        if platform.system() in fork_safe_platforms:
-            worker = Worker(ImageLoading.multi_calc_dvh, dataset_rtss, dataset_rtdose, rois, dict_thickness)
-        else:
-            worker = Worker(ImageLoading.calc_dvhs, dataset_rtss, dataset_rtdose, rois, dict_thickness, interrupt_flag)
+        worker = Worker(ImageLoading.calc_dvhs, dataset_rtss, dataset_rtdose, rois, dict_thickness, interrupt_flag,
+                        dvh_cache=DVHCache())
 
         worker.signals.result.connect(self.dvh_calculated)
 
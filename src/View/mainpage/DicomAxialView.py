@@ -1,11 +1,15 @@
 from PySide6 import QtWidgets, QtCore, QtGui
-from skimage import measure
 
 from src.View.mainpage.DicomView import DicomView
-from src.Model.Isodose import get_dose_grid
+from src.Model.Isodose import get_isodose_contour_cache
 from src.Model.PatientDictContainer import PatientDictContainer
+from src.Model.Worker import Worker
+from src.constants import ISODOSE_PREFETCH_RADIUS
 from src.Controller.PathHandler import data_path, resource_path
 
+# Priority of the workers that trace the isodoses of neighbouring slices
+ISODOSE_PREFETCH_PRIORITY = -1
+
 
 class DicomAxialView(DicomView):
 
@@ -291,34 +295,38 @@ class DicomAxialView(DicomView):
         """
         slider_id = self.slider.value()
         curr_slice_uid = self.patient_dict_container.get("dict_uid")[slider_id]
-        z = self.patient_dict_container.dataset[slider_id].ImagePositionPatient[2]
-        dataset_rtdose = self.patient_dict_container.dataset['rtdose']
-        grid = get_dose_grid(dataset_rtdose, float(z))
+        rx_dose_in_cgray = self.patient_dict_container.get("rx_dose_in_cgray")
+        selected_doses = self.patient_dict_container.get("selected_doses")
+
+        # Contours of the isodoses that are no longer selected are dropped
+        contour_cache = get_isodose_contour_cache()
+        contour_cache.retain(selected_doses, rx_dose_in_cgray)
+
+        if contour_cache.dose_volume.get_grid(slider_id).size:
+            # The line configuration is read once for every isodose
+            with open(data_path('line&fill_configuration'), 'r') as stream:
+                elements = stream.readlines()
+                if len(elements) > 0:
+                    iso_line = int(elements[2].replace('\n', ''))
+                    iso_opacity = int(elements[3].replace('\n', ''))
+                    line_width = float(elements[4].replace('\n', ''))
+                else:
+                    iso_line = 2
+                    iso_opacity = 5
+                    line_width = 2.0
+                stream.close()
+            iso_opacity = int((iso_opacity / 100) * 255)
 
-        if not (grid == []):
             # sort selected_doses in ascending order so that the high dose isodose washes
             # paint over the lower dose isodose washes
-            for sd in sorted(self.patient_dict_container.get("selected_doses")):
-                dose_level = sd * self.patient_dict_container.get("rx_dose_in_cgray") / \
-                    (dataset_rtdose.DoseGridScaling * 10000)
-                contours = measure.find_contours(grid, dose_level)
+            for sd in sorted(selected_doses):
+                contours = contour_cache.get_contours(
+                    slider_id, sd, rx_dose_in_cgray)
 
                 polygons = self.calc_dose_polygon(
                     self.patient_dict_container.get("dose_pixluts")[curr_slice_uid], contours)
 
                 brush_color = self.iso_color[sd]
-                with open(data_path('line&fill_configuration'), 'r') as stream:
-                    elements = stream.readlines()
-                    if len(elements) > 0:
-                        iso_line = int(elements[2].replace('\n', ''))
-                        iso_opacity = int(elements[3].replace('\n', ''))
-                        line_width = float(elements[4].replace('\n', ''))
-                    else:
-                        iso_line = 2
-                        iso_opacity = 5
-                        line_width = 2.0
-                    stream.close()
-                iso_opacity = int((iso_opacity / 100) * 255)
                 brush_color.setAlpha(iso_opacity)
                 pen_color = QtGui.QColor(
                     brush_color.red(), brush_color.green(), brush_color.blue())
@@ -327,6 +335,31 @@ class DicomAxialView(DicomView):
                     self.scene.addPolygon(
                         polygons[i], pen, QtGui.QBrush(brush_color))
 
+        self.prefetch_isodoses(contour_cache, slider_id, selected_doses,
+                               rx_dose_in_cgray)
+
+    def prefetch_isodoses(self, contour_cache, slider_id, selected_doses,
+                          rx_dose_in_cgray):
+        """
+        Trace the isodose contours of the slices next to the displayed
+        slice in the background, so they are ready when the slider moves.
+        :param contour_cache: IsodoseContourCache of the dose volume
+        :param slider_id: The displayed slice number
+        :param selected_doses: List of the displayed isodose percentages
+        :param rx_dose_in_cgray: Prescription dose in cGy
+        """
+        radius = ISODOSE_PREFETCH_RADIUS
+        slice_ids = [slice_id for slice_id in
+                     range(slider_id - radius, slider_id + radius + 1)
+                     if self.slider.minimum() <= slice_id
+                     <= self.slider.maximum()]
+        missing = contour_cache.get_missing(slice_ids, selected_doses,
+                                            rx_dose_in_cgray)
+        if missing:
+            worker = Worker(contour_cache.prefetch, missing)
+            QtCore.QThreadPool.globalInstance().start(
+                worker, ISODOSE_PREFETCH_PRIORITY)
+
     def calc_dose_polygon(self, dose_pixluts, contours):
         """
         Calculate a list of polygons to display for a given isodose.
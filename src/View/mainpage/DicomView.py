@@ -94,6 +94,18 @@ class DicomView(QtWidgets.QWidget):
         label = QtWidgets.QGraphicsPixmapItem(image)
         self.scene = GraphicsScene(
             label, self.horizontal_view, self.vertical_view)
+        self.prefetch_pixmaps(pixmaps, slider_id)
+
+    def prefetch_pixmaps(self, pixmaps, slider_id):
+        """
+        Render the slices next to the displayed slice once the event loop
+        is idle, so they are ready when the slider moves.
+        :param pixmaps: The pixmaps of the view
+        :param slider_id: The displayed slice number
+        """
+        if hasattr(pixmaps, "prefetch"):
+            QtCore.QTimer.singleShot(
+                0, lambda: pixmaps.prefetch(slider_id))
 
     def draw_roi_polygons(self, roi_id, polygons, roi_color=None):
         """
@@ -1,6 +1,7 @@
 import math
 import numpy
 import logging
+from scipy import ndimage
 from PySide6 import QtCore, QtGui, QtWidgets
 from PySide6.QtCore import Signal
 from PySide6.QtGui import QColor, QPen
@@ -107,33 +108,15 @@ class Drawing(QtWidgets.QGraphicsScene):
     def _display_pixel_color(self):
         """
         Finds the pixel coordinates used to draw the ROI based on the min and max values.
-        This process uses a generic BFS that is bound to the min and max bounds,
+        The region grown from the fill source is bound to the min and max bounds,
         as well as the min and max pixel density.
         """
         self.set_bounds()
         self.pixel_array = self.dataset._pixel_array
 
         self.q_image = self.img.toImage()
-        queue = [self.fill_source]
-
-        if self.is_hole_filling:
-            outlines = set()
-
-        while len(queue) > 0:
-            current = queue.pop(0)
-
-            for x_neighbour in range(-1, 2):
-                for y_neighbour in range(-1, 2):
-                    element = [current[0] + x_neighbour, current[1] + y_neighbour]
-
-                    if self.check_roi_validity(element):
-                        if (element[0], element[1]) not in self.target_pixel_coords:
-                            queue.append([element[0], element[1]])
-                            self.target_pixel_coords.add((element[0], element[1]))
-                    else:
-                        if self.is_hole_filling:
-                            if (element[0], element[1]) not in outlines:
-                                outlines.add((element[0], element[1]))
+        region, outlines = self.grow_region(self.fill_source)
+        self.target_pixel_coords.update(region)
 
         if self.is_hole_filling:
             self.fill_holes(outlines)
@@ -158,6 +141,67 @@ class Drawing(QtWidgets.QGraphicsScene):
         self.refresh_image()
         return False if len(points) < 1 else True
 
+    def grow_region(self, source):
+        """
+        Finds the pixels connected to the source, including diagonally, that
+        pass check_roi_validity and are not targeted yet. Rather than
+        checking the pixels one at a time, the valid pixels are found for
+        the whole bounding box at once and labelled into connected regions,
+        and the regions next to the source are kept.
+
+        :param source:  x and y co-ordinates of the fill source
+        :return: Tuple of the set of x and y co-ordinates of the pixels of
+            the region, and the set of co-ordinates of the invalid pixels
+            next to the source or the region
+        """
+        outlines = set()
+        for x_neighbour in range(-1, 2):
+            for y_neighbour in range(-1, 2):
+                element = (source[0] + x_neighbour, source[1] + y_neighbour)
+                if not self.check_roi_validity(element):
+                    outlines.add(element)
+
+        # Valid pixels within the bounds, as pixel_array[y][x], with an
+        # invalid pixel all around
+        x_coords = numpy.arange(self.pixel_array.shape[1])
+        y_coords = numpy.arange(self.pixel_array.shape[0])
+        x_coords = x_coords[(self.min_bounds_x < x_coords)
+                            & (x_coords < self.max_bounds_x)]
+        y_coords = y_coords[(self.min_bounds_y < y_coords)
+                            & (y_coords < self.max_bounds_y)]
+        if len(x_coords) == 0 or len(y_coords) == 0:
+            return set(), outlines
+        min_x, min_y = x_coords[0] - 1, y_coords[0] - 1
+        box = self.pixel_array[y_coords[0]:y_coords[-1] + 1,
+                               x_coords[0]:x_coords[-1] + 1]
+        valid = numpy.pad((self.min_pixel < box) & (box < self.max_pixel), 1)
+
+        # Pixels that are targeted already are not grown through
+        growable = valid.copy()
+        if self.target_pixel_coords:
+            targeted = numpy.array(list(self.target_pixel_coords)).T
+            targeted = targeted - [[min_x], [min_y]]
+            inside = (targeted[0] >= 0) & (targeted[0] < valid.shape[1]) \
+                & (targeted[1] >= 0) & (targeted[1] < valid.shape[0])
+            growable[targeted[1][inside], targeted[0][inside]] = False
+
+        labels, _ = ndimage.label(growable, structure=numpy.ones((3, 3)))
+        source_x, source_y = source[0] - min_x, source[1] - min_y
+        neighbours = labels[max(source_y - 1, 0):max(source_y + 2, 0),
+                            max(source_x - 1, 0):max(source_x + 2, 0)]
+        region = numpy.isin(labels, neighbours[neighbours > 0])
+
+        # Invalid pixels next to the region
+        region_outlines = ndimage.binary_dilation(
+            region, structure=numpy.ones((3, 3))) & ~valid
+
+        region_y, region_x = numpy.nonzero(region)
+        outline_y, outline_x = numpy.nonzero(region_outlines)
+        outlines.update(zip((outline_x + min_x).tolist(),
+                            (outline_y + min_y).tolist()))
+        return set(zip((region_x + min_x).tolist(),
+                       (region_y + min_y).tolist())), outlines
+
     def fill_holes(self, outlines):
         """
         Finds holes that have a size that matches the specified max internal hole value or less, and
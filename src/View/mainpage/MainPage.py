@@ -83,6 +83,7 @@ class UIMainWindow:
 
         self.setup_central_widget()
         self.setup_actions()
+        self.loading_toggle_roi_tools()
 
         # Create SUV2ROI object and connect signals
         self.suv2roi = SUV2ROI()
@@ -533,6 +534,21 @@ class UIMainWindow:
         self.draw_roi_toggle_toolbar_items(False)
         self.splitter.setVisible(True)
 
+    def loading_toggle_roi_tools(self):
+        """
+        Disables the ROI tools that need the pixel LUTs or the contours
+        while the image loader is still loading them in the background.
+        Called again after each stage of loading has finished.
+        """
+        loading = PatientDictContainer().is_loading("raw_contour", "pixluts")
+        self.structures_tab.button_roi_draw.setDisabled(loading)
+        self.structures_tab.button_roi_manipulate.setDisabled(loading)
+        if hasattr(self, 'isodoses_tab'):
+            self.isodoses_tab.iso2roi_button.setDisabled(loading)
+        self.dicom_single_view.button_suv2roi.setDisabled(loading)
+        # ROIs transferred from a moving image are saved on the fixed image
+        self.action_handler.action_image_fusion.setDisabled(loading)
+
     def draw_roi_toggle_toolbar_items(self, disabled):
         """Called to disable toolbar options when they do not apply / cannot be used in the current draw roi context"""
         self.action_handler.action_save_structure.setDisabled(disabled)
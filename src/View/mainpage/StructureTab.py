@@ -1,4 +1,5 @@
 import csv
+from collections import defaultdict
 import pydicom
 from pathlib import Path
 from random import randint, seed
@@ -382,6 +383,7 @@ class StructureTab(QtWidgets.QWidget):
         self.patient_dict_container.set("dict_polygons_axial", {})
         self.patient_dict_container.set("dict_polygons_sagittal", {})
         self.patient_dict_container.set("dict_polygons_coronal", {})
+        self.patient_dict_container.set("roi_polygon_cache", {})
 
         if "draw" in change_description or "transfer" in change_description:
             dicom_tree_rtss = DicomTree(None)
@@ -473,40 +475,21 @@ class StructureTab(QtWidgets.QWidget):
             "dict_polygons_coronal")
         new_dict_polygons_sagittal = self.patient_dict_container.get(
             "dict_polygons_sagittal")
-        aspect = self.patient_dict_container.get("pixmap_aspect")
         roi_name = rois[roi_id]['name']
 
         if state:
-            new_dict_polygons_axial[roi_name] = {}
-            new_dict_polygons_coronal[roi_name] = {}
-            new_dict_polygons_sagittal[roi_name] = {}
-            dict_rois_contours_axial = get_roi_contour_pixel(
-                self.patient_dict_container.get("raw_contour"),
-                [roi_name], self.patient_dict_container.get("pixluts"))
-            dict_rois_contours_coronal, dict_rois_contours_sagittal = \
-                transform_rois_contours(
-                    dict_rois_contours_axial)
-
-            for slice_id in self.patient_dict_container.get(
-                    "dict_uid").values():
-                polygons = calc_roi_polygon(roi_name, slice_id,
-                                            dict_rois_contours_axial)
-                new_dict_polygons_axial[roi_name][slice_id] = polygons
-
-            for slice_id in range(0, len(self.patient_dict_container.get(
-                    "pixmaps_coronal"))):
-                polygons_coronal = calc_roi_polygon(
-                    roi_name, slice_id,
-                    dict_rois_contours_coronal,
-                    aspect["coronal"])
-                polygons_sagittal = calc_roi_polygon(
-                    roi_name, slice_id,
-                    dict_rois_contours_sagittal,
-                    1 / aspect["sagittal"])
-                new_dict_polygons_coronal[roi_name][
-                    slice_id] = polygons_coronal
-                new_dict_polygons_sagittal[roi_name][
-                    slice_id] = polygons_sagittal
+            # ROIs selected while the image loader is still loading the
+            # contours have no polygons until the contours are loaded
+            if self.patient_dict_container.is_loading("raw_contour",
+                                                      "pixluts"):
+                polygons_axial = polygons_coronal = polygons_sagittal = \
+                    defaultdict(list)
+            else:
+                polygons_axial, polygons_coronal, polygons_sagittal = \
+                    self.get_roi_polygons(roi_name)
+            new_dict_polygons_axial[roi_name] = polygons_axial
+            new_dict_polygons_coronal[roi_name] = polygons_coronal
+            new_dict_polygons_sagittal[roi_name] = polygons_sagittal
 
             self.patient_dict_container.set("dict_polygons_axial",
                                             new_dict_polygons_axial)
@@ -519,6 +502,68 @@ class StructureTab(QtWidgets.QWidget):
             new_dict_polygons_coronal.pop(roi_name, None)
             new_dict_polygons_sagittal.pop(roi_name, None)
 
+    def get_roi_polygons(self, roi_name):
+        """
+        Get the axial, coronal and sagittal polygons of an ROI. Polygons
+        are cached per ROI when it is first selected, and reused when it
+        is selected again until the RTSS or the ROI's contours change.
+        :param roi_name: Name of the ROI
+        :return: Tuple of the axial, coronal and sagittal polygon
+            dictionaries of the ROI
+        """
+        polygon_cache = self.patient_dict_container.get("roi_polygon_cache")
+        if polygon_cache is None:
+            polygon_cache = {}
+            self.patient_dict_container.set("roi_polygon_cache",
+                                            polygon_cache)
+
+        # The raw contour of an ROI is replaced whenever it changes
+        raw_contour = self.patient_dict_container.get("raw_contour")[roi_name]
+        if roi_name in polygon_cache \
+                and polygon_cache[roi_name][0] is raw_contour:
+            return polygon_cache[roi_name][1]
+
+        polygons = self.calc_roi_polygons(roi_name)
+        polygon_cache[roi_name] = (raw_contour, polygons)
+        return polygons
+
+    def calc_roi_polygons(self, roi_name):
+        """
+        Calculate the axial, coronal and sagittal polygons of an ROI.
+        :param roi_name: Name of the ROI
+        :return: Tuple of the axial, coronal and sagittal polygon
+            dictionaries of the ROI
+        """
+        aspect = self.patient_dict_container.get("pixmap_aspect")
+        polygons_axial = {}
+        polygons_coronal = {}
+        polygons_sagittal = {}
+        dict_rois_contours_axial = get_roi_contour_pixel(
+            self.patient_dict_container.get("raw_contour"),
+            [roi_name], self.patient_dict_container.get("pixluts"))
+        dict_rois_contours_coronal, dict_rois_contours_sagittal = \
+            transform_rois_contours(
+                dict_rois_contours_axial)
+
+        for slice_id in self.patient_dict_container.get(
+                "dict_uid").values():
+            polygons = calc_roi_polygon(roi_name, slice_id,
+                                        dict_rois_contours_axial)
+            polygons_axial[slice_id] = polygons
+
+        for slice_id in range(0, len(self.patient_dict_container.get(
+                "pixmaps_coronal"))):
+            polygons_coronal[slice_id] = calc_roi_polygon(
+                roi_name, slice_id,
+                dict_rois_contours_coronal,
+                aspect["coronal"])
+            polygons_sagittal[slice_id] = calc_roi_polygon(
+                roi_name, slice_id,
+                dict_rois_contours_sagittal,
+                1 / aspect["sagittal"])
+
+        return polygons_axial, polygons_coronal, polygons_sagittal
+
     def on_rtss_selected(self, selected_rtss):
         """
         Function to run after a rtss is selected from SelectRTSSPopUp
@@ -3,3 +3,7 @@ INITIAL_ONE_VIEW_ZOOM = 1
 INITIAL_FOUR_VIEW_ZOOM = 0.5
 INITIAL_DRAWING_TOOL_RADIUS = 19
 CT_RESCALE_INTERCEPT = 1024
+PIXMAP_CACHE_SIZE = 64
+PIXMAP_PREFETCH_RADIUS = 2
+DOSE_VOLUME_DTYPE = "float64"
+ISODOSE_PREFETCH_RADIUS = 2
@@ -1,8 +1,12 @@
 import os
 import sqlite3
 from pathlib import Path
+import numpy as np
 import pytest
 from PySide6.QtWidgets import QApplication
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
 
 from src.Model.Configuration import Configuration
 
@@ -22,3 +26,186 @@ def init_config(request):
 
     request.addfinalizer(tear_down)
     return connection
+
+
+def make_rt_dataset(sop_class_uid, modality):
+    """
+    Creates an RT dataset in a fixed frame of reference, with the meta
+    information needed to write it to file.
+    """
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = sop_class_uid
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.SOPClassUID = sop_class_uid
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.Modality = modality
+    ds.PatientID = "PHANTOM"
+    ds.FrameOfReferenceUID = "1.2.3.4"
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    return ds
+
+
+def write_phantom_rtdose(path, frames=10, size=40):
+    """
+    Writes an RTDOSE with 1 mm pixels and 2 mm frames, starting at
+    (-20, -20, 0), whose dose increases linearly along every axis.
+    """
+    ds = make_rt_dataset("1.2.840.10008.5.1.4.1.1.481.2", "RTDOSE")
+    z, y, x = np.mgrid[0:frames, 0:size, 0:size]
+    dose = (x * 50 + y * 20 + z * 100).astype(np.uint32)
+    ds.ImagePositionPatient = [-20, -20, 0]
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.PixelSpacing = [1, 1]
+    ds.GridFrameOffsetVector = [float(i * 2) for i in range(frames)]
+    ds.NumberOfFrames = frames
+    ds.Rows = size
+    ds.Columns = size
+    ds.BitsAllocated = 32
+    ds.BitsStored = 32
+    ds.HighBit = 31
+    ds.PixelRepresentation = 0
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.DoseGridScaling = 0.001
+    ds.DoseUnits = "GY"
+    ds.DoseType = "PHYSICAL"
+    ds.DoseSummationType = "PLAN"
+    ds.PixelData = dose.tobytes()
+    ds.save_as(str(path), write_like_original=False)
+    return ds
+
+
+def phantom_square(z, x0, y0, x1, y1):
+    """
+    :return: ContourData of an axis aligned square at height z.
+    """
+    return [x0, y0, z, x1, y0, z, x1, y1, z, x0, y1, z]
+
+
+def phantom_circle(z, radius, x, y, points=24):
+    """
+    :return: ContourData of a polygon approximating a circle at height z.
+    """
+    angles = np.linspace(0, 2 * np.pi, points, endpoint=False)
+    contour = np.column_stack((x + radius * np.cos(angles),
+                               y + radius * np.sin(angles),
+                               np.full(points, z)))
+    return [round(value, 4) for value in contour.ravel().tolist()]
+
+
+def write_phantom_rtss(path, rois):
+    """
+    Writes an RTSTRUCT of closed planar contours.
+    :param rois: list of (ROI name, list of ContourData)
+    """
+    ds = make_rt_dataset("1.2.840.10008.5.1.4.1.1.481.3", "RTSTRUCT")
+    ds.StructureSetROISequence = Sequence()
+    ds.ROIContourSequence = Sequence()
+    ds.RTROIObservationsSequence = Sequence()
+    for number, (name, contours) in enumerate(rois, start=1):
+        structure_set_roi = Dataset()
+        structure_set_roi.ROINumber = number
+        structure_set_roi.ReferencedFrameOfReferenceUID = "1.2.3.4"
+        structure_set_roi.ROIName = name
+        structure_set_roi.ROIGenerationAlgorithm = "MANUAL"
+        ds.StructureSetROISequence.append(structure_set_roi)
+
+        roi_contour = Dataset()
+        roi_contour.ReferencedROINumber = number
+        roi_contour.ROIDisplayColor = [255, 0, 0]
+        roi_contour.ContourSequence = Sequence()
+        for contour_data in contours:
+            contour = Dataset()
+            contour.ContourGeometricType = "CLOSED_PLANAR"
+            contour.NumberOfContourPoints = len(contour_data) // 3
+            contour.ContourData = contour_data
+            roi_contour.ContourSequence.append(contour)
+        ds.ROIContourSequence.append(roi_contour)
+
+        observation = Dataset()
+        observation.ObservationNumber = number
+        observation.ReferencedROINumber = number
+        observation.RTROIInterpretedType = "ORGAN"
+        observation.ROIInterpreter = ""
+        ds.RTROIObservationsSequence.append(observation)
+    ds.save_as(str(path), write_like_original=False)
+    return ds
+
+
+@pytest.fixture
+def dvh_phantom(tmp_path):
+    """
+    Writes a phantom RTSTRUCT and RTDOSE.
+    :return: paths of the RTSTRUCT and RTDOSE files
+    """
+    rtss_path = tmp_path / "rtss.dcm"
+    rtdose_path = tmp_path / "rtdose.dcm"
+    write_phantom_rtdose(rtdose_path)
+    write_phantom_rtss(rtss_path, [
+        ("Body", [phantom_square(z, -18, -18, 18, 18)
+                  for z in range(0, 18, 2)]),
+        ("PTV", [phantom_square(z, -10, -10, 5, 5) for z in (4, 6, 8)]),
+        ("Boost", [phantom_square(6, 0, 0, 10, 10)]),
+        ("Cord", [phantom_square(z, 8, -15, 12, -11)
+                  for z in range(2, 16, 2)]),
+        # Planes between dose frames, with a hole
+        ("Ring", [contour for z in (3, 5, 7)
+                  for contour in (phantom_circle(z, 9.3, 2.1, 1.7),
+                                  phantom_circle(z, 3.2, 2.1, 1.7))]),
+        # Planes beyond the last dose frame
+        ("Outside", [phantom_circle(z, 4.6, -6.2, -3.4)
+                     for z in (14, 16, 18, 20, 22)]),
+    ])
+    return str(rtss_path), str(rtdose_path)
+
+
+def write_ct_slice(path, z, rows=64, columns=64, series_uid="1.2.3"):
+    """
+    Writes a minimal CT slice whose pixel values are all equal to its
+    z position.
+    """
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.SeriesInstanceUID = series_uid
+    ds.Modality = "CT"
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.ImagePositionPatient = [-32, -32, z]
+    ds.PixelSpacing = [1, 1]
+    ds.Rows = rows
+    ds.Columns = columns
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 1
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.RescaleSlope = 1
+    ds.RescaleIntercept = -1024
+    ds.PixelData = np.full((rows, columns), z, dtype=np.int16).tobytes()
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.save_as(str(path), write_like_original=False)
+
+
+@pytest.fixture
+def ct_files(tmp_path):
+    # Files are written out of z order to check the stack sort
+    z_positions = [3, 0, 4, 1, 2]
+    paths = []
+    for i, z in enumerate(z_positions):
+        path = tmp_path / ("ct%d.dcm" % i)
+        write_ct_slice(path, z)
+        paths.append(str(path))
+    return paths
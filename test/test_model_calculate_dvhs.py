@@ -0,0 +1,201 @@
+import itertools
+import threading
+
+import numpy as np
+import pytest
+from dicompylercore import dvhcalc
+from dicompylercore.dvh import DVH
+from pydicom import dcmread
+
+from src.Model import CalculateDVHs, DVHCache as DVHCacheModule, \
+    DVHCalculator, ImageLoading
+from src.Model.DVHCache import DVHCache, get_dvh_keys
+
+
+@pytest.fixture
+def phantom_datasets(dvh_phantom):
+    rtss_path, rtdose_path = dvh_phantom
+    dataset_rtss = dcmread(rtss_path)
+    dataset_rtdose = dcmread(rtdose_path)
+    rois = ImageLoading.get_roi_info(dataset_rtss)
+    return dataset_rtss, dataset_rtdose, rois
+
+
+def reference_dvhs(dataset_rtss, dataset_rtdose, rois, dict_thickness):
+    return {roi: dvhcalc.get_dvh(dataset_rtss, dataset_rtdose, roi,
+                                 thickness=dict_thickness.get(roi))
+            for roi in rois}
+
+
+def assert_same_dvhs(dict_dvh, expected):
+    assert list(dict_dvh) == list(expected)
+    for roi in expected:
+        assert dict_dvh[roi].name == expected[roi].name
+        assert np.allclose(dict_dvh[roi].counts, expected[roi].counts)
+        assert np.array_equal(dict_dvh[roi].bins, expected[roi].bins)
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_calc_dvhs_on_pool(dvh_phantom, phantom_datasets, max_workers,
+                           monkeypatch):
+    dataset_rtss, dataset_rtdose, rois = phantom_datasets
+    dict_thickness = {3: 1.0}
+    monkeypatch.setattr(ImageLoading, "DVH_CHUNK_SIZE", 2)
+
+    dict_dvh = ImageLoading.calc_dvhs_on_pool(
+        *dvh_phantom, list(rois), dict_thickness, threading.Event(),
+        max_workers=max_workers)
+
+    assert_same_dvhs(dict_dvh, reference_dvhs(
+        dataset_rtss, dataset_rtdose, rois, dict_thickness))
+
+
+def test_calc_dvhs_modified_rtss(phantom_datasets):
+    dataset_rtss, dataset_rtdose, rois = phantom_datasets
+    # A dataset changed since it was read is calculated as it is in memory
+    contour = dataset_rtss.ROIContourSequence[1].ContourSequence[0]
+    contour.ContourData = [-5, -5, 4, 0, -5, 4, 0, 0, 4, -5, 0, 4]
+
+    dict_dvh = ImageLoading.calc_dvhs(dataset_rtss, dataset_rtdose, rois, {})
+
+    assert_same_dvhs(dict_dvh, reference_dvhs(
+        dataset_rtss, dataset_rtdose, rois, {}))
+    assert_same_dvhs(
+        CalculateDVHs.calc_dvhs(dataset_rtss, dataset_rtdose, rois),
+        dict_dvh)
+
+
+def test_calc_dvhs_interrupted(dvh_phantom, phantom_datasets, monkeypatch):
+    _, _, rois = phantom_datasets
+    monkeypatch.setattr(ImageLoading, "DVH_CHUNK_SIZE", 2)
+    interrupt_flag = threading.Event()
+    interrupt_flag.set()
+
+    assert ImageLoading.calc_dvhs_on_pool(
+        *dvh_phantom, list(rois), {}, interrupt_flag, max_workers=2) is None
+    assert ImageLoading.calc_dvhs_from_files(
+        *dvh_phantom, rois, {}, interrupt_flag) is None
+
+
+@pytest.fixture
+def dvh_cache(tmp_path):
+    dvh_cache = DVHCache()
+    dvh_cache.set_db_file_path(tmp_path / "TestDVHCache.db")
+    return dvh_cache
+
+
+def test_calc_dvhs_from_files_cached(dvh_phantom, phantom_datasets,
+                                     dvh_cache, monkeypatch):
+    dataset_rtss, dataset_rtdose, rois = phantom_datasets
+    dict_thickness = {3: 1.0}
+    calculated_rois = []
+    calc_dvhs_on_pool = ImageLoading.calc_dvhs_on_pool
+
+    def count_calculated(rtss_path, rtdose_path, missing, *args, **kwargs):
+        calculated_rois.append(list(missing))
+        return calc_dvhs_on_pool(rtss_path, rtdose_path, missing,
+                                 *args, **kwargs)
+
+    monkeypatch.setattr(ImageLoading, "calc_dvhs_on_pool", count_calculated)
+
+    first = ImageLoading.calc_dvhs_from_files(
+        *dvh_phantom, rois, dict_thickness, dvh_cache=dvh_cache)
+    second = ImageLoading.calc_dvhs_from_files(
+        *dvh_phantom, rois, dict_thickness, dvh_cache=dvh_cache)
+
+    assert calculated_rois == [list(rois)]
+    assert_same_dvhs(second, first)
+    assert_same_dvhs(second, reference_dvhs(
+        dataset_rtss, dataset_rtdose, rois, dict_thickness))
+
+    # Only the edited ROI and the ROI with a new thickness are calculated
+    contour = dataset_rtss.ROIContourSequence[1].ContourSequence[0]
+    contour.ContourData = [-5, -5, 4, 0, -5, 4, 0, 0, 4, -5, 0, 4]
+    dataset_rtss.StructureSetROISequence[0].ROIName = "Outline"
+    rois = ImageLoading.get_roi_info(dataset_rtss)
+    dict_thickness[4] = 2.0
+    third = ImageLoading.calc_dvhs(dataset_rtss, dataset_rtdose, rois,
+                                   dict_thickness, dvh_cache=dvh_cache)
+
+    assert calculated_rois[1] == [2, 4]
+    assert third[1].name == "Outline"
+    assert_same_dvhs(third, reference_dvhs(
+        dataset_rtss, dataset_rtdose, rois, dict_thickness))
+
+
+def test_dvh_cache_evicts_least_recently_used(dvh_cache, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(DVHCacheModule.time, "time", lambda: next(clock))
+    dvh_cache.max_entries = 2
+    rois = {roi: {'name': "ROI %d" % roi} for roi in range(1, 4)}
+    dict_keys = {roi: "key%d" % roi for roi in rois}
+    dvh = DVH(counts=np.array([3., 2., 1.]), bins=np.arange(4.))
+
+    dvh_cache.update_dvhs(dict_keys, {1: dvh})
+    dvh_cache.update_dvhs(dict_keys, {2: dvh})
+    # Reading the first DVH makes the second the least recently used
+    assert list(dvh_cache.get_dvhs({1: "key1"}, rois)) == [1]
+    dvh_cache.update_dvhs(dict_keys, {3: dvh})
+
+    assert sorted(dvh_cache.get_dvhs(dict_keys, rois)) == [1, 3]
+
+
+def test_calc_dvhs_in_process(phantom_datasets, dvh_cache, monkeypatch):
+    dataset_rtss, dataset_rtdose, rois = phantom_datasets
+    dose_grid = DVHCalculator.DoseGrid(dataset_rtdose)
+    selected = {roi: rois[roi] for roi in (2, 4)}
+
+    dict_dvh = ImageLoading.calc_dvhs_in_process(
+        dataset_rtss, dose_grid, selected, {}, dvh_cache=dvh_cache)
+
+    assert_same_dvhs(dict_dvh, reference_dvhs(
+        dataset_rtss, dataset_rtdose, selected, {}))
+
+    # The DVHs of the selected ROIs are now read from the cache
+    calculated_rois = []
+    calculate_dvhs = DVHCalculator.calculate_dvhs
+
+    def count_calculated(rtss, rtdose, missing, *args, **kwargs):
+        calculated_rois.append(list(missing))
+        return calculate_dvhs(rtss, rtdose, missing, *args, **kwargs)
+
+    monkeypatch.setattr(DVHCalculator, "calculate_dvhs", count_calculated)
+    dict_dvh = ImageLoading.calc_dvhs_in_process(
+        dataset_rtss, dose_grid, rois, {}, dvh_cache=dvh_cache)
+
+    assert calculated_rois == [[1, 3, 5, 6]]
+    assert_same_dvhs(dict_dvh, reference_dvhs(
+        dataset_rtss, dataset_rtdose, rois, {}))
+
+
+def test_copy_rtss_contours(phantom_datasets):
+    dataset_rtss, dataset_rtdose, rois = phantom_datasets
+    selected = {roi: rois[roi] for roi in (2, 4)}
+    rtss_copy = ImageLoading.copy_rtss_contours(dataset_rtss, selected)
+    expected = reference_dvhs(dataset_rtss, dataset_rtdose, selected, {})
+
+    # Editing the RTSS does not change the copy
+    dataset_rtss.ROIContourSequence[1].ContourSequence.clear()
+    dataset_rtss.StructureSetROISequence[1].ROIName = "Renamed"
+    contour = dataset_rtss.ROIContourSequence[3].ContourSequence[0]
+    assert contour.parent_seq() is \
+        dataset_rtss.ROIContourSequence[3].ContourSequence
+
+    dose_grid = DVHCalculator.DoseGrid(dataset_rtdose)
+    assert_same_dvhs(ImageLoading.calc_dvhs_in_process(
+        rtss_copy, dose_grid, selected, {}), expected)
+    assert [roi.ROINumber for roi in rtss_copy.StructureSetROISequence] \
+        == [2, 4]
+
+
+def test_dvh_keys(phantom_datasets):
+    dataset_rtss, dataset_rtdose, rois = phantom_datasets
+    uid = dataset_rtdose.SOPInstanceUID
+    keys = get_dvh_keys(dataset_rtss, uid, rois, {})
+
+    assert len(set(keys.values())) == len(rois)
+    assert get_dvh_keys(dataset_rtss, uid, rois, {}) == keys
+    assert get_dvh_keys(dataset_rtss, uid, rois, {}, 150)[1] != keys[1]
+    assert get_dvh_keys(dataset_rtss, "1.2", rois, {})[1] != keys[1]
+    assert get_dvh_keys(dataset_rtss, uid, rois, {1: 2.0})[1] != keys[1]
+    assert get_dvh_keys(dataset_rtss, uid, rois, {1: 2.0})[2] == keys[2]
@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian
+
+from src.Model.CalculateImages import apply_window_level, \
+    convert_first_slice, convert_raw_data, get_pixmaps, rescale_volume
+
+
+def make_slice(values, slope=1, intercept=-1024):
+    """
+    Creates a dataset with 16 bit pixel data, without writing it to file.
+    """
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.Rows, ds.Columns = values.shape
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 1 if values.dtype == np.int16 else 0
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.RescaleSlope = slope
+    ds.RescaleIntercept = intercept
+    ds.PixelData = values.tobytes()
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    return ds
+
+
+@pytest.fixture
+def ct_dataset():
+    dataset = {}
+    for i in range(4):
+        dataset[i] = make_slice(
+            np.arange(12, dtype=np.uint16).reshape(3, 4) * 100 + i)
+    dataset['rtss'] = Dataset()
+    return dataset
+
+
+def test_convert_raw_data_returns_shared_volume(ct_dataset):
+    volume = convert_raw_data(ct_dataset, rescaled=False, is_ct=True)
+
+    assert volume.shape == (4, 3, 4)
+    assert volume.dtype == np.int16
+    # CT rescale intercept of -1024 is offset by CT_RESCALE_INTERCEPT
+    assert volume[2, 1, 0] == 402
+
+    # Each dataset's pixel array is a view of the volume
+    for i in range(4):
+        assert np.shares_memory(ct_dataset[i]._pixel_array, volume)
+        assert np.array_equal(ct_dataset[i].pixel_array, volume[i])
+
+
+def test_convert_raw_data_rescaled(ct_dataset):
+    convert_raw_data(ct_dataset, rescaled=False, is_ct=True)
+    volume = convert_raw_data(ct_dataset, rescaled=True)
+
+    # Already rescaled data is not rescaled a second time
+    assert volume[2, 1, 0] == 402
+
+
+def test_convert_first_slice(ct_dataset):
+    volume = convert_first_slice(ct_dataset, is_ct=True)
+    expected = convert_raw_data(ct_dataset, rescaled=False, is_ct=True)
+
+    # Only the first slice is converted, the others are blank
+    assert volume.shape == expected.shape
+    assert volume.dtype == expected.dtype
+    assert np.array_equal(volume[0], expected[0])
+    assert not volume[1:].any()
+
+
+def test_rescale_volume_float_slope():
+    volume = np.arange(8, dtype=np.uint16).reshape(2, 2, 2)
+    rescaled = rescale_volume(volume, [(0.5, 0), (2.5, 10)])
+    assert rescaled.dtype == np.float32
+    assert np.allclose(rescaled[0], volume[0] * 0.5)
+    assert np.allclose(rescaled[1], volume[1] * 2.5 + 10)
+
+
+def test_rescale_volume_out_of_int16_range():
+    volume = np.full((1, 2, 2), 60000, dtype=np.uint16)
+    rescaled = rescale_volume(volume, [(1, 0)])
+    assert rescaled.dtype == np.int32
+    assert np.all(rescaled == 60000)
+
+
+def test_get_pixmaps_renders_on_demand(qapp):
+    volume = np.arange(6 * 8 * 8, dtype=np.int16).reshape(6, 8, 8)
+    aspect = {"axial": 1, "coronal": 1, "sagittal": 1}
+    axial, coronal, sagittal = get_pixmaps(volume, 0, 0, aspect)
+
+    assert (len(axial), len(coronal), len(sagittal)) == (6, 8, 8)
+    assert not any(axial.is_cached(i) for i in axial)
+
+    pixmap = axial[3]
+    assert not pixmap.isNull()
+    assert axial[3] is pixmap
+    assert [i for i in range(6) if axial.is_cached(i)] == [3]
+    assert np.array_equal(coronal.get_slice(2), volume[:, 2, :])
+    assert np.array_equal(sagittal.get_slice(2), volume[:, :, 2])
+
+    # Neighbouring slices are rendered by prefetch
+    axial.prefetch(3, radius=2)
+    assert [i for i in range(6) if axial.is_cached(i)] == [1, 2, 3, 4, 5]
+
+    # Least recently used pixmaps are dropped past the cache size
+    axial.cache_size = 2
+    axial[0]
+    assert axial.cached_slices() == [1, 0]
+
+    with pytest.raises(KeyError):
+        axial[6]
+
+
+def reference_window_level(np_pixels, window, level):
+    """
+    The arithmetic windowing function, without the int16 conversion.
+    """
+    if window != 0 and level != 0:
+        np_pixels = (np_pixels - level) / window * 255
+    else:
+        max_val = np.amax(np_pixels)
+        min_val = np.amin(np_pixels)
+        np_pixels = (np_pixels - min_val) / (max_val - min_val) * 255
+    return np.clip(np_pixels, 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("dtype", [np.int16, np.uint16, np.uint8])
+@pytest.mark.parametrize("window, level", [(400, 800), (1600, -400), (0, 0)])
+def test_apply_window_level_lut(dtype, window, level):
+    info = np.iinfo(dtype)
+    np_pixels = np.linspace(info.min, info.max, 4096).astype(dtype)
+    np_pixels = np_pixels.reshape(64, 64)
+
+    display = apply_window_level(np_pixels, window, level)
+
+    assert display.dtype == np.uint8
+    assert np.array_equal(display, reference_window_level(
+        np_pixels.astype(np.float64), window, level))
+
+
+def test_apply_window_level_keeps_range():
+    # PET values above the int16 range are not wrapped around
+    np_pixels = np.array([[0, 40000], [60000, 65535]], dtype=np.uint16)
+    display = apply_window_level(np_pixels, 60000, 1)
+    assert list(display.ravel()) == [0, 169, 254, 255]
+
+    np_pixels = np.array([[0.5, 1.5], [2.5, 100000.0]], dtype=np.float32)
+    display = apply_window_level(np_pixels, 10, 0.5)
+    assert list(display.ravel()) == [0, 25, 51, 255]
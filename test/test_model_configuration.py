@@ -73,4 +73,14 @@ def test_error_handling(init_sqlite_config):
     with pytest.raises(SqlError):
         configuration.get_default_directory()
     with pytest.raises(SqlError):
-        configuration.update_default_directory('')
\ No newline at end of file
+        configuration.update_default_directory('')
+
+def test_use_dicomdir(init_sqlite_config):
+    configuration = Configuration()
+
+    # DICOMDIR files are not used unless the user turns them on
+    assert configuration.get_use_dicomdir() is False
+    configuration.update_use_dicomdir(True)
+    assert configuration.get_use_dicomdir() is True
+    configuration.update_use_dicomdir(False)
+    assert configuration.get_use_dicomdir() is False
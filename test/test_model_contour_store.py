@@ -0,0 +1,159 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+from pydicom import Dataset, Sequence, dcmread
+from pydicom.dataset import FileMetaDataset
+from pydicom.dataelem import RawDataElement
+from pydicom.multival import MultiValue
+from pydicom.uid import ExplicitVRLittleEndian, ImplicitVRLittleEndian
+from pydicom.valuerep import DSfloat
+
+from src.Model import ImageLoading
+from src.Model.ContourStore import CONTOUR_DATA_TAG, ROIContours, \
+    parse_ds_values, read_contour_data, read_referenced_sop_instance_uid
+from src.Model.ROI import add_new_roi, add_to_roi, calculate_contours_pixels, \
+    calculate_slice_pixels, get_roi_contour_pixel
+
+
+def square(z, size):
+    return [0, 0, z, size, 0, z, size, size, z, 0, size, z]
+
+
+def test_roi_contours():
+    contours = [("1.1", square(0, 1)),
+                ("1.2", square(1, 2)),
+                ("1.1", square(0, 3)[:9]),
+                ("1.3", square(2, 4))]
+    roi_contours = ROIContours.from_contours(contours, 15)
+
+    # Contours are grouped by slice, in the order of their first contour
+    assert list(roi_contours) == ["1.1", "1.2", "1.3"]
+    assert roi_contours.num_points == 15
+    assert roi_contours.points.shape == (15, 3)
+    assert [list(contour) for contour in roi_contours["1.1"]] \
+        == [square(0, 1), square(0, 3)[:9]]
+    assert np.array_equal(roi_contours.get_points("1.1"),
+                          np.reshape(square(0, 1) + square(0, 3)[:9],
+                                     (-1, 3)))
+    assert list(roi_contours.get_offsets("1.1")) == [0, 4, 7]
+
+    # Slices without contours, as the dictionaries it replaces
+    assert "1.4" not in roi_contours
+    assert roi_contours["1.4"] == []
+    assert roi_contours.get("1.4") is None
+    assert roi_contours.get_points("1.4").shape == (0, 3)
+
+    # Extending returns new contours
+    extended = roi_contours.extend([("1.4", square(3, 5))], 4)
+    assert extended == ROIContours.from_contours(
+        contours + [("1.4", square(3, 5))], 19)
+    assert extended != roi_contours
+    assert len(roi_contours) == 3
+
+
+def test_roi_contours_memory():
+    # ContourData as read by pydicom
+    tracemalloc.start()
+    contour_data = [MultiValue(DSfloat, [str(v / 7) for v in range(300)])
+                    for _ in range(100)]
+    dsfloat_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    roi_contours = ROIContours.from_contours(
+        ("1.%d" % (i // 4), data) for i, data in enumerate(contour_data))
+
+    assert roi_contours.nbytes * 10 < dsfloat_bytes
+    assert np.allclose(roi_contours["1.0"][1], contour_data[1])
+
+
+def test_slice_pixels_from_contour_store():
+    image_ds = Dataset()
+    image_ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    image_ds.SOPInstanceUID = "1.1"
+    image_ds.FrameOfReferenceUID = "1.2.3"
+    rtss = Dataset()
+    rtss.StructureSetROISequence = Sequence()
+    rtss.ROIContourSequence = Sequence()
+    rtss.RTROIObservationsSequence = Sequence()
+    add_new_roi(rtss, "Body", square(0, 6.5), image_ds, "ORGAN")
+    add_to_roi(rtss, "Body", square(0, 3.25), image_ds)
+
+    raw_contour, num_points = ImageLoading.get_raw_contour_data(rtss)
+    assert isinstance(raw_contour["Body"], ROIContours)
+    assert num_points == {"Body": 8}
+
+    pixlut = (np.arange(10, dtype=float), np.arange(10, dtype=float))
+    pixels = calculate_slice_pixels(pixlut, raw_contour["Body"], "1.1")
+    expected = calculate_contours_pixels(
+        pixlut, [square(0, 6.5), square(0, 3.25)])
+    assert len(pixels) == 2
+    for contour_pixels, expected_pixels in zip(pixels, expected):
+        assert np.array_equal(contour_pixels, expected_pixels)
+    assert calculate_slice_pixels(pixlut, raw_contour["Body"], "1.2") == []
+
+    # The same ROIContours is returned until the ROI changes
+    assert ImageLoading.get_raw_contour_data(rtss)[0]["Body"] \
+        is raw_contour["Body"]
+    add_to_roi(rtss, "Body", square(0, 1), image_ds)
+    assert ImageLoading.get_raw_contour_data(rtss)[0]["Body"] \
+        is not raw_contour["Body"]
+
+    dict_pixels = get_roi_contour_pixel(raw_contour, ["Body"],
+                                        {"1.1": pixlut})
+    assert len(dict_pixels["Body"]["1.1"]) == 2
+
+
+def test_read_contour_data(dvh_phantom):
+    dataset_rtss = dcmread(dvh_phantom[0])
+    contours = [contour for roi_contour in dataset_rtss.ROIContourSequence
+                for contour in roi_contour.ContourSequence]
+
+    for contour in contours:
+        points = read_contour_data(contour)
+        # The element is parsed from its bytes, and left unconverted
+        assert isinstance(contour.get_item(CONTOUR_DATA_TAG), RawDataElement)
+        assert np.array_equal(points, np.array(contour.ContourData,
+                                               dtype=float))
+        # Converted elements are read through pydicom
+        assert np.array_equal(read_contour_data(contour), points)
+
+    assert np.array_equal(parse_ds_values(b"1.5\\-2e-3\\ 3 "),
+                          [1.5, -0.002, 3])
+    assert len(parse_ds_values(b"")) == 0
+    # Missing values are left to pydicom
+    assert parse_ds_values(b"1.5\\\\3") is None
+    assert parse_ds_values(b"1.5\\3\\") is None
+
+
+@pytest.mark.parametrize("implicit_vr", [True, False])
+def test_read_referenced_sop_instance_uid(tmp_path, implicit_vr):
+    image_ds = Dataset()
+    image_ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    image_ds.SOPInstanceUID = "1.2.3.4"
+    image_ds.FrameOfReferenceUID = "1.2.3"
+    rtss = Dataset()
+    rtss.StructureSetROISequence = Sequence()
+    rtss.ROIContourSequence = Sequence()
+    rtss.RTROIObservationsSequence = Sequence()
+    add_new_roi(rtss, "Body", square(0, 1), image_ds, "ORGAN")
+    add_to_roi(rtss, "Body", square(0, 2), image_ds)
+    image_ds.SOPInstanceUID = "1.2.3.45"
+    add_to_roi(rtss, "Body", square(1, 2), image_ds)
+    rtss.file_meta = FileMetaDataset()
+    rtss.file_meta.TransferSyntaxUID = ImplicitVRLittleEndian \
+        if implicit_vr else ExplicitVRLittleEndian
+    rtss.is_little_endian = True
+    rtss.is_implicit_VR = implicit_vr
+    rtss.save_as(tmp_path / "rtss.dcm")
+
+    dataset_rtss = dcmread(tmp_path / "rtss.dcm", force=True)
+    contours = dataset_rtss.ROIContourSequence[0].ContourSequence
+    # The UID is found in the bytes of the sequence, which are left unread
+    assert [read_referenced_sop_instance_uid(contour)
+            for contour in contours] == ["1.2.3.4", "1.2.3.4", "1.2.3.45"]
+    assert all(isinstance(contour.get_item("ContourImageSequence"),
+                          RawDataElement) for contour in contours)
+    # A read sequence is used as it is
+    contours[0].ContourImageSequence[0].ReferencedSOPInstanceUID = "1.5"
+    assert read_referenced_sop_instance_uid(contours[0]) == "1.5"
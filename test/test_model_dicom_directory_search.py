@@ -0,0 +1,288 @@
+import itertools
+import os
+import threading
+
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.fileset import FileSet
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from src.Model.DICOM import DICOMDirectorySearch, DICOMHeaderIndex as \
+    DICOMHeaderIndexModule
+from src.Model.DICOM.DICOMHeaderIndex import DICOMHeaderIndex
+
+
+class DummyProgressCallback:
+    def __init__(self):
+        self.progress = []
+
+    def emit(self, progress):
+        self.progress.append(progress)
+
+
+def write_dicom_file(path, patient_id, study_uid, series_uid,
+                     modality="CT"):
+    """
+    Writes a minimal DICOM file with the tags used to build a
+    DICOMStructure.
+    :return: SOPInstanceUID of the written file.
+    """
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.PatientID = patient_id
+    ds.PatientName = "Test^" + patient_id
+    ds.StudyInstanceUID = study_uid
+    ds.SeriesInstanceUID = series_uid
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    ds.Modality = modality
+    ds.SeriesDescription = "Series " + series_uid[-4:]
+    ds.StudyDate = "20200101"
+    ds.StudyTime = "120000"
+    ds.StudyID = "1"
+    ds.AccessionNumber = ""
+    ds.SeriesNumber = 1
+    ds.InstanceNumber = 1
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.save_as(str(path), write_like_original=False)
+    return ds.SOPInstanceUID
+
+
+@pytest.fixture
+def dicom_directory(tmp_path):
+    """
+    Creates two patients, one with two series, and a few non-DICOM and
+    hidden files.
+    """
+    study_a = generate_uid()
+    series_a1 = generate_uid()
+    series_a2 = generate_uid()
+    study_b = generate_uid()
+    series_b = generate_uid()
+
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b" / "nested").mkdir(parents=True)
+    (tmp_path / ".hidden").mkdir()
+
+    sop_uids = []
+    for i in range(5):
+        sop_uids.append(write_dicom_file(tmp_path / "a" / ("ct%d.dcm" % i),
+                                         "A", study_a, series_a1))
+    for i in range(3):
+        sop_uids.append(write_dicom_file(tmp_path / "a" / ("mr%d.dcm" % i),
+                                         "A", study_a, series_a2, "MR"))
+    for i in range(4):
+        sop_uids.append(write_dicom_file(
+            tmp_path / "b" / "nested" / ("ct%d" % i), "B", study_b, series_b))
+
+    write_dicom_file(tmp_path / ".hidden" / "ct.dcm", "C", study_b, series_b)
+    (tmp_path / "notes.txt").write_text("not a DICOM file")
+    (tmp_path / "b" / "empty").write_bytes(b"")
+
+    return tmp_path, sop_uids
+
+
+def test_is_dicom_file(dicom_directory):
+    path, _ = dicom_directory
+    assert DICOMDirectorySearch.is_dicom_file(path / "a" / "ct0.dcm")
+    assert not DICOMDirectorySearch.is_dicom_file(path / "notes.txt")
+    assert not DICOMDirectorySearch.is_dicom_file(path / "b" / "empty")
+    assert not DICOMDirectorySearch.is_dicom_file(path / "missing")
+
+
+def test_get_dicom_structure(dicom_directory):
+    path, sop_uids = dicom_directory
+    progress_callback = DummyProgressCallback()
+    dicom_structure = DICOMDirectorySearch.get_dicom_structure(
+        path, threading.Event(), progress_callback)
+
+    # Hidden directories are ignored
+    assert set(dicom_structure.patients.keys()) == {"A", "B"}
+
+    patient_a = dicom_structure.get_patient("A")
+    assert len(patient_a.studies) == 1
+    study_a = list(patient_a.studies.values())[0]
+    assert len(study_a.image_series) == 2
+    assert sorted(len(series.images)
+                  for series in study_a.image_series.values()) == [3, 5]
+
+    assert sorted(sop_uids) == sorted(str(image.image_uid)
+                                  for patient in
+                                  dicom_structure.patients.values()
+                                  for study in patient.studies.values()
+                                  for series in study.image_series.values()
+                                  for image in series.images.values())
+
+    # Progress counts every non-hidden file, not just DICOM files
+    assert progress_callback.progress == list(range(1, 15))
+
+
+def test_get_dicom_structure_interrupted(dicom_directory):
+    path, _ = dicom_directory
+    interrupt_flag = threading.Event()
+    interrupt_flag.set()
+    assert DICOMDirectorySearch.get_dicom_structure(
+        path, interrupt_flag, DummyProgressCallback()) is None
+
+
+@pytest.fixture
+def header_index(tmp_path_factory):
+    index = DICOMHeaderIndex()
+    index.set_db_file_path(
+        tmp_path_factory.mktemp("index") / "TestDICOMHeaderIndex.db")
+    return index
+
+
+def test_get_dicom_structure_with_header_index(dicom_directory, header_index,
+                                               monkeypatch):
+    path, sop_uids = dicom_directory
+    first_structure = DICOMDirectorySearch.get_dicom_structure(
+        path, threading.Event(), DummyProgressCallback(),
+        header_index=header_index)
+
+    # Every non-hidden file is indexed, including non-DICOM files
+    entries = header_index.get_entries(path)
+    assert len(entries) == 14
+    assert entries[str(path / "notes.txt")][2] is None
+
+    # A rescan of an unchanged directory reads no files
+    def fail_read(file_path):
+        raise AssertionError("%s should not be read" % file_path)
+
+    monkeypatch.setattr(DICOMDirectorySearch, "read_dicom_header", fail_read)
+    second_structure = DICOMDirectorySearch.get_dicom_structure(
+        path, threading.Event(), DummyProgressCallback(),
+        header_index=header_index)
+    assert sorted(first_structure.get_files()) == \
+        sorted(second_structure.get_files())
+    monkeypatch.undo()
+
+    # Changed and removed files are picked up on the next scan
+    (path / "a" / "ct0.dcm").unlink()
+    write_dicom_file(path / "b" / "new.dcm", "C",
+                     generate_uid(), generate_uid())
+    third_structure = DICOMDirectorySearch.get_dicom_structure(
+        path, threading.Event(), DummyProgressCallback(),
+        header_index=header_index)
+    assert set(third_structure.patients.keys()) == {"A", "B", "C"}
+    assert str(path / "a" / "ct0.dcm") not in header_index.get_entries(path)
+    assert third_structure.get_patient("C").get_files() == \
+        [str(path / "b" / "new.dcm")]
+
+
+def test_get_dicom_structure_from_dicomdir(dicom_directory, tmp_path_factory,
+                                           monkeypatch):
+    path, sop_uids = dicom_directory
+    media_path = tmp_path_factory.mktemp("media")
+
+    # Write the test files as a File-set with a DICOMDIR
+    file_set = FileSet()
+    for file_path, _ in DICOMDirectorySearch.walk_directory(path):
+        if DICOMDirectorySearch.is_dicom_file(file_path):
+            file_set.add(file_path)
+    file_set.write(media_path)
+
+    read_paths = []
+
+    def count_read(file_path):
+        read_paths.append(file_path)
+        return read_dicom_header(file_path)
+
+    read_dicom_header = DICOMDirectorySearch.read_dicom_header
+    monkeypatch.setattr(DICOMDirectorySearch, "read_dicom_header",
+                        count_read)
+    dicom_structure = DICOMDirectorySearch.get_dicom_structure(
+        media_path, threading.Event(), DummyProgressCallback(),
+        use_dicomdir=True)
+
+    # Only the first instance of each of the three series is read
+    assert len(read_paths) == 3
+    assert set(dicom_structure.patients.keys()) == {"A", "B"}
+    assert sorted(sop_uids) == sorted(str(image.image_uid)
+                                      for patient in
+                                      dicom_structure.patients.values()
+                                      for study in patient.studies.values()
+                                      for series in
+                                      study.image_series.values()
+                                      for image in series.images.values())
+    assert all(os.path.isfile(file_path)
+               for file_path in dicom_structure.get_files())
+
+
+def test_get_dicom_structure_from_partial_dicomdir(dicom_directory,
+                                                   tmp_path_factory,
+                                                   header_index):
+    path, sop_uids = dicom_directory
+    media_path = tmp_path_factory.mktemp("media")
+
+    # A DICOMDIR that only lists the files of patient A
+    file_set = FileSet()
+    for file_path, _ in DICOMDirectorySearch.walk_directory(path / "a"):
+        file_set.add(file_path)
+    file_set.write(media_path)
+    (media_path / "later").mkdir()
+    unlisted_uid = write_dicom_file(media_path / "unlisted.dcm", "B",
+                                    generate_uid(), generate_uid())
+    nested_uid = write_dicom_file(media_path / "later" / "ct.dcm", "C",
+                                  generate_uid(), generate_uid())
+
+    # Index the files before the DICOMDIR is used
+    DICOMDirectorySearch.get_dicom_structure(
+        media_path, threading.Event(), DummyProgressCallback(),
+        header_index=header_index)
+    indexed_paths = set(header_index.get_entries(media_path))
+
+    dicom_structure = DICOMDirectorySearch.get_dicom_structure(
+        media_path, threading.Event(), DummyProgressCallback(),
+        header_index=header_index, use_dicomdir=True)
+
+    # Files the DICOMDIR does not list are still found
+    assert set(dicom_structure.patients.keys()) == {"A", "B", "C"}
+    image_uids = [str(image.image_uid)
+                  for patient in dicom_structure.patients.values()
+                  for study in patient.studies.values()
+                  for series in study.image_series.values()
+                  for image in series.images.values()]
+    assert sorted(image_uids) == sorted(sop_uids[:8]
+                                        + [unlisted_uid, nested_uid])
+
+    # Files read through the DICOMDIR keep their index entries
+    assert set(header_index.get_entries(media_path)) == indexed_paths
+
+
+def test_header_index_evicts_least_recently_used(tmp_path, header_index,
+                                                 monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(DICOMHeaderIndexModule.time, "time",
+                        lambda: next(clock))
+    header_index.max_entries = 4
+    roots = [tmp_path / name for name in ("a", "b", "c")]
+    for root in roots[:2]:
+        header_index.update_entries(
+            root, [(str(root / name), 0, 0, None) for name in ("1", "2")],
+            [])
+
+    # Searching the first directory again keeps its files when the third
+    # directory is added
+    assert len(header_index.get_entries(roots[0])) == 2
+    header_index.update_entries(
+        roots[2], [(str(roots[2] / name), 0, 0, None)
+                   for name in ("1", "2")], [])
+
+    assert len(header_index.get_entries(roots[0])) == 2
+    assert len(header_index.get_entries(roots[1])) == 0
+    assert len(header_index.get_entries(roots[2])) == 2
+
+    # The files of the directory being searched are never removed, even
+    # when the directory has more than max_entries files
+    header_index.update_entries(
+        roots[2], [(str(roots[2] / str(name)), 0, 0, None)
+                   for name in range(3, 7)], [])
+    assert len(header_index.get_entries(roots[0])) == 0
+    assert len(header_index.get_entries(roots[2])) == 6
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from dicompylercore import dvhcalc
+from pydicom import dcmread
+
+from src.Model import ImageLoading
+from src.Model.DVHCalculator import DoseGrid, calculate_dvhs
+
+
+@pytest.fixture
+def phantom_datasets(dvh_phantom):
+    rtss_path, rtdose_path = dvh_phantom
+    return dcmread(rtss_path), dcmread(rtdose_path)
+
+
+@pytest.mark.parametrize("dose_limit", [None, 150])
+def test_calculate_dvhs_matches_dvhcalc(phantom_datasets, dose_limit):
+    dataset_rtss, dataset_rtdose = phantom_datasets
+    rois = ImageLoading.get_roi_info(dataset_rtss)
+    dict_thickness = {3: 1.0}
+
+    dict_dvh = calculate_dvhs(dataset_rtss, dataset_rtdose, rois,
+                              dict_thickness, dose_limit)
+
+    assert list(dict_dvh) == list(rois)
+    for roi in rois:
+        expected = dvhcalc.get_dvh(dataset_rtss, dataset_rtdose, roi,
+                                   dose_limit,
+                                   thickness=dict_thickness.get(roi))
+        dvh = dict_dvh[roi]
+        assert dvh.name == expected.name
+        assert dvh.notes == expected.notes
+        assert dvh.dvh_type == expected.dvh_type
+        assert np.array_equal(dvh.bins, expected.bins)
+        assert np.allclose(dvh.counts, expected.counts)
+
+
+def test_dose_grid_resamples_planes_once(phantom_datasets):
+    _, dataset_rtdose = phantom_datasets
+    dose_grid = DoseGrid(dataset_rtdose)
+
+    # Frames are 2 mm apart from 0 mm, in 0.001 Gy units of 100 per frame
+    exact, between, outside = dose_grid.get_planes([4.0, 5.0, 19.0])
+    assert exact[0, 0] == pytest.approx(2 * 100 * 0.1)
+    assert between[0, 0] == pytest.approx(2.5 * 100 * 0.1)
+    assert outside.size == 0
+
+    assert dose_grid.get_planes([5.0])[0] is between
+
+
+def test_dose_grid_shared_between_threads(phantom_datasets, monkeypatch):
+    _, dataset_rtdose = phantom_datasets
+    dose_grid = DoseGrid(dataset_rtdose)
+    resample = dose_grid.resample
+    resampled = []
+
+    def slow_resample(z_positions):
+        resampled.extend(z_positions)
+        time.sleep(0.05)
+        return resample(z_positions)
+
+    monkeypatch.setattr(dose_grid, "resample", slow_resample)
+    threads = [threading.Thread(target=dose_grid.get_planes,
+                                args=([4.0, 5.0],)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Every plane is resampled once, however many threads ask for it
+    assert sorted(resampled) == [4.0, 5.0]
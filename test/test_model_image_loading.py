@@ -0,0 +1,64 @@
+import numpy as np
+import pydicom.filereader
+import pytest
+
+from src.Model import ImageLoading
+
+
+def test_get_datasets_defer_pixels(ct_files, monkeypatch):
+    deferred_reads = []
+    read_deferred_data_element = pydicom.filereader.read_deferred_data_element
+
+    def count_deferred_read(fileobj_type, filename, *args, **kwargs):
+        deferred_reads.append(filename)
+        return read_deferred_data_element(fileobj_type, filename,
+                                          *args, **kwargs)
+
+    monkeypatch.setattr(pydicom.filereader, "read_deferred_data_element",
+                        count_deferred_read)
+
+    read_data_dict, file_names_dict = ImageLoading.get_datasets(
+        ct_files, defer_pixels=True)
+
+    # Slices are sorted on the stack axis, highest z first
+    assert [float(read_data_dict[i].ImagePositionPatient[2])
+            for i in range(5)] == [4, 3, 2, 1, 0]
+
+    # Pixel data has not been read yet
+    assert deferred_reads == []
+
+    # It is read and decoded on first access, for that slice only
+    assert np.all(read_data_dict[0].pixel_array == 4)
+    assert deferred_reads == [file_names_dict[0]]
+
+
+def test_get_pixluts(ct_files):
+    read_data_dict, _ = ImageLoading.get_datasets(ct_files, defer_pixels=True)
+    read_data_dict[4].PixelSpacing = [0.5, 2]
+    read_data_dict[4].ImageOrientationPatient = [-1, 0, 0, 0, -1, 0]
+
+    dict_pixluts = ImageLoading.get_pixluts(read_data_dict)
+
+    # Compare against the transformation matrix of each slice
+    for i in range(5):
+        ds = read_data_dict[i]
+        orientation = ds.ImageOrientationPatient
+        position = ds.ImagePositionPatient
+        matrix_m = np.array([
+            [orientation[0] * ds.PixelSpacing[0],
+             orientation[3] * ds.PixelSpacing[1], 0, position[0]],
+            [orientation[1] * ds.PixelSpacing[0],
+             orientation[4] * ds.PixelSpacing[1], 0, position[1]],
+            [0, 0, 0, 1]], dtype=float)
+        columns = np.array([[c, 0, 0, 1] for c in range(ds.Columns)]).T
+        rows = np.array([[0, r, 0, 1] for r in range(ds.Rows)]).T
+
+        x, y = dict_pixluts[ds.SOPInstanceUID]
+        assert np.allclose(x, (matrix_m @ columns)[0])
+        assert np.allclose(y, (matrix_m @ rows)[1])
+
+    # Slices with the same geometry share a read-only pixlut
+    uids = [read_data_dict[i].SOPInstanceUID for i in range(5)]
+    assert dict_pixluts[uids[0]] is dict_pixluts[uids[3]]
+    assert dict_pixluts[uids[0]] is not dict_pixluts[uids[4]]
+    assert not dict_pixluts[uids[0]][0].flags.writeable
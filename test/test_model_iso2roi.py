@@ -1,9 +1,13 @@
 import os
+import threading
+
+import numpy as np
 import pytest
 
+from src.Model import ISO2ROI as ISO2ROIModule
 from src.Model import ROI
-from src.Model.ISO2ROI import ISO2ROI
-from src.Model.Isodose import get_dose_grid
+from src.Model.ISO2ROI import ISO2ROI, calc_isodose_boundaries
+from src.Model.Isodose import DoseVolume, get_dose_grid
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model import ImageLoading
 
@@ -245,3 +249,48 @@ def test_create_rtss(test_object):
     assert rtss.StudyInstanceUID == test_ds.StudyInstanceUID
     assert rtss.Modality == 'RTSTRUCT'
     assert rtss.SOPClassUID == '1.2.840.10008.5.1.4.1.1.481.3'
+
+
+# Slice positions inside and outside of the phantom dose grid (0 to 18 mm)
+PHANTOM_SLICE_POSITIONS = [-4, 0, 1, 3.5, 6, 9, 12.2, 15, 17.5, 18, 30]
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_calc_isodose_boundaries(dvh_phantom, max_workers, monkeypatch):
+    dataset_rtdose = dcmread(dvh_phantom[1])
+    dose_volume = DoseVolume(dataset_rtdose, PHANTOM_SLICE_POSITIONS)
+    dose_levels = [500, 1250.5, 2000]
+    monkeypatch.setattr(ISO2ROIModule, "ISO2ROI_CHUNK_SIZE", 3)
+    progress = []
+
+    boundaries = calc_isodose_boundaries(
+        dose_volume, dose_levels, threading.Event(), progress.append,
+        max_workers=max_workers)
+
+    # Boundaries are the same as tracing every slice in turn
+    for level, dose_level in enumerate(dose_levels):
+        assert len(boundaries[level]) == len(PHANTOM_SLICE_POSITIONS)
+        for slice_id, z in enumerate(PHANTOM_SLICE_POSITIONS):
+            grid = get_dose_grid(dataset_rtdose, z)
+            expected = measure.find_contours(grid, dose_level) \
+                if grid.size else []
+            contours = boundaries[level][slice_id]
+            assert len(contours) == len(expected)
+            for contour, expected_contour in zip(contours, expected):
+                assert np.array_equal(contour, expected_contour)
+    assert any(boundaries[0])
+
+    # Progress is reported once for every chunk of slices
+    assert progress == [1 / 3, 2 / 3, 1]
+
+
+def test_calc_isodose_boundaries_interrupted(dvh_phantom, monkeypatch):
+    dose_volume = DoseVolume(dcmread(dvh_phantom[1]),
+                             PHANTOM_SLICE_POSITIONS)
+    monkeypatch.setattr(ISO2ROIModule, "ISO2ROI_CHUNK_SIZE", 3)
+    interrupt_flag = threading.Event()
+    interrupt_flag.set()
+
+    for max_workers in (1, 2):
+        assert calc_isodose_boundaries(dose_volume, [500], interrupt_flag,
+                                       max_workers=max_workers) is None
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+from pydicom import dcmread
+from skimage import measure
+
+from src.Model.Isodose import DoseVolume, get_dose_grid, get_dose_volume, \
+    get_isodose_contour_cache
+from src.Model.PatientDictContainer import PatientDictContainer
+
+
+def reference_dose_grid(rtd, z):
+    """
+    Interpolates the dose grid of a single slice position, as in
+    GetDoseGrid of dicompyler-core.
+    """
+    planes = rtd.ImageOrientationPatient[0] \
+        * np.array(rtd.GridFrameOffsetVector) + rtd.ImagePositionPatient[2]
+    if np.amin(np.fabs(planes - z)) < 0.5:
+        return rtd.pixel_array[np.argmin(np.fabs(planes - z))]
+    if (z > np.amin(planes)) and (z < np.amax(planes)):
+        u_min = np.fabs(planes - z)
+        l_min = u_min.copy()
+        ub = np.argmin(u_min)
+        l_min[ub] = np.amax(u_min)
+        lb = np.argmin(l_min)
+        fz = (z - planes[lb]) / (planes[ub] - planes[lb])
+        return fz * rtd.pixel_array[ub] + (1.0 - fz) * rtd.pixel_array[lb]
+    return np.array([])
+
+
+@pytest.fixture
+def dataset_rtdose(dvh_phantom):
+    return dcmread(dvh_phantom[1])
+
+
+# Positions on, near and between the dose planes (0 to 18 mm), and
+# outside the dose grid
+SLICE_POSITIONS = [-3, -0.6, 0, 0.3, 1, 2.5, 7.25, 12, 17.9, 18, 18.7, 25]
+
+
+def test_dose_volume(dataset_rtdose):
+    dose_volume = DoseVolume(dataset_rtdose, SLICE_POSITIONS)
+
+    # Only slices inside the dose grid are stored
+    assert dose_volume.volume.shape == (8, 40, 40)
+    for i, z in enumerate(SLICE_POSITIONS):
+        expected = reference_dose_grid(dataset_rtdose, z)
+        grid = dose_volume.get_grid(i)
+        assert grid.shape == expected.shape
+        assert np.allclose(grid, expected)
+        assert np.array_equal(get_dose_grid(dataset_rtdose, z), grid)
+
+
+def test_dose_volume_float32(dataset_rtdose):
+    dose_volume = DoseVolume(dataset_rtdose, SLICE_POSITIONS)
+    dose_volume_32 = DoseVolume(dataset_rtdose, SLICE_POSITIONS,
+                                dtype=np.float32)
+
+    assert dose_volume_32.volume.dtype == np.float32
+    assert dose_volume_32.volume.nbytes * 2 == dose_volume.volume.nbytes
+    assert np.allclose(dose_volume_32.volume, dose_volume.volume,
+                       rtol=1e-6)
+
+
+@pytest.fixture
+def patient_dict_container(dataset_rtdose):
+    patient_dict_container = PatientDictContainer()
+    patient_dict_container.clear()
+    datasets = {i: dataset_rtdose.copy() for i in range(3)}
+    for i, z in enumerate([2, 3, 30]):
+        datasets[i].ImagePositionPatient = [-20, -20, z]
+    datasets['rtdose'] = dataset_rtdose
+    patient_dict_container.set_initial_values(None, datasets, {})
+    yield patient_dict_container
+    patient_dict_container.clear()
+
+
+def test_get_dose_volume(patient_dict_container, dataset_rtdose):
+    dose_volume = get_dose_volume()
+    assert get_dose_volume() is dose_volume
+    assert np.array_equal(dose_volume.get_grid(1),
+                          reference_dose_grid(dataset_rtdose, 3))
+    assert dose_volume.get_grid(2).size == 0
+
+    # The volume is resampled again when the RT Dose is replaced
+    patient_dict_container.dataset['rtdose'] = dataset_rtdose.copy()
+    assert get_dose_volume() is not dose_volume
+
+
+def test_isodose_contour_cache(patient_dict_container, dataset_rtdose,
+                               monkeypatch):
+    contour_cache = get_isodose_contour_cache()
+    assert get_isodose_contour_cache() is contour_cache
+
+    traced = []
+    find_contours = measure.find_contours
+
+    def count_traced(grid, level):
+        traced.append(level)
+        return find_contours(grid, level)
+
+    monkeypatch.setattr(measure, "find_contours", count_traced)
+
+    # 50% of 100 cGy is 50 cGy, which is 500 units of 0.001 Gy
+    contours = contour_cache.get_contours(1, 50, 100)
+    expected = find_contours(reference_dose_grid(dataset_rtdose, 3),
+                             500)
+    assert len(contours) == len(expected) > 0
+    for contour, expected_contour in zip(contours, expected):
+        assert np.allclose(contour, expected_contour)
+
+    # Cached contours are not traced again
+    assert contour_cache.get_contours(1, 50, 100) is contours
+    assert contour_cache.get_contours(2, 50, 100) == []
+    assert len(traced) == 1
+
+    # Contours are prefetched once
+    missing = contour_cache.get_missing([0, 1, 2], [50, 90], 100)
+    assert sorted(missing) == [(0, 50, 100), (0, 90, 100),
+                               (1, 90, 100), (2, 90, 100)]
+    assert contour_cache.get_missing([0, 1, 2], [50, 90], 100) == []
+    contour_cache.prefetch(missing)
+    assert len(traced) == 4
+    assert contour_cache.pending == set()
+
+    # Unselected isodoses and other prescription doses are dropped
+    contour_cache.get_contours(1, 50, 200)
+    contour_cache.retain([90], 100)
+    assert sorted(contour_cache.contours) == [
+        (0, 90, 100), (1, 90, 100), (2, 90, 100)]
+
+    # A new cache is made for new dose data
+    patient_dict_container.dataset['rtdose'] = dataset_rtdose.copy()
+    assert get_isodose_contour_cache() is not contour_cache
@@ -14,7 +14,9 @@ from pydicom.tag import Tag
 from src.Model import ImageLoading
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.ROI import add_to_roi, calculate_matrix, create_roi, roi_to_geometry, \
-    get_roi_contour_pixel, manipulate_rois, geometry_to_roi, create_initial_rtss_from_ct
+    get_roi_contour_pixel, manipulate_rois, geometry_to_roi, create_initial_rtss_from_ct, \
+    calculate_pixels, calculate_contours_pixels, rasterise_roi, reslice_roi_mask, \
+    mask_outlines, add_new_roi, RTSSBuilder
 
 
 def find_DICOM_files(file_path):
@@ -102,6 +104,109 @@ def test_calculate_matrix():
     assert np.all(array_y == np.array([0, 1, 2, 3]))
 
 
+def loop_calculate_pixels(pixlut, contour, prone=False, feetfirst=False):
+    """
+    Converts contour points one at a time, as calculate_pixels did before
+    it was vectorised.
+    """
+    pixels = []
+    np_x = np.array(pixlut[0])
+    np_y = np.array(pixlut[1])
+    for i in range(0, len(contour), 3):
+        if not feetfirst and not prone:
+            x = np.argmax(np_x > contour[i])
+            y = np.argmax(np_y > contour[i + 1])
+        elif feetfirst and not prone:
+            x = np.argmin(np_x < contour[i])
+            y = np.argmax(np_y > contour[i + 1])
+        else:
+            x = np.argmin(np_x < contour[i])
+            y = np.argmin(np_y < contour[i + 1])
+        pixels.append([x, y])
+    return pixels
+
+
+@pytest.mark.parametrize("prone, feetfirst",
+                         [(False, False), (False, True), (True, False)])
+@pytest.mark.parametrize("direction", [1, -1])
+def test_calculate_pixels(prone, feetfirst, direction):
+    pixlut = (direction * (np.arange(16) - 8.0) * 0.5,
+              direction * (np.arange(12) - 6.0) * 0.75)
+    rng = np.random.default_rng(0)
+    contour = rng.uniform(-6, 6, size=(200, 3))
+    # Include points exactly on and outside the pixel positions
+    contour[:4, :2] = [[0, 0], [-4, -4.5], [3.5, 3.75], [10, -10]]
+    contour = list(contour.ravel())
+
+    assert calculate_pixels(pixlut, contour, prone, feetfirst) == \
+        loop_calculate_pixels(pixlut, contour, prone, feetfirst)
+
+    contours = [contour[:30], contour[30:33], contour[33:]]
+    assert [pixels.tolist() for pixels in calculate_contours_pixels(
+        pixlut, contours, prone, feetfirst)] == \
+        [loop_calculate_pixels(pixlut, c, prone, feetfirst)
+         for c in contours]
+
+
+def test_reslice_roi_mask():
+    # A square ROI on slices 1 to 3, with a hole on slice 2
+    square = np.array([[2, 2], [7, 2], [7, 7], [2, 7]])
+    hole = np.array([[4, 4], [5, 4], [5, 5], [4, 5]])
+    roi_contours = {"uid1": [square], "uid2": [square, hole],
+                    "uid3": [square]}
+    slice_ids = {"uid0": 0, "uid1": 1, "uid2": 2, "uid3": 3, "uid4": 4}
+
+    mask, offset = rasterise_roi(roi_contours, slice_ids, (5, 10, 10))
+
+    # Only the bounding box of the ROI is rasterised
+    assert mask.shape == (3, 6, 6) and offset == (1, 2, 2)
+    assert mask[0].all() and mask[2].all()
+    assert not mask[1, 2:4, 2:4].any() and mask[1].sum() == 32
+
+    coronal, sagittal = reslice_roi_mask(mask, offset)
+
+    assert sorted(coronal) == list(range(2, 8))
+    assert sorted(sagittal) == list(range(2, 8))
+
+    # Outside the hole, each coronal slice is one rectangle spanning
+    # columns 2 to 7 and slices 1 to 3, traced along the pixel edges
+    outline = np.array(coronal[2][0])
+    assert len(coronal[2]) == 1
+    assert outline[:, 0].min() == 2 and outline[:, 0].max() == 8
+    assert outline[:, 1].min() == 1 and outline[:, 1].max() == 4
+
+    # Through the hole, the coronal slice has an outline and a hole, on
+    # the edges of the pixels of the hole
+    assert len(coronal[4]) == 2
+    hole_outline = np.array(min(coronal[4], key=len))
+    assert set(hole_outline[:, 0]) == {4, 5, 6}
+    assert set(hole_outline[:, 1]) == {2, 3}
+    assert all(a != b for a, b in zip(coronal[4][0], coronal[4][0][1:]))
+
+
+def test_mask_outlines_staircase():
+    # A diagonal edge is traced as a regular staircase along the pixel
+    # edges, whichever pixels it passes through
+    mask = np.zeros((6, 8), dtype=bool)
+    for i in range(6):
+        mask[i, :i + 1] = True
+
+    outline = set(map(tuple, mask_outlines(mask, (3, 2))[0]))
+
+    assert {(i + 3, i + 2) for i in range(1, 6)} <= outline
+    assert {(i + 4, i + 2) for i in range(1, 5)} <= outline
+
+
+def test_rasterise_roi_clipped():
+    triangle = np.array([[0, 0], [6, 0], [0, 6]])
+
+    # Contours outside the volume are clipped to it
+    mask, offset = rasterise_roi({"uid0": [triangle - 3]}, {"uid0": 0},
+                                 (1, 20, 20))
+    assert offset == (0, 0, 0) and mask.shape == (1, 4, 4)
+    assert rasterise_roi({}, {"uid0": 0}, (1, 20, 20))[0].size == 0
+
+
 def test_add_to_roi():
     rt_ss = dataset.Dataset()
 
@@ -184,6 +289,71 @@ def test_create_roi():
     assert (rt_ss.RTROIObservationsSequence[0].RTROIInterpretedType == "ORGAN")
 
 
+def make_builder_rtss():
+    rt_ss = dataset.Dataset()
+    rt_ss.StructureSetROISequence = [dataset.Dataset()]
+    rt_ss.StructureSetROISequence[0].ReferencedFrameOfReferenceUID = "1.2.3"
+    rt_ss.StructureSetROISequence[0].ROINumber = 4
+    rt_ss.StructureSetROISequence[0].ROIName = "Body"
+    rt_ss.ROIContourSequence = [dataset.Dataset()]
+    rt_ss.ROIContourSequence[0].ReferencedROINumber = 4
+    rt_ss.ROIContourSequence[0].ContourSequence = [dataset.Dataset()]
+    rt_ss.RTROIObservationsSequence = []
+    return rt_ss
+
+
+def test_rtss_builder():
+    image_ds = dataset.Dataset()
+    image_ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    image_ds.SOPInstanceUID = "1.2.3.4.5.6.7.8.9"
+    open_triangle = [0, 0, 0, 0, 1, 0, 1, 0, 0]
+    closed_triangle = [0, 0, 0, 0, 1, 0, 1, 0, 0, 0, 0, 0]
+    contours = [("Isodose 50", open_triangle),
+                ("Body", closed_triangle),
+                ("Isodose 50", closed_triangle),
+                ("Isodose 80", open_triangle)]
+
+    # Add the contours one by one, as create_roi(..) does
+    expected = make_builder_rtss()
+    names = {"Body"}
+    for roi_name, coords in contours:
+        if roi_name in names:
+            expected = add_to_roi(expected, roi_name, coords, image_ds)
+        else:
+            expected = add_new_roi(expected, roi_name, coords, image_ds,
+                                   "DOSE_REGION")
+            names.add(roi_name)
+
+    rtss_builder = RTSSBuilder(make_builder_rtss())
+    for roi_name, coords in contours:
+        rtss_builder.add_contour(roi_name, coords, image_ds, "DOSE_REGION")
+    rtss = rtss_builder.build()
+
+    def describe(rt_ss):
+        rois = [(roi.ROINumber, roi.ROIName,
+                 roi.ReferencedFrameOfReferenceUID)
+                for roi in rt_ss.StructureSetROISequence]
+        observations = [(observation.ReferencedROINumber,
+                         observation.RTROIInterpretedType)
+                        for observation in rt_ss.RTROIObservationsSequence]
+        contours = [
+            (roi_contour.ReferencedROINumber,
+             [(contour.get("ContourNumber"),
+               contour.get("ContourGeometricType"),
+               contour.get("NumberOfContourPoints"),
+               list(contour.get("ContourData", [])))
+              for contour in roi_contour.ContourSequence])
+            for roi_contour in rt_ss.ROIContourSequence]
+        return rois, observations, contours
+
+    assert describe(rtss) == describe(expected)
+    assert [roi.ROINumber for roi in rtss.StructureSetROISequence] \
+        == [4, 5, 6]
+    assert rtss.ROIContourSequence[1].ContourSequence[1] \
+        .ContourImageSequence[0].ReferencedSOPInstanceUID \
+        == image_ds.SOPInstanceUID
+
+
 def test_roi_to_geometry(test_object):
     roi_names = [roi['name']
                  for roi in test_object.
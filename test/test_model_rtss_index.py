@@ -0,0 +1,107 @@
+import copy
+
+import pytest
+from pydicom import Dataset, Sequence
+
+from src.Model import ImageLoading
+from src.Model.ROI import add_new_roi, add_to_roi, delete_roi, rename_roi, \
+    merge_rtss
+from src.Model.RTSSIndex import RTSSIndex, get_rtss_index
+
+
+def make_image(sop_instance_uid):
+    image_ds = Dataset()
+    image_ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    image_ds.SOPInstanceUID = sop_instance_uid
+    image_ds.FrameOfReferenceUID = "1.2.3"
+    return image_ds
+
+
+def triangle(z):
+    return [0, 0, z, 0, 1, z, 1, 0, z]
+
+
+@pytest.fixture
+def rtss():
+    rtss = Dataset()
+    rtss.StructureSetROISequence = Sequence()
+    rtss.ROIContourSequence = Sequence()
+    rtss.RTROIObservationsSequence = Sequence()
+    for name in ("Body", "PTV", "Cord", "Lung"):
+        add_new_roi(rtss, name, triangle(0), make_image("1.1"), "ORGAN")
+        add_to_roi(rtss, name, triangle(1), make_image("1.2"))
+    return rtss
+
+
+def assert_index_is_current(rtss):
+    """
+    The index kept through the edits agrees with a new index of the RTSS.
+    """
+    rtss_index = get_rtss_index(rtss)
+    new_index = RTSSIndex(copy.deepcopy(rtss))
+    assert rtss_index.roi_numbers == new_index.roi_numbers
+    assert rtss_index.indices == new_index.indices
+    assert rtss_index.get_raw_contour_data() \
+        == new_index.get_raw_contour_data()
+
+
+def test_rtss_index_edits(rtss):
+    raw_contour, num_points = ImageLoading.get_raw_contour_data(rtss)
+    assert list(raw_contour) == ["Body", "PTV", "Cord", "Lung"]
+    assert list(raw_contour["PTV"]) == ["1.1", "1.2"]
+    assert num_points["PTV"] == 6
+
+    add_to_roi(rtss, "PTV", triangle(2), make_image("1.2"))
+    assert rtss.ROIContourSequence[1].ContourSequence[2].ContourNumber == 3
+    assert_index_is_current(rtss)
+
+    delete_roi(rtss, "PTV")
+    assert [item.ROINumber for item in rtss.StructureSetROISequence] \
+        == [1, 3, 4]
+    assert [item.ReferencedROINumber
+            for item in rtss.RTROIObservationsSequence] == [1, 3, 4]
+    assert_index_is_current(rtss)
+
+    rename_roi(rtss, 3, "Spinal Cord")
+    add_to_roi(rtss, "Spinal Cord", triangle(3), make_image("1.3"))
+    add_new_roi(rtss, "PTV", triangle(4), make_image("1.4"), "PTV")
+    assert ImageLoading.get_roi_info(rtss)[5]['name'] == "PTV"
+    assert_index_is_current(rtss)
+
+    raw_contour, num_points = ImageLoading.get_raw_contour_data(rtss)
+    assert list(raw_contour) == ["Body", "Spinal Cord", "Lung", "PTV"]
+    assert list(raw_contour["Spinal Cord"]) == ["1.1", "1.2", "1.3"]
+    assert num_points["PTV"] == 3
+
+
+def test_rtss_index_detects_direct_edits(rtss):
+    rtss_index = get_rtss_index(rtss)
+    rtss_index.get_raw_contour_data()
+
+    # Contours and ROIs added without the index
+    contour = copy.deepcopy(rtss.ROIContourSequence[0].ContourSequence[0])
+    rtss.ROIContourSequence[0].ContourSequence.append(contour)
+    del rtss.StructureSetROISequence[1]
+    rtss.StructureSetROISequence[0].ROIName = "External"
+
+    raw_contour, num_points = ImageLoading.get_raw_contour_data(rtss)
+    assert list(raw_contour) == ["External", "Cord", "Lung"]
+    assert len(raw_contour["External"]["1.1"]) == 2
+    assert get_rtss_index(rtss).get_roi_number("Body") is None
+    assert get_rtss_index(rtss).get_roi_number("External") == 1
+
+
+def test_merge_rtss_index(rtss):
+    new_rtss = Dataset()
+    new_rtss.StructureSetROISequence = Sequence()
+    new_rtss.ROIContourSequence = Sequence()
+    new_rtss.RTROIObservationsSequence = Sequence()
+    add_new_roi(new_rtss, "PTV", triangle(5), make_image("1.5"), "PTV")
+
+    merged_rtss = merge_rtss(rtss, new_rtss, ["PTV"])
+
+    raw_contour, _ = ImageLoading.get_raw_contour_data(merged_rtss)
+    assert list(raw_contour) == ["Body", "Cord", "Lung", "PTV"]
+    assert list(raw_contour["PTV"]) == ["1.5"]
+    assert get_rtss_index(merged_rtss).get_roi_number("PTV") == 4
+    assert_index_is_current(merged_rtss)
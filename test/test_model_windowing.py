@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from src.Model.CalculateImages import get_pixmaps
+from src.Model.PatientDictContainer import PatientDictContainer
+from src.Model.Windowing import windowing_model
+
+
+@pytest.fixture
+def patient_dict_container(qapp):
+    volume = np.arange(6 * 8 * 8, dtype=np.int16).reshape(6, 8, 8)
+    aspect = {"axial": 1, "coronal": 1, "sagittal": 1}
+    pixmaps_axial, pixmaps_coronal, pixmaps_sagittal = \
+        get_pixmaps(volume, 400, 800, aspect)
+
+    patient_dict_container = PatientDictContainer()
+    patient_dict_container.clear()
+    patient_dict_container.set_initial_values(
+        None, {}, {},
+        dict_windowing={"Normal": [400, 800], "Lung": [1600, -300]},
+        pixel_values=volume,
+        pixmap_aspect=aspect,
+        pixmaps_axial=pixmaps_axial,
+        pixmaps_coronal=pixmaps_coronal,
+        pixmaps_sagittal=pixmaps_sagittal,
+        window=400,
+        level=800)
+    yield patient_dict_container
+    patient_dict_container.clear()
+
+
+def test_windowing_model_renders_lazily(patient_dict_container):
+    old_axial = patient_dict_container.get("pixmaps_axial")
+    old_axial[3]
+
+    windowing_model("Lung", [True, False, False, False])
+
+    assert patient_dict_container.get("window") == 1600
+    assert patient_dict_container.get("level") == -300
+
+    # Pixmaps are replaced without rendering any slice
+    for view in ("axial", "coronal", "sagittal"):
+        pixmaps = patient_dict_container.get("pixmaps_" + view)
+        assert (pixmaps.window, pixmaps.level) == (1600, -300)
+        assert pixmaps.cached_slices() == []
+
+    new_axial = patient_dict_container.get("pixmaps_axial")
+    assert new_axial != old_axial
+    assert len(new_axial) == len(old_axial)
+    assert new_axial[3].toImage() != old_axial[3].toImage()
@@ -0,0 +1,84 @@
+import os
+import time
+
+import numpy as np
+import pytest
+from PySide6.QtGui import QPixmap
+from pydicom import Dataset
+
+from src.View.mainpage.DrawROIWindow.Drawing import Drawing
+
+
+def make_drawing(pixel_array, min_pixel, max_pixel, target_pixel_coords):
+    """Function to set up a Drawing scene of a slice, without a window."""
+    dataset = Dataset()
+    dataset.Rows, dataset.Columns = pixel_array.shape
+    dataset._pixel_array = pixel_array
+    drawing = Drawing(QPixmap(*pixel_array.shape), pixel_array, min_pixel,
+                      max_pixel, dataset, object(), False, 0, 5, False, 0.5,
+                      0, target_pixel_coords=target_pixel_coords)
+    drawing.pixel_array = pixel_array
+    return drawing
+
+
+def bfs_region(drawing, source):
+    """The breadth first search the fill tool used, as a reference."""
+    target_pixel_coords = set(drawing.target_pixel_coords)
+    region = set()
+    outlines = set()
+    queue = [source]
+    while len(queue) > 0:
+        current = queue.pop(0)
+        for x_neighbour in range(-1, 2):
+            for y_neighbour in range(-1, 2):
+                element = (current[0] + x_neighbour,
+                           current[1] + y_neighbour)
+                if drawing.check_roi_validity(element):
+                    if element not in target_pixel_coords:
+                        queue.append(element)
+                        target_pixel_coords.add(element)
+                        region.add(element)
+                else:
+                    outlines.add(element)
+    return region, outlines
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_grow_region_matches_bfs(qtbot, seed):
+    rng = np.random.default_rng(seed)
+    pixel_array = rng.integers(0, 100, (64, 64))
+    targeted = {tuple(coords) for coords in rng.integers(0, 64, (50, 2))}
+    drawing = make_drawing(pixel_array, 20, 80, targeted)
+    drawing.min_bounds_x, drawing.min_bounds_y = 3, 0
+    drawing.max_bounds_x, drawing.max_bounds_y = 60.5, 64
+
+    # Sources inside and outside the bounds, on valid and invalid pixels
+    for source in ([30, 30], [0, 10], [63, 63], [10, 2], [2, 40]):
+        assert drawing.grow_region(source) == bfs_region(drawing, source)
+
+
+def make_liver_drawing():
+    """A liver sized region, of most of a 512 x 512 slice."""
+    y, x = np.mgrid[0:512, 0:512]
+    pixel_array = np.where((x - 256) ** 2 + (y - 256) ** 2 < 120 ** 2,
+                           50, 0)
+    return make_drawing(pixel_array, 10, 90, set())
+
+
+def test_grow_region_large_region(qtbot):
+    drawing = make_liver_drawing()
+    assert drawing.grow_region([256, 256]) \
+        == bfs_region(drawing, [256, 256])
+
+
+@pytest.mark.skipif(not os.environ.get("ONKODICOM_BENCHMARK"),
+                    reason="set ONKODICOM_BENCHMARK to run benchmarks")
+def test_grow_region_benchmark(qtbot, record_property):
+    drawing = make_liver_drawing()
+
+    start = time.perf_counter()
+    bfs_region(drawing, [256, 256])
+    record_property("bfs_time", time.perf_counter() - start)
+    start = time.perf_counter()
+    drawing.grow_region([256, 256])
+    record_property("grow_region_time", time.perf_counter() - start)
@@ -0,0 +1,167 @@
+import threading
+
+import numpy as np
+import pytest
+from PySide6 import QtCore
+
+from src.Model import ImageLoading
+from src.Model.CalculateImages import convert_raw_data
+from src.Model.PatientDictContainer import PatientDictContainer
+from src.View.ImageLoader import ImageLoader
+
+
+class ProgressRecorder:
+    """
+    Records the progress updates of loading.
+    """
+
+    def __init__(self):
+        self.updates = []
+
+    def emit(self, progress_update):
+        self.updates.append(progress_update)
+
+
+class ParentWindow(QtCore.QObject):
+    """
+    Records what the image loader sends to its progress window.
+    """
+    signal_stage_loaded = QtCore.Signal(dict)
+
+    def __init__(self):
+        super().__init__()
+        self.errors = []
+        self.stages = []
+        self.signal_stage_loaded.connect(self.stages.append)
+
+    def on_error(self, err):
+        self.errors.append(err)
+
+
+@pytest.fixture
+def patient_dict_container():
+    patient_dict_container = PatientDictContainer()
+    yield patient_dict_container
+    patient_dict_container.clear()
+
+
+def test_load_streams_stages(qtbot, ct_files, dvh_phantom,
+                             patient_dict_container, monkeypatch):
+    # The volume is not decoded until loading has returned
+    release = threading.Event()
+
+    def wait_convert_raw_data(*args):
+        release.wait()
+        return convert_raw_data(*args)
+
+    monkeypatch.setattr("src.View.ImageLoader.convert_raw_data",
+                        wait_convert_raw_data)
+    progress = ProgressRecorder()
+    parent_window = ParentWindow()
+
+    image_loader = ImageLoader(ct_files + list(dvh_phantom), None,
+                               parent_window)
+    assert image_loader.load(threading.Event(), progress)
+    assert [percent for _, percent in progress.updates] \
+        == sorted(percent for _, percent in progress.updates)
+    assert list(patient_dict_container.get("rois")) == [1, 2, 3, 4, 5, 6]
+
+    # Only the first slice is decoded before loading returns
+    read_data_dict, _ = ImageLoading.get_datasets(ct_files)
+    expected = convert_raw_data(read_data_dict, False, True)
+    preview = patient_dict_container.get("pixel_values")
+    assert preview.shape == expected.shape
+    assert np.array_equal(preview[0], expected[0])
+    assert not preview[1:].any()
+
+    # The other stages are added to the container on the GUI thread as
+    # they finish
+    release.set()
+    qtbot.waitUntil(
+        lambda: not patient_dict_container.get("loading_stages"))
+    assert np.array_equal(patient_dict_container.get("pixel_values"),
+                          expected)
+    dataset = patient_dict_container.dataset
+    raw_contour, num_points = ImageLoading.get_raw_contour_data(
+        dataset['rtss'])
+    assert patient_dict_container.get("raw_contour") == raw_contour
+    assert patient_dict_container.get("num_points") == num_points
+    assert patient_dict_container.get("pixluts").keys() \
+        == ImageLoading.get_pixluts(dataset).keys()
+    assert sorted(key for stage in parent_window.stages for key in stage) \
+        == ["num_points", "pixel_values", "pixluts", "raw_contour"]
+    assert not parent_window.errors
+
+
+def test_stage_superseded_by_edit(qtbot, ct_files, dvh_phantom,
+                                  patient_dict_container, monkeypatch):
+    # The contours are not parsed until the ROIs have been edited
+    release = threading.Event()
+    get_raw_contour_data = ImageLoading.get_raw_contour_data
+
+    def wait_get_raw_contour_data(dataset_rtss):
+        release.wait()
+        return get_raw_contour_data(dataset_rtss)
+
+    monkeypatch.setattr(ImageLoading, "get_raw_contour_data",
+                        wait_get_raw_contour_data)
+    parent_window = ParentWindow()
+
+    image_loader = ImageLoader(ct_files + list(dvh_phantom), None,
+                               parent_window)
+    assert image_loader.load(threading.Event(), ProgressRecorder())
+    assert patient_dict_container.is_loading("raw_contour")
+
+    # The structure tab sets the contours of the edited RTSS
+    patient_dict_container.set("raw_contour", {})
+    patient_dict_container.set("num_points", {})
+    release.set()
+    qtbot.waitUntil(
+        lambda: not patient_dict_container.get("loading_stages"))
+
+    # The contours parsed by the loader are out of date
+    assert patient_dict_container.get("raw_contour") == {}
+    assert patient_dict_container.get("num_points") == {}
+    assert not patient_dict_container.is_loading("raw_contour",
+                                                 "num_points")
+    assert sorted(key for stage in parent_window.stages for key in stage) \
+        == ["pixel_values", "pixluts"]
+
+
+def test_load_stage_error(qtbot, ct_files, dvh_phantom,
+                          patient_dict_container, monkeypatch):
+    def fail(dataset_rtss):
+        raise ValueError("Cannot parse contours")
+
+    monkeypatch.setattr(ImageLoading, "get_raw_contour_data", fail)
+    parent_window = ParentWindow()
+
+    image_loader = ImageLoader(ct_files + list(dvh_phantom), None,
+                               parent_window)
+    assert image_loader.load(threading.Event(), ProgressRecorder())
+
+    # The error of the stage is sent to the progress window
+    qtbot.waitUntil(lambda: len(parent_window.errors) > 0)
+    assert parent_window.errors[0][0] is ValueError
+    assert not patient_dict_container.has_attribute("raw_contour")
+
+
+def test_stage_of_previous_patient_ignored(qtbot, ct_files, dvh_phantom,
+                                           patient_dict_container):
+    image_loader = ImageLoader(ct_files + list(dvh_phantom), None, None)
+    assert image_loader.load(threading.Event(), ProgressRecorder())
+    pixel_values = patient_dict_container.get("pixel_values")
+
+    # Another patient is opened before the stage finishes
+    patient_dict_container.set_initial_values(None, {}, {})
+    image_loader.stage_loaded({"pixel_values": None})
+    assert not patient_dict_container.has_attribute("pixel_values")
+    assert pixel_values is not None
+
+
+def test_load_interrupted(ct_files, patient_dict_container):
+    interrupt_flag = threading.Event()
+    interrupt_flag.set()
+
+    image_loader = ImageLoader(ct_files, None, None)
+    assert not image_loader.load(interrupt_flag, ProgressRecorder())
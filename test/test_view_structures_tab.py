@@ -165,6 +165,45 @@ def test_structure_tab_uncheck_checkboxes(test_object):
         assert name not in selected_roi_names
 
 
+def test_structure_tab_recheck_uses_polygon_cache(test_object,
+                                                  monkeypatch):
+    """Test that checking an ROI again reuses the polygons calculated the
+    first time it was checked, and that changing its contours
+    recalculates them.
+
+    :param test_object: test_object function, for accessing the shared
+    TestStructureTab object.
+    """
+    structures_tab = test_object.main_window.structures_tab
+    patient_dict_container = PatientDictContainer()
+    roi = next(iter(test_object.rois))
+    name = test_object.rois[roi]["name"]
+
+    structures_tab.structure_checked(True, roi)
+    polygons_axial = patient_dict_container.get("dict_polygons_axial")[name]
+    structures_tab.structure_checked(False, roi)
+
+    # Rechecking the ROI must not recalculate its polygons
+    def fail_calc_roi_polygons(roi_name):
+        raise AssertionError("Polygons were recalculated")
+
+    monkeypatch.setattr(structures_tab, "calc_roi_polygons",
+                        fail_calc_roi_polygons)
+    structures_tab.structure_checked(True, roi)
+    assert patient_dict_container.get("dict_polygons_axial")[name] \
+        is polygons_axial
+    structures_tab.structure_checked(False, roi)
+    monkeypatch.undo()
+
+    # Replacing the ROI's contours invalidates its cached polygons
+    raw_contour = patient_dict_container.get("raw_contour")
+    raw_contour[name] = dict(raw_contour[name])
+    structures_tab.structure_checked(True, roi)
+    assert patient_dict_container.get("dict_polygons_axial")[name] \
+        is not polygons_axial
+    structures_tab.structure_checked(False, roi)
+
+
 def test_merge_rtss(qtbot, test_object):
     """Test merging rtss. This function creates a new rtss, then merges
     the new rtss with the old rtss and asserts that duplicated ROIs